@@ -1,12 +1,23 @@
 from typing import Generator
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 
+from app.api.v1.routes.routing import osrm_fanout_stats
 from app.db.models.event import Event
 from app.db.models.plan import Plan
-from app.db.session import SessionLocal
+from app.db.session import SessionLocal, query_count_stats
+from app.services.contraction import ch_stats
+from app.services.delay_client import prediction_cache_stats
+from app.services.delay_model import delay_model_stats, embedded_enabled, load_model
+from app.services.graph_cache import graph_cache_stats
+from app.services.graph_routing import graph_search_stats
+from app.services.http_clients import http_client_stats
+from app.services.osrm_client import route_cache_stats, table_stats
+from app.services.location_index import location_index_stats
+from app.services.traffic_overlay import traffic_overlay_stats
+from app.services.weather_cache import weather_cache_stats
 from app.services.run_evaluation import results
 
 router = APIRouter()
@@ -42,3 +53,32 @@ def get_evaluation_metrics(db: Session = Depends(get_db)):
         },
         "scenario_results": results,
     }
+
+
+@router.get("/metrics/runtime")
+def get_runtime_metrics():
+    """In-process cache and engine counters for capacity tuning."""
+    return {
+        "graph_cache": graph_cache_stats(),
+        "graph_search": graph_search_stats(),
+        "contraction_hierarchies": ch_stats(),
+        "location_index": location_index_stats(),
+        "db_queries_per_request": query_count_stats(),
+        "osrm_fanout": osrm_fanout_stats(),
+        "http_clients": http_client_stats(),
+        "osrm_route_cache": route_cache_stats(),
+        "osrm_table": table_stats(),
+        "delay_model": delay_model_stats(),
+        "delay_prediction_cache": prediction_cache_stats(),
+        "weather_cache": weather_cache_stats(),
+        "traffic_overlay": traffic_overlay_stats(),
+    }
+
+
+@router.post("/metrics/delay-model/reload")
+def reload_delay_model():
+    """Hot-reload hook: re-read the embedded delay model file without a restart."""
+    if not embedded_enabled():
+        raise HTTPException(status_code=409, detail="Delay model is not embedded (ML_DELAY_MODE != embedded)")
+    load_model(force=True)
+    return delay_model_stats()
@@ -8,11 +8,14 @@ from sqlalchemy.orm import Session
 
 from app.db.session import SessionLocal
 from app.db.models.location import Location as LocationModel
+from app.services.location_index import nearest_locations, register_location
 from app.schemas.network import (
     LocationIn,
     LocationOut,
     LocationListResponse,
     LocationType,
+    NearestLocationOut,
+    NearestLocationResponse,
 )
 
 router = APIRouter(tags=["network"], prefix="/network")
@@ -114,6 +117,33 @@ def list_locations(
     return LocationListResponse(data=data, total=len(data))
 
 
+# ---------- GET /network/locations/nearest ----------
+@router.get("/locations/nearest", response_model=NearestLocationResponse)
+def list_nearest_locations(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    k: int = Query(1, ge=1, le=100, description="Number of neighbours to return"),
+    type: Optional[List[LocationType]] = Query(None, alias="type", description="Restrict to these location types"),
+    db: Session = Depends(get_db),
+):
+    """
+    k nearest locations by great-circle distance, served from the in-memory spatial index.
+    """
+    nearest = nearest_locations(db, lat, lon, k=k, types=type)
+    data = [
+        NearestLocationOut(
+            id=p.id,
+            name=p.name,
+            type=p.type,  # Literal enforced by schema
+            lat=p.lat,
+            lon=p.lon,
+            distance_km=round(distance_km, 3),
+        )
+        for p, distance_km in nearest
+    ]
+    return NearestLocationResponse(data=data, total=len(data))
+
+
 # ---------- POST /network/locations ----------
 @router.post("/locations", response_model=LocationOut, status_code=201)
 def create_location(
@@ -134,4 +164,5 @@ def create_location(
     db.add(m)
     db.commit()
     db.refresh(m)
+    register_location(m)
     return _to_location_out(m)
@@ -16,7 +16,7 @@ from app.db.models.shipment import Shipment as ShipmentModel
 from app.schemas.plans import PlanCreate, PlanOut, PlanSummary, PlanLeg
 from app.services.delay_client import predict_delay
 from app.services.traffic_client import get_area_traffic
-from app.services.weather_client import fetch_current_weather
+from app.services.weather_cache import get_weather_many
 
 router = APIRouter(tags=["plans"], prefix="/plans")
 
@@ -90,9 +90,13 @@ async def _get_environment_features(db: Session, shipments: List[ShipmentModel])
     if not shipments:
         return defaults
 
-    anchor_location = db.get(LocationModel, shipments[0].origin_id)
-    if anchor_location is None:
-        anchor_location = db.get(LocationModel, shipments[0].destination_id)
+    # the first shipment's origin, else its destination (both loaded in one query)
+    candidate_ids = [loc_id for loc_id in (shipments[0].origin_id, shipments[0].destination_id) if loc_id is not None]
+    locations = {
+        loc.id: loc
+        for loc in db.execute(select(LocationModel).where(LocationModel.id.in_(candidate_ids))).scalars()
+    }
+    anchor_location = next((locations[loc_id] for loc_id in candidate_ids if loc_id in locations), None)
     if anchor_location is None:
         return defaults
 
@@ -102,12 +106,14 @@ async def _get_environment_features(db: Session, shipments: List[ShipmentModel])
         "wind_speed_mps": defaults["wind_speed_mps"],
     }
     try:
-        snapshot = await fetch_current_weather(float(anchor_location.lat), float(anchor_location.lon))
-        weather = {
-            "temperature_c": snapshot.temperature_c if snapshot.temperature_c is not None else defaults["temperature_c"],
-            "precipitation_mm": snapshot.precipitation_mm if snapshot.precipitation_mm is not None else defaults["precipitation_mm"],
-            "wind_speed_mps": snapshot.wind_speed_mps if snapshot.wind_speed_mps is not None else defaults["wind_speed_mps"],
-        }
+        # served from the weather cache; only an uncached cell goes upstream
+        snapshot = (await get_weather_many([(float(anchor_location.lat), float(anchor_location.lon))]))[0]
+        if snapshot is not None:
+            weather = {
+                "temperature_c": snapshot.temperature_c if snapshot.temperature_c is not None else defaults["temperature_c"],
+                "precipitation_mm": snapshot.precipitation_mm if snapshot.precipitation_mm is not None else defaults["precipitation_mm"],
+                "wind_speed_mps": snapshot.wind_speed_mps if snapshot.wind_speed_mps is not None else defaults["wind_speed_mps"],
+            }
     except Exception:
         pass
 
@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+import asyncio
+import os
+from dataclasses import dataclass
 from math import radians, sin, cos, asin, sqrt
 from typing import Annotated, Generator, Literal, Optional
 
@@ -8,12 +11,27 @@ from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
 from app.db.session import SessionLocal
-from app.services.graph_routing import compute_graph_route, resolve_location_by_id, resolve_nearest_location
+from app.services.graph_routing import (
+    compute_graph_route,
+    resolve_location_by_id,
+    resolve_locations_by_ids,
+    resolve_nearest_location,
+)
 from app.services.mode_params import MODE_PARAMS
 from app.services.osrm_client import OSRMCoor, route as osrm_route
 
 router = APIRouter(tags=["routing"], prefix="/routing")
 
+# Per-request OSRM fan-out: at most this many calls in flight, all sharing one deadline.
+OSRM_FANOUT_CONCURRENCY = int(os.getenv("OSRM_FANOUT_CONCURRENCY", "8"))
+OSRM_REQUEST_DEADLINE_S = float(os.getenv("OSRM_REQUEST_DEADLINE_S", "5"))
+
+_fanout_stats = {"calls": 0, "deadline_misses": 0, "errors": 0}
+
+
+def osrm_fanout_stats() -> dict[str, int]:
+    return dict(_fanout_stats)
+
 
 def get_db() -> Generator[Session, None, None]:
     db = SessionLocal()
@@ -24,6 +42,7 @@ def get_db() -> Generator[Session, None, None]:
 
 
 Mode = Literal["road", "rail", "sea", "air", "transfer"]
+SearchEngine = Literal["dijkstra", "astar", "bidirectional", "ch"]
 
 
 class Coord(BaseModel):
@@ -50,6 +69,7 @@ class RoutingRequest(BaseModel):
     modes: list[Mode] = ["road"]
     objective: Objective = Objective()
     constraints: Optional[Constraints] = None
+    engine: Optional[SearchEngine] = None
 
 
 class RouteLegOut(BaseModel):
@@ -109,11 +129,34 @@ def haversine_km(a: Coord, b: Coord) -> float:
     return 2 * earth_radius_km * asin(sqrt(h))
 
 
-async def _compute_road_metrics(origin: Coord, dest: Coord) -> tuple[float, float, Optional[str], str]:
+@dataclass
+class _OsrmBudget:
+    """Concurrency cap and absolute deadline shared by every OSRM call of one request."""
+    semaphore: asyncio.Semaphore
+    deadline: float
+
+    @classmethod
+    def start(cls) -> "_OsrmBudget":
+        loop = asyncio.get_running_loop()
+        return cls(asyncio.Semaphore(OSRM_FANOUT_CONCURRENCY), loop.time() + OSRM_REQUEST_DEADLINE_S)
+
+    def remaining(self) -> float:
+        return self.deadline - asyncio.get_running_loop().time()
+
+
+async def _compute_road_metrics(
+    origin: Coord,
+    dest: Coord,
+    budget: Optional[_OsrmBudget] = None,
+) -> tuple[float, float, Optional[str], str]:
     try:
-        data = await osrm_route(
-            [OSRMCoor(lat=origin.lat, lon=origin.lon), OSRMCoor(lat=dest.lat, lon=dest.lon)]
-        )
+        _fanout_stats["calls"] += 1
+        coords = [OSRMCoor(lat=origin.lat, lon=origin.lon), OSRMCoor(lat=dest.lat, lon=dest.lon)]
+        if budget is None:
+            data = await osrm_route(coords)
+        else:
+            async with budget.semaphore:
+                data = await asyncio.wait_for(osrm_route(coords), timeout=max(0.0, budget.remaining()))
         routes = data.get("routes") or []
         if routes:
             best = routes[0]
@@ -122,17 +165,24 @@ async def _compute_road_metrics(origin: Coord, dest: Coord) -> tuple[float, floa
             polyline = best.get("geometry")
             if distance_km > 0 and time_min > 0:
                 return distance_km, time_min, polyline, "osrm"
+    except asyncio.TimeoutError:
+        _fanout_stats["deadline_misses"] += 1
     except Exception:
-        pass
+        _fanout_stats["errors"] += 1
 
     distance_km = haversine_km(origin, dest)
     time_min = (distance_km / MODE_PARAMS["road"]["speed_kph"]) * 60.0
     return distance_km, time_min, None, "heuristic"
 
 
-async def _compute_mode_leg(mode: Mode, origin: Coord, dest: Coord) -> RouteLegOut:
+async def _compute_mode_leg(
+    mode: Mode,
+    origin: Coord,
+    dest: Coord,
+    budget: Optional[_OsrmBudget] = None,
+) -> RouteLegOut:
     if mode == "road":
-        distance_km, time_min, polyline, source = await _compute_road_metrics(origin, dest)
+        distance_km, time_min, polyline, source = await _compute_road_metrics(origin, dest, budget)
         shape = None
     else:
         params = MODE_PARAMS.get(mode)
@@ -164,6 +214,8 @@ async def _compute_graph_legs(
     destination_id: int,
     allowed_modes: list[Mode],
     objective: Objective,
+    engine: Optional[SearchEngine] = None,
+    budget: Optional[_OsrmBudget] = None,
 ) -> list[RouteLegOut]:
     route_edges = compute_graph_route(
         db,
@@ -171,27 +223,41 @@ async def _compute_graph_legs(
         destination_id=destination_id,
         allowed_modes=allowed_modes,
         objective={"time": objective.time, "cost": objective.cost, "co2e": objective.co2e},
+        engine=engine,
     )
     if not route_edges:
         return []
 
+    locations = resolve_locations_by_ids(
+        db, {leg.from_id for leg in route_edges} | {leg.to_id for leg in route_edges}
+    )
+    resolved = [
+        (route_edge, locations.get(route_edge.from_id), locations.get(route_edge.to_id))
+        for route_edge in route_edges
+    ]
+    resolved = [(edge, a, b) for edge, a, b in resolved if a is not None and b is not None]
+    coords = [
+        (Coord(lat=float(a.lat), lon=float(a.lon)), Coord(lat=float(b.lat), lon=float(b.lon)))
+        for _, a, b in resolved
+    ]
+
+    # Road legs only need OSRM for the polyline; fetch them all at once. Each leg that
+    # misses the shared deadline degrades to the heuristic on its own.
+    road_idx = [i for i, (edge, _, _) in enumerate(resolved) if edge.mode == "road"]
+    road_metrics = await asyncio.gather(
+        *(_compute_road_metrics(coords[i][0], coords[i][1], budget) for i in road_idx)
+    )
+    road_results = dict(zip(road_idx, road_metrics))
+
     out_legs: list[RouteLegOut] = []
-    for route_edge in route_edges:
-        from_location = resolve_location_by_id(db, route_edge.from_id)
-        to_location = resolve_location_by_id(db, route_edge.to_id)
-        if from_location is None or to_location is None:
-            continue
-
-        from_coord = Coord(lat=float(from_location.lat), lon=float(from_location.lon))
-        to_coord = Coord(lat=float(to_location.lat), lon=float(to_location.lon))
+    for i, (route_edge, _, _) in enumerate(resolved):
+        from_coord, to_coord = coords[i]
         polyline = None
         shape = None
         source = "graph"
-        if route_edge.mode == "road":
-            _, _, polyline, road_source = await _compute_road_metrics(from_coord, to_coord)
+        if i in road_results:
+            _, _, polyline, road_source = road_results[i]
             source = f"graph+{road_source}"
-        else:
-            shape = None
 
         out_legs.append(
             RouteLegOut(
@@ -229,16 +295,29 @@ async def compute_multimodal_route(payload: RoutingRequest, db: Session = Depend
         else resolve_nearest_location(db, dest.lat, dest.lon)
     )
 
+    budget = _OsrmBudget.start()
     graph_legs: list[RouteLegOut] = []
     allowed_graph_modes: list[Mode] = ["road"] if mode == "road" else ["road", mode]
     if origin_location is not None and destination_location is not None:
-        graph_legs = await _compute_graph_legs(
-            db,
-            origin_id=int(origin_location.id),
-            destination_id=int(destination_location.id),
-            allowed_modes=allowed_graph_modes,
-            objective=payload.objective,
-        )
+        reference_origin = Coord(lat=float(origin_location.lat), lon=float(origin_location.lon))
+        reference_dest = Coord(lat=float(destination_location.lat), lon=float(destination_location.lon))
+        # Start the baseline alongside the graph legs; discarded if no graph path exists.
+        baseline_task = asyncio.create_task(_compute_mode_leg("road", reference_origin, reference_dest, budget))
+        try:
+            graph_legs = await _compute_graph_legs(
+                db,
+                origin_id=int(origin_location.id),
+                destination_id=int(destination_location.id),
+                allowed_modes=allowed_graph_modes,
+                objective=payload.objective,
+                engine=payload.engine,
+                budget=budget,
+            )
+        except BaseException:
+            baseline_task.cancel()
+            raise
+        if not graph_legs:
+            baseline_task.cancel()
 
     if graph_legs:
         total_distance_km = round(sum(leg.distance_km for leg in graph_legs), 3)
@@ -247,17 +326,22 @@ async def compute_multimodal_route(payload: RoutingRequest, db: Session = Depend
         selected_source = "graph"
         if any(leg.source and "osrm" in leg.source for leg in graph_legs):
             selected_source = "graph+osrm"
-        reference_origin = Coord(lat=float(origin_location.lat), lon=float(origin_location.lon))
-        reference_dest = Coord(lat=float(destination_location.lat), lon=float(destination_location.lon))
-        baseline_leg = await _compute_mode_leg("road", reference_origin, reference_dest)
+        baseline_leg = await baseline_task
     else:
-        leg = await _compute_mode_leg(mode, origin, dest)
+        if mode == "road":
+            # The selected leg and the road baseline are the same OSRM call.
+            leg = await _compute_mode_leg(mode, origin, dest, budget)
+            baseline_leg = leg
+        else:
+            leg, baseline_leg = await asyncio.gather(
+                _compute_mode_leg(mode, origin, dest, budget),
+                _compute_mode_leg("road", origin, dest, budget),
+            )
         graph_legs = [leg]
         total_distance_km = leg.distance_km
         total_time_min = leg.time_min
         total_co2e_kg = leg.co2e_kg
         selected_source = leg.source
-        baseline_leg = await _compute_mode_leg("road", origin, dest)
 
     base_cost = baseline_leg.distance_km * MODE_PARAMS["road"]["cost_per_km"]
     opt_cost = 0.0
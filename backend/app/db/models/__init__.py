@@ -4,10 +4,12 @@ from app.db.base import Base
 from app.db.models.plan import Plan
 from app.db.models.event import Event
 from app.db.models.plan_leg import PlanLeg
+from app.db.models.worker_cursor import WorkerCursor
 
 __all__ = [
     "Base",
     "Plan",
     "Event",
     "PlanLeg",
+    "WorkerCursor",
 ]
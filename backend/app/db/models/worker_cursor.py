@@ -0,0 +1,12 @@
+# backend/app/db/models/worker_cursor.py
+from sqlalchemy import Column, BigInteger, Text
+from sqlalchemy.dialects.postgresql import TIMESTAMP
+from sqlalchemy.sql import func
+from app.db.base import Base
+
+class WorkerCursor(Base):
+    """Last event id a background worker has fully processed (survives restarts)."""
+    __tablename__ = "worker_cursors"
+    name = Column(Text, primary_key=True)
+    last_event_id = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
@@ -1,10 +1,52 @@
-from sqlalchemy import create_engine, text
+import os
+from contextvars import ContextVar
+
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.orm import sessionmaker
 from app.config.settings import settings
 
 engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True, future=True)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
 
+# Requests issuing more statements than this get logged (N+1 regressions).
+DB_QUERY_WARN_THRESHOLD = int(os.getenv("DB_QUERY_WARN_THRESHOLD", "25"))
+
+# Mutable per-request counter; set by the HTTP middleware, shared with threadpool workers.
+_query_counter: ContextVar[list[int] | None] = ContextVar("db_query_counter", default=None)
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    counter = _query_counter.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+def start_query_count() -> list[int]:
+    counter = [0]
+    _query_counter.set(counter)
+    return counter
+
+
+_request_query_stats: dict[str, dict[str, int]] = {}
+
+
+def record_request_queries(route: str, count: int) -> None:
+    stats = _request_query_stats.setdefault(route, {"requests": 0, "queries": 0, "max_queries": 0})
+    stats["requests"] += 1
+    stats["queries"] += count
+    stats["max_queries"] = max(stats["max_queries"], count)
+    if count > DB_QUERY_WARN_THRESHOLD:
+        print(f"[db] {route} issued {count} queries (threshold {DB_QUERY_WARN_THRESHOLD})")
+
+
+def query_count_stats() -> dict[str, dict[str, float]]:
+    return {
+        route: {**stats, "avg_queries": round(stats["queries"] / max(1, stats["requests"]), 2)}
+        for route, stats in _request_query_stats.items()
+    }
+
+
 def ping_db() -> bool:
     with engine.connect() as conn:
         conn.execute(text("SELECT 1"))
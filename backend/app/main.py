@@ -1,5 +1,7 @@
 
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from app.config.settings import settings
 from app.api.v1.routes.health import router as health_router
@@ -10,16 +12,38 @@ from app.api.v1.routes.plans import router as plans_router
 from app.api.v1.routes.routing import router as routing_router
 from app.api.v1.routes.events import router as events_router
 import os
-from app.db.session import engine
+from app.db.session import engine, record_request_queries, start_query_count
 from app.db.base import Base
 from app.api.v1.routes.metrics import router as metrics_router
+from app.services import delay_model
+from app.services.delay_client import ML_DELAY_TIMEOUT
+from app.services.http_clients import close_clients, get_client
+from app.services.osrm_client import OSRM_TIMEOUT
+from app.services.weather_client import HTTP_TIMEOUT_S as WEATHER_TIMEOUT_S
 from sqlalchemy import text
 
 # 🔴 REQUIRED: import models so SQLAlchemy sees them
 import app.db.models.plan
 import app.db.models.plan_leg
+import app.db.models.worker_cursor
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One keep-alive client per upstream for the app's lifetime.
+    get_client("osrm", timeout=OSRM_TIMEOUT)
+    get_client("open-meteo", timeout=WEATHER_TIMEOUT_S)
+    get_client("ml-delay", timeout=ML_DELAY_TIMEOUT)
+    # ML_DELAY_MODE=embedded: load models/delay/model.pkl in-process
+    await delay_model.startup()
+    yield
+    await close_clients()
+    delay_model.shutdown()
+
+
 def create_app() -> FastAPI:
     app = FastAPI(
+        lifespan=lifespan,
         title="Adaptive Multimodal Logistics API",
         version="0.1.0",
         openapi_url=f"{settings.API_PREFIX}/openapi.json",
@@ -36,6 +60,16 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
 
+    # Per-request DB statement count (X-DB-Queries header + /metrics/runtime)
+    @app.middleware("http")
+    async def count_db_queries(request: Request, call_next):
+        counter = start_query_count()
+        response = await call_next(request)
+        route = request.scope.get("route")
+        record_request_queries(f"{request.method} {getattr(route, 'path', request.url.path)}", counter[0])
+        response.headers["X-DB-Queries"] = str(counter[0])
+        return response
+
     # Routers
     app.include_router(health_router, prefix=settings.API_PREFIX)
     app.include_router(network_router, prefix=settings.API_PREFIX)
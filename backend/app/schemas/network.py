@@ -44,6 +44,13 @@ class LocationListResponse(BaseModel):
     data: list[LocationOut]
     total: int
 
+class NearestLocationOut(LocationOut):
+    distance_km: float
+
+class NearestLocationResponse(BaseModel):
+    data: list[NearestLocationOut]
+    total: int
+
 class LocationQuery(BaseModel):
     q: Optional[str] = None
     type: Optional[LocationType] = None
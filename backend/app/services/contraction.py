@@ -0,0 +1,459 @@
+from __future__ import annotations
+
+import heapq
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterable
+
+import numpy as np
+
+from app.services.graph_cache import CompiledGraph
+
+ROOT = Path(__file__).resolve().parents[3]
+CH_DIR = Path(os.getenv("CH_DIR", str(ROOT / "data" / "ch")))
+# Witness searches give up after settling this many nodes (more shortcuts, faster build).
+CH_WITNESS_SETTLE_LIMIT = int(os.getenv("CH_WITNESS_SETTLE_LIMIT", "500"))
+
+# Mode sets the routing endpoint actually asks for ("road" or "road" + one mode).
+CH_MODE_SETS: list[tuple[str, ...]] = [("road",), ("road", "rail"), ("road", "sea"), ("road", "air")]
+
+OBJECTIVE_PRESETS: dict[str, dict[str, float]] = {
+    "balanced": {"cost": 0.5, "time": 0.3, "co2e": 0.2},
+    "fastest": {"cost": 0.0, "time": 1.0, "co2e": 0.0},
+    "cheapest": {"cost": 1.0, "time": 0.0, "co2e": 0.0},
+    "greenest": {"cost": 0.0, "time": 0.0, "co2e": 1.0},
+}
+
+
+def _normalise(objective: dict[str, float]) -> tuple[float, float, float] | None:
+    """Shortest paths are invariant to positive scaling, so compare weight ratios."""
+    vec = (
+        float(objective.get("time", 0.0)),
+        float(objective.get("cost", 0.0)),
+        float(objective.get("co2e", 0.0)),
+    )
+    total = sum(vec)
+    if total <= 0 or min(vec) < 0:
+        return None
+    return tuple(v / total for v in vec)  # type: ignore[return-value]
+
+
+def match_preset(objective: dict[str, float], tol: float = 1e-6) -> str | None:
+    target = _normalise(objective)
+    if target is None:
+        return None
+    for name, preset in OBJECTIVE_PRESETS.items():
+        candidate = _normalise(preset)
+        if candidate is not None and all(abs(a - b) <= tol for a, b in zip(target, candidate)):
+            return name
+    return None
+
+
+def _mode_key(modes: Iterable[str]) -> tuple[str, ...]:
+    return tuple(sorted(set(modes) | {"transfer"}))
+
+
+@dataclass
+class ContractionHierarchy:
+    modes: tuple[str, ...]
+    preset: str
+    fingerprint: tuple
+    node_ids: np.ndarray
+    rank: np.ndarray
+    # arcs: original edges (edge_id >= 0) and shortcuts (children >= 0)
+    arc_from: np.ndarray
+    arc_to: np.ndarray
+    arc_weight: np.ndarray
+    arc_edge_id: np.ndarray
+    arc_child1: np.ndarray
+    arc_child2: np.ndarray
+    built_at: float = field(default_factory=time.time)
+    node_index: dict[int, int] = field(default_factory=dict)
+    up_offsets: list[int] = field(default_factory=list)
+    up_arcs: list[int] = field(default_factory=list)
+    down_offsets: list[int] = field(default_factory=list)
+    down_arcs: list[int] = field(default_factory=list)
+
+    def __post_init__(self) -> None:
+        self.node_index = {int(loc_id): idx for idx, loc_id in enumerate(self.node_ids.tolist())}
+        n = int(self.node_ids.shape[0])
+        upward = self.rank[self.arc_from] < self.rank[self.arc_to]
+
+        # Forward search climbs arcs u->v with rank[v] > rank[u], grouped by u.
+        up = np.flatnonzero(upward)
+        up = up[np.argsort(self.arc_from[up], kind="stable")]
+        up_offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.arc_from[up], minlength=n), out=up_offsets[1:])
+
+        # Backward search climbs arcs u->v with rank[u] > rank[v] in reverse, grouped by v.
+        down = np.flatnonzero(~upward)
+        down = down[np.argsort(self.arc_to[down], kind="stable")]
+        down_offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.arc_to[down], minlength=n), out=down_offsets[1:])
+
+        self.up_offsets, self.up_arcs = up_offsets.tolist(), up.tolist()
+        self.down_offsets, self.down_arcs = down_offsets.tolist(), down.tolist()
+        self._from = self.arc_from.tolist()
+        self._to = self.arc_to.tolist()
+        self._weight = self.arc_weight.tolist()
+
+    @property
+    def num_shortcuts(self) -> int:
+        return int(np.count_nonzero(self.arc_edge_id < 0))
+
+    def query(self, source_id: int, target_id: int, stats: Any = None) -> list[int] | None:
+        """Bidirectional upward search; returns the original Edge.ids of the path."""
+        source = self.node_index.get(source_id)
+        target = self.node_index.get(target_id)
+        if source is None or target is None:
+            return None
+        inf = float("inf")
+
+        dist = ({source: 0.0}, {target: 0.0})
+        parent: tuple[dict[int, int], dict[int, int]] = ({}, {})
+        frontier = ([(0.0, source)], [(0.0, target)])
+        offsets = (self.up_offsets, self.down_offsets)
+        arcs = (self.up_arcs, self.down_arcs)
+        heads = (self._to, self._from)
+        best_total = inf
+        meeting: int | None = None
+
+        while frontier[0] or frontier[1]:
+            tops = [f[0][0] if f else inf for f in frontier]
+            if min(tops) >= best_total:
+                break
+            side = 0 if tops[0] <= tops[1] else 1
+            cost, node = heapq.heappop(frontier[side])
+            if cost > dist[side].get(node, inf):
+                continue
+            if stats is not None:
+                stats.nodes_settled += 1
+            if node in dist[1 - side] and cost + dist[1 - side][node] < best_total:
+                best_total = cost + dist[1 - side][node]
+                meeting = node
+
+            # Stall-on-demand: a higher-ranked node already reaches this one cheaper,
+            # so nothing relaxed from here can lie on a shortest up-down path.
+            other = 1 - side
+            stalled = False
+            for i in range(offsets[other][node], offsets[other][node + 1]):
+                arc = arcs[other][i]
+                if dist[side].get(heads[other][arc], inf) + self._weight[arc] < cost:
+                    stalled = True
+                    break
+            if stalled:
+                continue
+
+            for i in range(offsets[side][node], offsets[side][node + 1]):
+                arc = arcs[side][i]
+                if stats is not None:
+                    stats.edges_relaxed += 1
+                nxt = heads[side][arc]
+                path_cost = cost + self._weight[arc]
+                if path_cost < dist[side].get(nxt, inf):
+                    dist[side][nxt] = path_cost
+                    parent[side][nxt] = arc
+                    heapq.heappush(frontier[side], (path_cost, nxt))
+
+        if meeting is None:
+            return None
+
+        arc_path: list[int] = []
+        node = meeting
+        while node != source:
+            arc = parent[0][node]
+            arc_path.append(arc)
+            node = self._from[arc]
+        arc_path.reverse()
+        node = meeting
+        while node != target:
+            arc = parent[1][node]
+            arc_path.append(arc)
+            node = self._to[arc]
+        return self._unpack(arc_path)
+
+    def _unpack(self, arc_path: list[int]) -> list[int]:
+        edge_ids: list[int] = []
+        stack = list(reversed(arc_path))
+        while stack:
+            arc = stack.pop()
+            edge_id = int(self.arc_edge_id[arc])
+            if edge_id >= 0:
+                edge_ids.append(edge_id)
+            else:
+                stack.append(int(self.arc_child2[arc]))
+                stack.append(int(self.arc_child1[arc]))
+        return edge_ids
+
+    # ---------- serialization ----------
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        meta = {
+            "modes": list(self.modes),
+            "preset": self.preset,
+            "fingerprint": list(self.fingerprint),
+            "built_at": self.built_at,
+        }
+        with open(path, "wb") as fh:
+            np.savez_compressed(
+                fh,
+                meta=np.array(json.dumps(meta)),
+                node_ids=self.node_ids,
+                rank=self.rank,
+                arc_from=self.arc_from,
+                arc_to=self.arc_to,
+                arc_weight=self.arc_weight,
+                arc_edge_id=self.arc_edge_id,
+                arc_child1=self.arc_child1,
+                arc_child2=self.arc_child2,
+            )
+
+    @classmethod
+    def load(cls, path: Path) -> "ContractionHierarchy":
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            return cls(
+                modes=tuple(meta["modes"]),
+                preset=meta["preset"],
+                # JSON turns tuples into lists; any nested ones must compare equal to the graph's again
+                fingerprint=tuple(tuple(v) if isinstance(v, list) else v for v in meta["fingerprint"]),
+                built_at=float(meta["built_at"]),
+                node_ids=data["node_ids"],
+                rank=data["rank"],
+                arc_from=data["arc_from"],
+                arc_to=data["arc_to"],
+                arc_weight=data["arc_weight"],
+                arc_edge_id=data["arc_edge_id"],
+                arc_child1=data["arc_child1"],
+                arc_child2=data["arc_child2"],
+            )
+
+
+def hierarchy_path(modes: Iterable[str], preset: str) -> Path:
+    return CH_DIR / f"ch_{'-'.join(_mode_key(modes))}_{preset}.npz"
+
+
+# ---------- preprocessing ----------
+def build_hierarchy(graph: CompiledGraph, modes: Iterable[str], preset: str) -> ContractionHierarchy:
+    """
+    Contract every node of `graph` in edge-difference order (lazy updates,
+    bounded witness searches) for one mode set and objective preset.
+    """
+    weights = graph.weights(OBJECTIVE_PRESETS[preset], modes)
+    n = graph.num_nodes
+    inf = float("inf")
+
+    arc_from: list[int] = []
+    arc_to: list[int] = []
+    arc_weight: list[float] = []
+    arc_edge_id: list[int] = []
+    arc_children: list[tuple[int, int]] = []
+    out_arcs: list[dict[int, int]] = [{} for _ in range(n)]
+    in_arcs: list[dict[int, int]] = [{} for _ in range(n)]
+
+    def add_arc(u: int, v: int, w: float, edge_id: int, children: tuple[int, int]) -> None:
+        current = out_arcs[u].get(v)
+        if current is not None and arc_weight[current] <= w:
+            return
+        arc_from.append(u)
+        arc_to.append(v)
+        arc_weight.append(w)
+        arc_edge_id.append(edge_id)
+        arc_children.append(children)
+        out_arcs[u][v] = in_arcs[v][u] = len(arc_from) - 1
+
+    for pos in range(graph.num_edges):
+        u, v, w = graph.sources_list[pos], graph.targets_list[pos], weights[pos]
+        if w != inf and u != v:
+            add_arc(u, v, w, int(graph.edge_ids[pos]), (-1, -1))
+
+    def witness_cost(start: int, skip: int, limit: float, goals: set[int]) -> dict[int, float]:
+        dist = {start: 0.0}
+        heap = [(0.0, start)]
+        settled = 0
+        remaining = set(goals)
+        while heap and remaining and settled < CH_WITNESS_SETTLE_LIMIT:
+            d, node = heapq.heappop(heap)
+            if d > dist.get(node, inf) or d > limit:
+                if d > limit:
+                    break
+                continue
+            settled += 1
+            remaining.discard(node)
+            for nxt, arc in out_arcs[node].items():
+                if nxt == skip:
+                    continue
+                nd = d + arc_weight[arc]
+                if nd < dist.get(nxt, inf):
+                    dist[nxt] = nd
+                    heapq.heappush(heap, (nd, nxt))
+        return dist
+
+    def shortcuts_for(v: int) -> list[tuple[int, int, float, int, int]]:
+        found = []
+        outgoing = list(out_arcs[v].items())
+        for u, in_arc in list(in_arcs[v].items()):
+            w_in = arc_weight[in_arc]
+            goals = {x for x, _ in outgoing if x != u}
+            if not goals:
+                continue
+            limit = w_in + max(arc_weight[a] for x, a in outgoing if x != u)
+            dist = witness_cost(u, v, limit, goals)
+            for x, out_arc in outgoing:
+                if x == u:
+                    continue
+                via = w_in + arc_weight[out_arc]
+                if dist.get(x, inf) > via:
+                    found.append((u, x, via, in_arc, out_arc))
+        return found
+
+    contracted_neighbours = [0] * n
+
+    def priority(v: int) -> int:
+        degree = len(in_arcs[v]) + len(out_arcs[v])
+        return len(shortcuts_for(v)) - degree + contracted_neighbours[v]
+
+    heap = [(priority(v), v) for v in range(n)]
+    heapq.heapify(heap)
+    rank = np.zeros(n, dtype=np.int64)
+    order = 0
+    while heap:
+        _, v = heapq.heappop(heap)
+        current = priority(v)
+        if heap and current > heap[0][0]:
+            heapq.heappush(heap, (current, v))
+            continue
+
+        for u, x, w, in_arc, out_arc in shortcuts_for(v):
+            add_arc(u, x, w, -1, (in_arc, out_arc))
+        neighbours = set(in_arcs[v]) | set(out_arcs[v])
+        for u in in_arcs[v]:
+            out_arcs[u].pop(v, None)
+        for x in out_arcs[v]:
+            in_arcs[x].pop(v, None)
+        in_arcs[v].clear()
+        out_arcs[v].clear()
+        for nb in neighbours:
+            contracted_neighbours[nb] += 1
+        rank[v] = order
+        order += 1
+
+    children = np.array(arc_children, dtype=np.int64).reshape(-1, 2)
+    return ContractionHierarchy(
+        modes=_mode_key(modes),
+        preset=preset,
+        fingerprint=graph.fingerprint,
+        node_ids=graph.node_ids.copy(),
+        rank=rank,
+        arc_from=np.array(arc_from, dtype=np.int64),
+        arc_to=np.array(arc_to, dtype=np.int64),
+        arc_weight=np.array(arc_weight, dtype=np.float64),
+        arc_edge_id=np.array(arc_edge_id, dtype=np.int64),
+        arc_child1=children[:, 0],
+        arc_child2=children[:, 1],
+    )
+
+
+# ---------- runtime registry ----------
+_hierarchies: dict[tuple[tuple[str, ...], str], ContractionHierarchy] = {}
+_loaded = False
+_stats: dict[str, Any] = {"loaded": 0, "queries": 0, "fallback_no_preset": 0, "fallback_missing": 0, "fallback_stale": 0}
+
+
+def reload_hierarchies() -> int:
+    """(Re)load every serialized hierarchy under CH_DIR. Returns how many were loaded."""
+    global _loaded
+    found: dict[tuple[tuple[str, ...], str], ContractionHierarchy] = {}
+    if CH_DIR.is_dir():
+        for path in sorted(CH_DIR.glob("ch_*.npz")):
+            try:
+                ch = ContractionHierarchy.load(path)
+            except Exception as e:
+                print(f"[ch] failed to load {path.name}: {e}")
+                continue
+            found[(ch.modes, ch.preset)] = ch
+    _hierarchies.clear()
+    _hierarchies.update(found)
+    _loaded = True
+    _stats["loaded"] = len(found)
+    return len(found)
+
+
+def find_hierarchy(
+    graph: CompiledGraph, allowed_modes: Iterable[str], objective: dict[str, float]
+) -> ContractionHierarchy | None:
+    """Hierarchy for this request, or None (and a fallback counter bump) when none applies."""
+    if not _loaded:
+        reload_hierarchies()
+    preset = match_preset(objective)
+    if preset is None:
+        _stats["fallback_no_preset"] += 1
+        return None
+    ch = _hierarchies.get((_mode_key(allowed_modes), preset))
+    if ch is None:
+        _stats["fallback_missing"] += 1
+        return None
+    if graph.patched or tuple(ch.fingerprint) != tuple(graph.fingerprint):
+        _stats["fallback_stale"] += 1
+        return None
+    _stats["queries"] += 1
+    return ch
+
+
+def ch_stats() -> dict[str, Any]:
+    return {
+        **_stats,
+        "hierarchies": [
+            {
+                "modes": list(ch.modes),
+                "preset": ch.preset,
+                "nodes": int(ch.node_ids.shape[0]),
+                "shortcuts": ch.num_shortcuts,
+                "built_at": ch.built_at,
+            }
+            for ch in _hierarchies.values()
+        ],
+    }
+
+
+def check_round_trip(graph: CompiledGraph, paths: Iterable[Path]) -> None:
+    """Reload saved hierarchies and make sure find_hierarchy accepts them for `graph`."""
+    for path in paths:
+        ch = ContractionHierarchy.load(path)
+        if ch.fingerprint != tuple(graph.fingerprint):
+            raise RuntimeError(f"[ch] {path.name}: fingerprint changed across save/load")
+    reload_hierarchies()
+    for modes in CH_MODE_SETS:
+        for preset, objective in OBJECTIVE_PRESETS.items():
+            if find_hierarchy(graph, modes, objective) is None:
+                raise RuntimeError(f"[ch] {'+'.join(_mode_key(modes))}/{preset}: not usable after reload")
+
+
+def build_all(graph: CompiledGraph) -> list[Path]:
+    paths = []
+    for modes in CH_MODE_SETS:
+        for preset in OBJECTIVE_PRESETS:
+            started = time.perf_counter()
+            ch = build_hierarchy(graph, modes, preset)
+            path = hierarchy_path(modes, preset)
+            ch.save(path)
+            paths.append(path)
+            print(
+                f"[ch] {'+'.join(ch.modes)}/{preset}: {ch.num_shortcuts} shortcuts "
+                f"in {time.perf_counter() - started:.2f}s -> {path}"
+            )
+    check_round_trip(graph, paths)
+    return paths
+
+
+if __name__ == "__main__":
+    # CLI (offline preprocessing; rerun whenever the edges table changes):
+    #   python -m app.services.contraction
+    from app.db.session import SessionLocal
+    from app.services.graph_cache import get_compiled_graph
+
+    with SessionLocal() as db:
+        build_all(get_compiled_graph(db, force=True))
@@ -1,14 +1,54 @@
 from __future__ import annotations
 
 import os
+import time
 from typing import Dict, Any
 from xmlrpc import client
-from app.services.delay_payload_adapter import adapt_to_ml_payload
 
-import httpx
+import numpy as np
+
+from app.services.delay_payload_adapter import (
+    ML_FEATURE_BOUNDS,
+    ML_FEATURES,
+    adapt_columns_to_ml_payload,
+    adapt_to_ml_payload,
+)
+from app.services import delay_model, http_clients
+from app.services.ttl_cache import TTLCache
 
 ML_DELAY_URL = os.getenv("ML_DELAY_URL", "").rstrip("/")
 ML_DELAY_TIMEOUT = float(os.getenv("ML_DELAY_TIMEOUT", "5.0"))
+# Rows per POST /ml/predict_delay/batch call (must stay under the service's ML_BATCH_MAX_ROWS).
+ML_DELAY_BATCH_SIZE = int(os.getenv("ML_DELAY_BATCH_SIZE", "20000"))
+
+# Prediction cache: continuous features are snapped to these bucket widths before
+# scoring, so near-identical requests share one model call. Integer features
+# (priority, hour_of_day, day_of_week) are always keyed exactly.
+ML_DELAY_CACHE_ENABLED = os.getenv("ML_DELAY_CACHE_ENABLED", "1") not in ("0", "false", "False")
+ML_DELAY_CACHE_SIZE = int(os.getenv("ML_DELAY_CACHE_SIZE", "50000"))
+ML_DELAY_CACHE_TTL_S = float(os.getenv("ML_DELAY_CACHE_TTL_S", "900"))
+ML_DELAY_CACHE_BUCKETS = os.getenv(
+    "ML_DELAY_CACHE_BUCKETS",
+    "distance_km=1,baseline_time_min=1,weight_kg=25,temperature_c=1,"
+    "precipitation_mm=0.5,wind_speed_mps=0.5,congestion_index=0.05,avg_speed_kph=1",
+)
+
+
+def _parse_buckets(spec: str) -> Dict[str, float]:
+    buckets = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, step = item.partition("=")
+        if name.strip() in ML_FEATURES and float(step) > 0:
+            buckets[name.strip()] = float(step)
+    return buckets
+
+
+_buckets = _parse_buckets(ML_DELAY_CACHE_BUCKETS)
+_prediction_cache = TTLCache(maxsize=ML_DELAY_CACHE_SIZE, ttl_s=ML_DELAY_CACHE_TTL_S)
+# Identity of the remote model (version + model file hash reported by the service).
+_remote_model_id: str | None = None
+_remote_checked_at: float | None = None
+_cache_stats = {"version_changes": 0, "batch_rows": 0, "batch_unique_rows": 0}
 
 
 class DelayClientError(Exception):
@@ -35,6 +75,81 @@ def _dummy_predict(features: Dict[str, Any]) -> Dict[str, float]:
     }
 
 
+def _dummy_predict_batch(columns: Dict[str, np.ndarray]) -> Dict[str, Any]:
+    """Vectorized _dummy_predict over already-adapted feature columns."""
+    delay_min = np.maximum(0.0, columns["congestion_index"] * 20 + columns["precipitation_mm"] * 2)
+    delay_prob = np.minimum(0.9, delay_min / np.maximum(1.0, columns["baseline_time_min"]))
+    return {
+        "delay_prob": np.round(delay_prob, 3),
+        "expected_delay_min": np.round(delay_min, 1),
+        "model_version": "dummy_v0",
+        "source": "fallback",
+    }
+
+
+def _quantize(name: str, value):
+    """
+    Snap a feature (scalar or array) to the centre of its bucket, kept within
+    the adapter's bounds (e.g. weight_kg=10 with 25 kg buckets must not become 0,
+    which the service rejects).
+    """
+    step = _buckets.get(name)
+    if step is None:
+        return value
+    snapped = np.round(np.asarray(value, dtype=np.float64) / step) * step
+    low, high = ML_FEATURE_BOUNDS.get(name, (None, None))
+    if low is not None or high is not None:
+        snapped = np.clip(snapped, low, high)
+    return snapped
+
+
+def _model_tag() -> str:
+    """Identity of the model that will answer next; part of every cache key."""
+    if delay_model.embedded_enabled():
+        tag = delay_model.model_tag()
+        if tag is not None:
+            return tag
+    return f"remote:{_remote_model_id}"
+
+
+def _note_model_id(model_id: str | None) -> None:
+    global _remote_model_id
+    if model_id and model_id != _remote_model_id:
+        if _remote_model_id is not None:
+            # the service swapped models: old entries can never be hit again
+            _prediction_cache.clear()
+            _cache_stats["version_changes"] += 1
+        _remote_model_id = model_id
+
+
+async def _check_remote_model() -> None:
+    """
+    Ask the service which model it serves (at most every ML_DELAY_RELOAD_CHECK_S),
+    so a swapped model.pkl invalidates the cache even while every lookup hits.
+    """
+    global _remote_checked_at
+    if delay_model.embedded_enabled() or not ML_DELAY_URL:
+        return
+    now = time.monotonic()
+    if _remote_checked_at is not None and now - _remote_checked_at < delay_model.ML_DELAY_RELOAD_CHECK_S:
+        return
+    _remote_checked_at = now
+    try:
+        r = await http_clients.request("ml-delay", "GET", f"{ML_DELAY_URL}/health", timeout=ML_DELAY_TIMEOUT)
+        if r.status_code == 200:
+            _note_model_id(r.json().get("model_id"))
+    except Exception:
+        pass  # the next scoring call reports the id as well
+
+
+def _cache_enabled() -> bool:
+    return ML_DELAY_CACHE_ENABLED and (delay_model.embedded_enabled() or bool(ML_DELAY_URL))
+
+
+def _cache_key(payload: Dict[str, Any]) -> tuple:
+    return (_model_tag(), tuple(float(payload[f]) for f in ML_FEATURES))
+
+
 from datetime import datetime, timezone
 
 async def predict_delay(features: Dict[str, Any]) -> Dict[str, float]:
@@ -66,22 +181,49 @@ async def predict_delay(features: Dict[str, Any]) -> Dict[str, float]:
 
     full_features = {**defaults, **features}
 
+    if not _cache_enabled():
+        return await _predict_one(full_features)
+
+    await _check_remote_model()
+    payload = adapt_to_ml_payload(full_features)
+    payload = {f: float(_quantize(f, payload[f])) for f in ML_FEATURES}
+    cached = _prediction_cache.get(_cache_key(payload))
+    if cached is not None:
+        return dict(cached)
+
+    data = await _predict_one(payload)
+    if data.get("source") != "fallback":
+        _prediction_cache.set(_cache_key(payload), dict(data))
+    return data
+
+
+async def _predict_one(full_features: Dict[str, Any]) -> Dict[str, Any]:
+    if delay_model.embedded_enabled():
+        payload = adapt_to_ml_payload(full_features)
+        result = await delay_model.predict_matrix(np.array([[payload[f] for f in ML_FEATURES]], dtype=np.float64))
+        if result is not None:
+            return {
+                "delay_prob": round(float(result["delay_prob"][0]), 3),
+                "expected_delay_min": round(float(result["expected_delay_min"][0]), 1),
+                "model_version": result["model_version"],
+                "source": "embedded",
+            }
+
     if not ML_DELAY_URL:
         return _dummy_predict(full_features)
 
     url = f"{ML_DELAY_URL}/ml/predict_delay"
 
     try:
-        async with httpx.AsyncClient(timeout=ML_DELAY_TIMEOUT) as client:
-            payload = adapt_to_ml_payload(full_features)
-            r = await client.post(url, json=payload)
+        payload = adapt_to_ml_payload(full_features)
+        r = await http_clients.request("ml-delay", "POST", url, timeout=ML_DELAY_TIMEOUT, json=payload)
 
-            if r.status_code != 200:
-                print("❌ ML STATUS:", r.status_code)
-                print("❌ ML RESPONSE:", r.text)
-                raise DelayClientError(f"ML returned {r.status_code}")
+        if r.status_code != 200:
+            print("❌ ML STATUS:", r.status_code)
+            print("❌ ML RESPONSE:", r.text)
+            raise DelayClientError(f"ML returned {r.status_code}")
 
-            data = r.json()
+        data = r.json()
 
     except Exception:
         # hard fallback → never crash backend
@@ -91,5 +233,118 @@ async def predict_delay(features: Dict[str, Any]) -> Dict[str, float]:
         raise DelayClientError("Malformed ML delay response")
 
     data.setdefault("source", "ml")
+    _note_model_id(data.get("model_id") or data.get("model_version"))
     return data
 
+
+
+async def predict_delay_batch(columns: Dict[str, Any], n: int) -> Dict[str, Any]:
+    """
+    Predict delay for n rows in one go.
+
+    columns: feature name -> scalar or length-n array (missing features use
+    the same defaults as predict_delay).
+
+    Returns:
+    {
+      delay_prob: np.ndarray (n,),
+      expected_delay_min: np.ndarray (n,),
+      model_version: str,
+      source: "ml" | "embedded" | "fallback"
+    }
+    Rows are de-duplicated after bucketing and only cache misses are scored.
+    """
+    adapted = adapt_columns_to_ml_payload(columns, n)
+    if n == 0 or not _cache_enabled():
+        return await _predict_batch_uncached(adapted, n)
+
+    await _check_remote_model()
+    X = np.column_stack([_quantize(f, adapted[f]) for f in ML_FEATURES])
+    unique, inverse = np.unique(X, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    _cache_stats["batch_rows"] += n
+    _cache_stats["batch_unique_rows"] += len(unique)
+
+    tag = _model_tag()
+    rows = [tuple(row) for row in unique.tolist()]
+    found = [_prediction_cache.get((tag, row)) for row in rows]
+    misses = [i for i, hit in enumerate(found) if hit is None]
+
+    source = found[0]["source"] if not misses else None
+    model_version = found[0]["model_version"] if not misses else None
+    if misses:
+        sub = {f: unique[misses, j] for j, f in enumerate(ML_FEATURES)}
+        scored = await _predict_batch_uncached(sub, len(misses))
+        source, model_version = scored["source"], scored["model_version"]
+        tag = _model_tag()
+        for k, i in enumerate(misses):
+            entry = {
+                "delay_prob": float(scored["delay_prob"][k]),
+                "expected_delay_min": float(scored["expected_delay_min"][k]),
+                "model_version": model_version,
+                "source": source,
+            }
+            found[i] = entry
+            if source != "fallback":
+                _prediction_cache.set((tag, rows[i]), entry)
+
+    return {
+        "delay_prob": np.array([hit["delay_prob"] for hit in found])[inverse],
+        "expected_delay_min": np.array([hit["expected_delay_min"] for hit in found])[inverse],
+        "model_version": model_version,
+        "source": source,
+    }
+
+
+async def _predict_batch_uncached(adapted: Dict[str, np.ndarray], n: int) -> Dict[str, Any]:
+    if delay_model.embedded_enabled() and n > 0:
+        result = await delay_model.predict_matrix(np.column_stack([adapted[f] for f in ML_FEATURES]))
+        if result is not None:
+            return {
+                "delay_prob": np.array([round(v, 3) for v in result["delay_prob"].tolist()]),
+                "expected_delay_min": np.array([round(v, 1) for v in result["expected_delay_min"].tolist()]),
+                "model_version": result["model_version"],
+                "source": "embedded",
+            }
+
+    if not ML_DELAY_URL or n == 0:
+        return _dummy_predict_batch(adapted)
+
+    url = f"{ML_DELAY_URL}/ml/predict_delay/batch"
+    probs, delays = [], []
+    model_version = model_id = None
+
+    try:
+        for start in range(0, n, ML_DELAY_BATCH_SIZE):
+            chunk = {f: adapted[f][start:start + ML_DELAY_BATCH_SIZE].tolist() for f in ML_FEATURES}
+            r = await http_clients.request("ml-delay", "POST", url, timeout=ML_DELAY_TIMEOUT, json={"columns": chunk})
+            if r.status_code != 200:
+                print("❌ ML BATCH STATUS:", r.status_code)
+                print("❌ ML BATCH RESPONSE:", r.text[:500])
+                raise DelayClientError(f"ML returned {r.status_code}")
+            data = r.json()
+            probs.append(np.asarray(data["delay_prob"], dtype=np.float64))
+            delays.append(np.asarray(data["expected_delay_min"], dtype=np.float64))
+            model_version = data.get("model_version")
+            model_id = data.get("model_id") or model_version
+    except Exception:
+        # hard fallback → never crash backend
+        return _dummy_predict_batch(adapted)
+
+    _note_model_id(model_id)
+    return {
+        "delay_prob": np.concatenate(probs),
+        "expected_delay_min": np.concatenate(delays),
+        "model_version": model_version,
+        "source": "ml",
+    }
+
+
+def prediction_cache_stats() -> Dict[str, Any]:
+    return {
+        **_prediction_cache.snapshot_stats(),
+        **_cache_stats,
+        "enabled": _cache_enabled(),
+        "model_tag": _model_tag(),
+        "buckets": _buckets,
+    }
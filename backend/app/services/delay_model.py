@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[3]
+
+# "http" (default) calls ml/delay_service; "embedded" loads the model into this process.
+ML_DELAY_MODE = os.getenv("ML_DELAY_MODE", "http").lower()
+ML_DELAY_MODEL_PATH = Path(os.getenv("ML_DELAY_MODEL_PATH", str(ROOT / "models" / "delay" / "model.pkl")))
+ML_DELAY_MODEL_VERSION = os.getenv("ML_DELAY_MODEL_VERSION", "delay_v0.1.0")
+ML_DELAY_THREADS = int(os.getenv("ML_DELAY_THREADS", "2"))
+# How often (seconds) a prediction may stat the model file to pick up a replacement.
+ML_DELAY_RELOAD_CHECK_S = float(os.getenv("ML_DELAY_RELOAD_CHECK_S", "30"))
+
+
+@dataclass
+class LoadedModel:
+    classifier: Any
+    regressor: Any
+    leaf_proba: list[np.ndarray]  # per tree, normalised P(class 1) at every node
+    version: str
+    path: Path
+    mtime: float
+    loaded_at: float
+    load_ms: float
+
+
+_lock = threading.Lock()
+_model: LoadedModel | None = None
+_executor: ThreadPoolExecutor | None = None
+_last_check: float | None = None
+_stats: dict[str, Any] = {"predictions": 0, "rows": 0, "reloads": 0, "load_errors": 0, "last_error": None}
+
+
+def embedded_enabled() -> bool:
+    return ML_DELAY_MODE == "embedded"
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=ML_DELAY_THREADS, thread_name_prefix="delay-model")
+    return _executor
+
+
+def load_model(force: bool = False) -> LoadedModel | None:
+    """
+    (Re)load the pickled classifier/regressor pair if the file changed.
+    A failed load keeps serving the previous model; returns the active one.
+    """
+    global _model
+    with _lock:
+        try:
+            mtime = ML_DELAY_MODEL_PATH.stat().st_mtime
+            if _model is not None and not force and _model.mtime == mtime:
+                return _model
+
+            import joblib  # scikit-learn/joblib are only needed in embedded mode
+
+            started = time.perf_counter()
+            bundle = joblib.load(ML_DELAY_MODEL_PATH)
+            loaded = LoadedModel(
+                classifier=bundle["classifier"],
+                regressor=bundle["regressor"],
+                leaf_proba=_leaf_proba(bundle["classifier"]),
+                version=bundle.get("model_version", ML_DELAY_MODEL_VERSION),
+                path=ML_DELAY_MODEL_PATH,
+                mtime=mtime,
+                loaded_at=time.time(),
+                load_ms=round((time.perf_counter() - started) * 1000.0, 3),
+            )
+        except Exception as e:
+            _stats["load_errors"] += 1
+            _stats["last_error"] = f"{type(e).__name__}: {e}"
+            print(f"[delay-model] load of {ML_DELAY_MODEL_PATH} failed: {e}")
+            return _model
+
+        if _model is not None:
+            _stats["reloads"] += 1
+        _model = loaded
+        print(f"[delay-model] loaded {loaded.version} from {loaded.path} in {loaded.load_ms} ms")
+        return _model
+
+
+def _leaf_proba(forest: Any) -> list[np.ndarray]:
+    """
+    Normalised the way pipeline_delay._flatten_forest exports them: pickles from
+    older sklearn store class counts in tree_.value, which newer predict_proba
+    averages as if they were fractions.
+    """
+    values = []
+    for est in forest.estimators_:
+        value = est.tree_.value[:, 0, :]
+        values.append(value[:, 1] / value.sum(axis=1))
+    return values
+
+
+def _predict_proba1(model: LoadedModel, X: np.ndarray) -> np.ndarray:
+    """Mean leaf P(class 1) over the trees; equals the delay service's compiled forests."""
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    total = np.zeros(X.shape[0], dtype=np.float64)
+    for est, value in zip(model.classifier.estimators_, model.leaf_proba):
+        total += value.take(est.apply(X))
+    return total / len(model.leaf_proba)
+
+
+def _current_model() -> LoadedModel | None:
+    global _last_check
+    now = time.monotonic()
+    if _last_check is None or now - _last_check >= ML_DELAY_RELOAD_CHECK_S:
+        _last_check = now
+        return load_model()
+    return _model
+
+
+def _predict_sync(X: np.ndarray) -> dict[str, Any] | None:
+    model = _current_model()
+    if model is None:
+        return None
+    prob = _predict_proba1(model, X)
+    delay_min = np.maximum(0.0, model.regressor.predict(X))
+    _stats["predictions"] += 1
+    _stats["rows"] += int(X.shape[0])
+    return {"delay_prob": prob, "expected_delay_min": delay_min, "model_version": model.version}
+
+
+def model_tag() -> str | None:
+    """Version plus file mtime, so a swapped file with the same version string still differs."""
+    model = _model
+    return f"{model.version}@{model.mtime}" if model is not None else None
+
+
+async def predict_matrix(X: np.ndarray) -> dict[str, Any] | None:
+    """
+    Score an (n, 11) feature matrix (ML_FEATURES order) on the worker pool.
+    Returns unrounded arrays, or None when no model could be loaded.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), _predict_sync, X)
+
+
+async def startup() -> None:
+    """Load the model off the event loop at app startup (embedded mode only)."""
+    if embedded_enabled():
+        await asyncio.get_running_loop().run_in_executor(_get_executor(), load_model)
+
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+
+
+def delay_model_stats() -> dict[str, Any]:
+    model = _model
+    return {
+        **_stats,
+        "mode": ML_DELAY_MODE,
+        "loaded": model is not None,
+        "version": model.version if model is not None else None,
+        "path": str(model.path if model is not None else ML_DELAY_MODEL_PATH),
+        "loaded_at": model.loaded_at if model is not None else None,
+        "load_ms": model.load_ms if model is not None else None,
+        "threads": ML_DELAY_THREADS,
+    }
@@ -1,6 +1,39 @@
 from typing import Dict, Any
 from datetime import datetime, timezone
 
+import numpy as np
+
+# Column order of the ML service's feature matrix.
+ML_FEATURES = [
+    "distance_km",
+    "baseline_time_min",
+    "weight_kg",
+    "priority",
+    "hour_of_day",
+    "day_of_week",
+    "temperature_c",
+    "precipitation_mm",
+    "wind_speed_mps",
+    "congestion_index",
+    "avg_speed_kph",
+]
+
+# (min, max) each feature is clamped to, matching the ML service's request schema
+# (None = unbounded); applied again after cache bucketing, which may round past them.
+ML_FEATURE_BOUNDS = {
+    "distance_km": (1.0, None),
+    "baseline_time_min": (1.0, None),
+    "weight_kg": (1.0, None),
+    "priority": (1, 3),
+    "hour_of_day": (0, 23),
+    "day_of_week": (0, 6),
+    "temperature_c": (None, None),
+    "precipitation_mm": (0.0, None),
+    "wind_speed_mps": (0.0, None),
+    "congestion_index": (0.0, 1.0),
+    "avg_speed_kph": (1.0, None),
+}
+
 
 def adapt_to_ml_payload(features: Dict[str, Any]) -> Dict[str, Any]:
     """
@@ -27,3 +60,30 @@ def adapt_to_ml_payload(features: Dict[str, Any]) -> Dict[str, Any]:
     }
 
     return payload
+
+
+def adapt_columns_to_ml_payload(columns: Dict[str, Any], n: int) -> Dict[str, np.ndarray]:
+    """
+    Column-wise version of adapt_to_ml_payload for batch scoring.
+    Each value may be a scalar (broadcast to n rows) or an array of length n;
+    the same defaults and clamps are applied, vectorized.
+    """
+    now = datetime.now(timezone.utc)
+
+    def col(name: str, default: float) -> np.ndarray:
+        value = columns.get(name, default)
+        return np.broadcast_to(np.asarray(value, dtype=np.float64), (n,))
+
+    return {
+        "distance_km": np.maximum(1.0, col("distance_km", 1.0)),
+        "baseline_time_min": np.maximum(1.0, col("baseline_time_min", 30.0)),
+        "weight_kg": np.maximum(1.0, col("weight_kg", 500.0)),
+        "priority": np.clip(np.trunc(col("priority", 2)), 1, 3),
+        "hour_of_day": np.trunc(col("hour_of_day", now.hour)),
+        "day_of_week": np.trunc(col("day_of_week", now.weekday())),
+        "temperature_c": col("temperature_c", 25.0),
+        "precipitation_mm": np.maximum(0.0, col("precipitation_mm", 0.0)),
+        "wind_speed_mps": np.maximum(0.0, col("wind_speed_mps", 2.0)),
+        "congestion_index": np.clip(col("congestion_index", 0.4), 0.0, 1.0),
+        "avg_speed_kph": np.maximum(1.0, col("avg_speed_kph", 35.0)),
+    }
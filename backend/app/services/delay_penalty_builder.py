@@ -1,7 +1,9 @@
 from typing import List, Dict, Any
 from datetime import datetime
 
-from app.services.delay_client import predict_delay
+import numpy as np
+
+from app.services.delay_client import predict_delay_batch
 
 
 async def build_delay_penalties(
@@ -14,39 +16,38 @@ async def build_delay_penalties(
 ) -> List[List[float]]:
     """
     Build delay penalties matrix using ML-1 predictions.
-    
+
+    All off-diagonal cells are scored in a single batched call, and each
+    cell's penalty is then
 
     penalty_ij =
         expected_delay_min
         + delay_prob * base_time_ij
     """
 
-    n = len(time_matrix)
-    penalties = [[0.0] * n for _ in range(n)]
+    time_arr = np.asarray(time_matrix, dtype=np.float64)
+    dist_arr = np.asarray(dist_km, dtype=np.float64)
+    n = time_arr.shape[0]
+    penalties = np.zeros((n, n), dtype=np.float64)
+    if n < 2:
+        return penalties.tolist()
+
+    off_diag = ~np.eye(n, dtype=bool)
     now = datetime.utcnow()
 
-    for i in range(n):
-        for j in range(n):
-            if i == j:
-                continue
-
-            delay = await predict_delay({
-                "distance_km": dist_km[i][j],
-                "baseline_time_min": time_matrix[i][j],
-                "weight_kg": avg_weight,
-                "priority": avg_priority,
-                "hour_of_day": now.hour,
-                "day_of_week": now.weekday(),
-                "temperature_c": weather["temperature_c"],
-                "precipitation_mm": weather["precipitation_mm"],
-                "wind_speed_mps": weather["wind_speed_mps"],
-                "congestion_index": traffic["congestion_index"],
-                "avg_speed_kph": traffic["avg_speed_kph"],
-            })
-
-            penalties[i][j] = (
-                delay["expected_delay_min"]
-                + delay["delay_prob"] * time_matrix[i][j]
-            )
-
-    return penalties
+    delay = await predict_delay_batch({
+        "distance_km": dist_arr[off_diag],
+        "baseline_time_min": time_arr[off_diag],
+        "weight_kg": avg_weight,
+        "priority": avg_priority,
+        "hour_of_day": now.hour,
+        "day_of_week": now.weekday(),
+        "temperature_c": weather["temperature_c"],
+        "precipitation_mm": weather["precipitation_mm"],
+        "wind_speed_mps": weather["wind_speed_mps"],
+        "congestion_index": traffic["congestion_index"],
+        "avg_speed_kph": traffic["avg_speed_kph"],
+    }, n=n * (n - 1))
+
+    penalties[off_diag] = delay["expected_delay_min"] + delay["delay_prob"] * time_arr[off_diag]
+    return penalties.tolist()
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import csv
+import io
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Sequence
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.db.models.event import Event
+
+# Rows per INSERT ... VALUES statement (or per COPY).
+EVENT_INSERT_BATCH_SIZE = int(os.getenv("EVENT_INSERT_BATCH_SIZE", "1000"))
+# auto: COPY on Postgres (psycopg2), multi-row INSERT ... VALUES elsewhere.
+EVENT_INSERT_METHOD = os.getenv("EVENT_INSERT_METHOD", "auto").lower()
+
+_COLUMNS = ("plan_id", "type", "source", "severity", "payload_json", "ts")
+
+
+def event_row(
+    type_: str,
+    payload: dict,
+    *,
+    source: str | None = None,
+    severity: str | None = None,
+    plan_id: str | None = None,
+    ts: datetime | None = None,
+) -> dict[str, Any]:
+    """One `events` row as a dict, with the same defaults an Event() would get."""
+    return {
+        "plan_id": plan_id,
+        "type": type_,
+        "source": source,
+        "severity": severity,
+        "payload_json": payload,
+        "ts": ts or datetime.now(timezone.utc),
+    }
+
+
+def _method(db: Session) -> str:
+    if EVENT_INSERT_METHOD != "auto":
+        return EVENT_INSERT_METHOD
+    bind = db.get_bind()
+    return "copy" if bind.dialect.name == "postgresql" and bind.dialect.driver == "psycopg2" else "values"
+
+
+def _insert_values(db: Session, rows: Sequence[dict[str, Any]]) -> list[int]:
+    """
+    One INSERT ... VALUES (...), (...) ... RETURNING id for the whole batch: a Core
+    executemany, which SQLAlchemy renders as a single multi-row statement per page
+    (a literal .values(rows) would be recompiled for every batch instead).
+    """
+    stmt = insert(Event.__table__).returning(Event.__table__.c.id)
+    result = db.execute(stmt, list(rows), execution_options={"insertmanyvalues_page_size": len(rows)})
+    return [int(i) for i in result.scalars()]
+
+
+def _copy(db: Session, rows: Sequence[dict[str, Any]]) -> None:
+    """COPY ... FROM STDIN (CSV) on the session's own connection, inside its transaction."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([
+            "" if row["plan_id"] is None else row["plan_id"],
+            row["type"],
+            "" if row["source"] is None else row["source"],
+            "" if row["severity"] is None else row["severity"],
+            "" if row["payload_json"] is None else json.dumps(row["payload_json"]),
+            row["ts"].isoformat(),
+        ])
+    buffer.seek(0)
+    dbapi = db.connection().connection.driver_connection
+    with dbapi.cursor() as cur:
+        # unquoted empty fields load as NULL in CSV mode
+        cur.copy_expert(f"COPY events ({', '.join(_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def insert_events(db: Session, rows: Sequence[dict[str, Any]], batch_size: int | None = None) -> dict[str, Any]:
+    """
+    Write event rows (see event_row) in batches of EVENT_INSERT_BATCH_SIZE with
+    one statement each, bypassing the ORM unit of work. The caller commits;
+    committed non-reroute inserts still wake in-process listeners like ORM
+    inserts do (Postgres listeners are woken by the table trigger, which COPY fires too).
+    """
+    batch_size = max(1, batch_size or EVENT_INSERT_BATCH_SIZE)
+    method = _method(db)
+    started = time.perf_counter()
+    rows = [{**event_row(r["type"], r.get("payload_json")), **r} for r in rows]
+
+    for offset in range(0, len(rows), batch_size):
+        batch = rows[offset:offset + batch_size]
+        notify = [r for r in batch if r["type"] != "reroute"]
+        if method == "copy":
+            _copy(db, batch)
+            ids = [0] * len(notify)  # COPY returns no ids; listeners only need to be woken
+        else:
+            ids = _insert_values(db, batch)
+            ids = [i for i, r in zip(ids, batch) if r["type"] != "reroute"]
+        if ids:
+            db.info.setdefault("inserted_event_ids", []).extend(ids)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "rows": len(rows),
+        "batches": -(-len(rows) // batch_size),
+        "method": method,
+        "elapsed_ms": round(elapsed * 1000.0, 3),
+        "rows_per_s": round(len(rows) / elapsed, 1) if rows and elapsed > 0 else None,
+    }
@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import asyncio
+import os
+from typing import Any
+
+from sqlalchemy import event as sa_event, text
+from sqlalchemy.orm import Session
+
+from app.db.models.event import Event
+from app.db.session import engine
+
+# auto: Postgres LISTEN/NOTIFY when the database is Postgres, the in-process bus otherwise.
+EVENT_NOTIFY_BACKEND = os.getenv("EVENT_NOTIFY_BACKEND", "auto").lower()
+EVENT_NOTIFY_CHANNEL = os.getenv("EVENT_NOTIFY_CHANNEL", "events_inserted")
+
+# Same function/trigger as infra/postgres/init/10_schema.sql, for databases created before it
+# (or with a custom channel). Installed at most once, see ensure_trigger().
+_TRIGGER_FUNCTION_SQL = f"""
+CREATE OR REPLACE FUNCTION notify_event_insert() RETURNS trigger AS $$
+BEGIN
+  PERFORM pg_notify('{EVENT_NOTIFY_CHANNEL}', NEW.id::text);
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql
+"""
+_TRIGGER_SQL = """
+CREATE TRIGGER trg_events_notify
+AFTER INSERT ON events
+FOR EACH ROW WHEN (NEW.type <> 'reroute') EXECUTE FUNCTION notify_event_insert()
+"""
+_TRIGGER_STATE_SQL = """
+SELECT
+  EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'trg_events_notify' AND tgrelid = 'events'::regclass),
+  (SELECT prosrc FROM pg_proc WHERE proname = 'notify_event_insert' LIMIT 1)
+"""
+
+
+def ensure_trigger() -> bool:
+    """
+    Read-only catalog check; the DDL only runs when the trigger is missing or
+    notifies another channel. Returns True if anything was installed.
+    """
+    with engine.begin() as conn:
+        has_trigger, source = conn.execute(text(_TRIGGER_STATE_SQL)).one()
+        if has_trigger and source and f"'{EVENT_NOTIFY_CHANNEL}'" in source:
+            return False
+        conn.execute(text(_TRIGGER_FUNCTION_SQL))
+        if not has_trigger:
+            conn.execute(text(_TRIGGER_SQL))
+    print(f"[notify] installed events trigger for channel '{EVENT_NOTIFY_CHANNEL}'")
+    return True
+
+
+class LocalNotifier:
+    """
+    In-process stand-in for LISTEN/NOTIFY: committed Event inserts made through
+    any Session in this process wake the waiter (see _publish_committed_events).
+    """
+
+    name = "local"
+
+    def __init__(self) -> None:
+        self._wake: asyncio.Event | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self.notifications = 0
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        _local_notifiers.append(self)
+
+    def publish(self, event_ids: list[int]) -> None:
+        # may be called from a worker thread (sync endpoints run in a threadpool)
+        if self._loop is None or self._wake is None:
+            return
+        self.notifications += len(event_ids)
+        self._loop.call_soon_threadsafe(self._wake.set)
+
+    async def wait(self, timeout: float) -> bool:
+        """True if woken by a notification, False on timeout (time for a catch-up poll)."""
+        assert self._wake is not None
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return False
+        self._wake.clear()
+        return True
+
+    async def close(self) -> None:
+        if self in _local_notifiers:
+            _local_notifiers.remove(self)
+
+
+class PostgresNotifier(LocalNotifier):
+    """LISTEN on a dedicated psycopg2 connection, polled via the event loop's reader."""
+
+    name = "postgres"
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._conn: Any = None
+        self._trigger_checked = False
+
+    async def start(self) -> None:
+        await super().start()
+        self._connect()
+
+    def _check_trigger(self) -> None:
+        try:
+            ensure_trigger()
+            self._trigger_checked = True
+        except Exception as e:
+            print(f"[notify] could not check the events trigger: {e}")
+
+    def _connect(self) -> None:
+        """LISTEN only; the trigger is checked once per process, not per reconnect."""
+        if not self._trigger_checked:
+            self._check_trigger()
+        try:
+            raw = engine.raw_connection()
+            raw.detach()  # keep it out of the pool; it lives as long as the notifier
+            dbapi = raw.driver_connection
+            dbapi.autocommit = True
+            with dbapi.cursor() as cur:
+                cur.execute(f"LISTEN {EVENT_NOTIFY_CHANNEL}")
+            self._loop.add_reader(dbapi.fileno(), self._on_readable)
+            self._conn = dbapi
+            print(f"[notify] listening on '{EVENT_NOTIFY_CHANNEL}'")
+        except Exception as e:
+            self._conn = None
+            print(f"[notify] LISTEN unavailable, relying on polling: {e}")
+
+    def _on_readable(self) -> None:
+        try:
+            self._conn.poll()
+        except Exception as e:
+            print(f"[notify] listener connection lost: {e}")
+            self._drop()
+            self._wake.set()  # trigger an immediate catch-up scan
+            return
+        ids = []
+        while self._conn.notifies:
+            note = self._conn.notifies.pop(0)
+            ids.append(int(note.payload) if note.payload.isdigit() else 0)
+        if ids:
+            self.publish(ids)
+
+    def _drop(self) -> None:
+        if self._conn is None:
+            return
+        try:
+            self._loop.remove_reader(self._conn.fileno())
+            self._conn.close()
+        except Exception:
+            pass
+        self._conn = None
+
+    async def wait(self, timeout: float) -> bool:
+        if self._conn is None:
+            self._connect()  # retry LISTEN on every catch-up cycle
+        return await super().wait(timeout)
+
+    async def close(self) -> None:
+        self._drop()
+        await super().close()
+
+
+_local_notifiers: list[LocalNotifier] = []
+
+
+def make_notifier() -> LocalNotifier:
+    backend = EVENT_NOTIFY_BACKEND
+    if backend == "auto":
+        backend = "postgres" if engine.dialect.name == "postgresql" else "local"
+    return PostgresNotifier() if backend == "postgres" else LocalNotifier()
+
+
+@sa_event.listens_for(Session, "after_flush")
+def _collect_event_inserts(session: Session, flush_context) -> None:
+    ids = [int(obj.id) for obj in session.new if isinstance(obj, Event) and obj.id is not None and obj.type != "reroute"]
+    if ids:
+        session.info.setdefault("inserted_event_ids", []).extend(ids)
+
+
+@sa_event.listens_for(Session, "after_commit")
+def _publish_committed_events(session: Session) -> None:
+    ids = session.info.pop("inserted_event_ids", None)
+    if ids:
+        for notifier in list(_local_notifiers):
+            if notifier.name == "local":
+                notifier.publish(ids)
+
+
+@sa_event.listens_for(Session, "after_rollback")
+def _discard_event_inserts(session: Session) -> None:
+    session.info.pop("inserted_event_ids", None)
@@ -0,0 +1,344 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Iterable
+
+import numpy as np
+from sqlalchemy import Float, cast, func, select
+from sqlalchemy.orm import Session
+
+from app.db.models.edge import Edge
+from app.db.models.location import Location
+from app.services.geo import haversine_km
+from app.services.mode_params import MODE_PARAMS
+
+# How often (seconds) the cached graph re-checks the edges table fingerprint.
+GRAPH_CACHE_CHECK_SECONDS = float(os.getenv("GRAPH_CACHE_CHECK_SECONDS", "30"))
+# Max number of (objective, modes) weight vectors kept per compiled graph.
+GRAPH_WEIGHT_CACHE_SIZE = int(os.getenv("GRAPH_WEIGHT_CACHE_SIZE", "32"))
+
+MODE_CODES = {"road": 0, "rail": 1, "sea": 2, "air": 3, "transfer": 4}
+MODE_NAMES = {code: mode for mode, code in MODE_CODES.items()}
+
+
+@dataclass
+class CompiledGraph:
+    """
+    CSR adjacency of the `edges` table.
+    Outgoing edges of node index i live at positions offsets[i]:offsets[i + 1]
+    of every per-edge array; rev_offsets/rev_edges index the same edges by target
+    for backward search.
+    """
+    version: int
+    fingerprint: tuple
+    node_ids: np.ndarray       # node index -> location id
+    lat: np.ndarray            # per node, NaN when the location row is missing
+    lon: np.ndarray
+    offsets: np.ndarray        # len(node_ids) + 1
+    sources: np.ndarray        # per edge: source node index
+    targets: np.ndarray        # per edge: target node index
+    edge_ids: np.ndarray       # per edge: Edge.id
+    mode_codes: np.ndarray     # per edge: MODE_CODES value
+    distance_km: np.ndarray
+    time_min: np.ndarray
+    cost: np.ndarray
+    co2e_kg: np.ndarray
+    shapes: dict[int, Any] = field(default_factory=dict)  # Edge.id -> shape_json (non-null only)
+    built_at: float = field(default_factory=time.time)
+    patched: bool = False      # weights edited in place since compile (see update_edge_weights)
+    node_index: dict[int, int] = field(default_factory=dict)
+    edge_pos: dict[int, int] = field(default_factory=dict)
+    offsets_list: list[int] = field(default_factory=list)
+    sources_list: list[int] = field(default_factory=list)
+    targets_list: list[int] = field(default_factory=list)
+    rev_offsets_list: list[int] = field(default_factory=list)
+    rev_edges_list: list[int] = field(default_factory=list)
+    # mode code -> minimum (time, cost, co2e) per great-circle km over its edges
+    min_rates: dict[int, tuple[float, float, float]] = field(default_factory=dict)
+    _weights: dict[tuple, list[float]] = field(default_factory=dict)
+
+    def __post_init__(self) -> None:
+        self.node_index = {int(loc_id): idx for idx, loc_id in enumerate(self.node_ids.tolist())}
+        self.edge_pos = {int(edge_id): pos for pos, edge_id in enumerate(self.edge_ids.tolist())}
+        # Plain lists are much faster than numpy scalars inside the Python heap loop.
+        self.offsets_list = self.offsets.tolist()
+        self.sources_list = self.sources.tolist()
+        self.targets_list = self.targets.tolist()
+
+        rev_order = np.argsort(self.targets, kind="stable")
+        rev_offsets = np.zeros(self.num_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.targets, minlength=self.num_nodes), out=rev_offsets[1:])
+        self.rev_offsets_list = rev_offsets.tolist()
+        self.rev_edges_list = rev_order.tolist()
+        self._compute_min_rates()
+
+    def _compute_min_rates(self) -> None:
+        if self.num_edges == 0 or np.isnan(self.lat).any():
+            return
+        gc_km = haversine_km(
+            self.lat[self.sources], self.lon[self.sources], self.lat[self.targets], self.lon[self.targets]
+        )
+        for code in np.unique(self.mode_codes).tolist():
+            mask = (self.mode_codes == code) & (gc_km > 1e-6)
+            if not mask.any():
+                continue
+            self.min_rates[int(code)] = (
+                float(np.min(self.time_min[mask] / gc_km[mask])),
+                float(np.min(self.cost[mask] / gc_km[mask])),
+                float(np.min(self.co2e_kg[mask] / gc_km[mask])),
+            )
+
+    @property
+    def num_nodes(self) -> int:
+        return int(self.node_ids.shape[0])
+
+    @property
+    def num_edges(self) -> int:
+        return int(self.edge_ids.shape[0])
+
+    def weights(self, objective: dict[str, float], allowed_modes: Iterable[str]) -> list[float]:
+        """
+        Per-edge scalarised weights for an objective; edges whose mode is not
+        allowed (transfer is always allowed) get +inf.
+        """
+        modes = frozenset(allowed_modes) | {"transfer"}
+        key = (
+            float(objective.get("time", 0.0)),
+            float(objective.get("cost", 0.0)),
+            float(objective.get("co2e", 0.0)),
+            modes,
+        )
+        cached = self._weights.get(key)
+        if cached is not None:
+            return cached
+
+        weights = key[0] * self.time_min + key[1] * self.cost + key[2] * self.co2e_kg
+        allowed_codes = [MODE_CODES[m] for m in modes if m in MODE_CODES]
+        weights = np.where(np.isin(self.mode_codes, allowed_codes), weights, np.inf)
+        out = weights.tolist()
+
+        if len(self._weights) >= GRAPH_WEIGHT_CACHE_SIZE:
+            self._weights.pop(next(iter(self._weights)))
+        self._weights[key] = out
+        return out
+
+    def heuristic(self, target: int, objective: dict[str, float], allowed_modes: Iterable[str]) -> list[float] | None:
+        """
+        Admissible A* potential: great-circle km to `target` times the cheapest
+        per-km rate any allowed mode can achieve, scaled by the objective weights.
+        Per-mode rates are the lower of the MODE_PARAMS figure (fastest speed_kph,
+        cost_per_km, emission_kg_per_km) and what the compiled edges actually
+        realise, so the bound stays admissible on real data.
+        Returns None when no usable bound exists (falls back to Dijkstra).
+        """
+        modes = set(allowed_modes) | {"transfer"}
+        rates: list[tuple[float, float, float]] = []
+        for mode in modes:
+            code = MODE_CODES.get(mode)
+            if code is None or code not in self.min_rates:
+                continue
+            data_time, data_cost, data_co2e = self.min_rates[code]
+            params = MODE_PARAMS.get(mode)
+            if params is not None:
+                data_time = min(data_time, 60.0 / params["speed_kph"])
+                data_cost = min(data_cost, params["cost_per_km"])
+                data_co2e = min(data_co2e, params["emission_kg_per_km"])
+            rates.append((data_time, data_cost, data_co2e))
+        if not rates:
+            return None
+
+        per_km = (
+            objective.get("time", 0.0) * min(r[0] for r in rates)
+            + objective.get("cost", 0.0) * min(r[1] for r in rates)
+            + objective.get("co2e", 0.0) * min(r[2] for r in rates)
+        )
+        if per_km <= 0.0:
+            return None
+        gc_km = haversine_km(self.lat, self.lon, self.lat[target], self.lon[target])
+        return (gc_km * per_km).tolist()
+
+
+_lock = threading.Lock()
+_graph: CompiledGraph | None = None
+_dirty = False
+_last_check = 0.0
+_stats: dict[str, Any] = {
+    "version": 0,
+    "rebuilds": 0,
+    "incremental_updates": 0,
+    "last_rebuild_ms": None,
+    "total_rebuild_ms": 0.0,
+    "last_rebuild_at": None,
+}
+
+
+def _fingerprint(db: Session) -> tuple:
+    """
+    Cheap aggregates over edges; changes whenever rows are added or removed or
+    any compiled column (endpoints, mode, distance, weights) is edited. Sums
+    are weighted by id so that moving a value between edges shows too, and
+    modes are counted per group since text can't be summed.
+    """
+    def weighted(column):
+        return func.coalesce(func.sum(cast(Edge.id, Float) * cast(column, Float)), 0.0)
+
+    row = db.execute(
+        select(
+            func.count(Edge.id),
+            func.coalesce(func.max(Edge.id), 0),
+            weighted(Edge.from_id),
+            weighted(Edge.to_id),
+            weighted(Edge.distance_km),
+            weighted(Edge.base_time_min),
+            weighted(Edge.base_cost),
+            weighted(func.coalesce(Edge.co2e_kg, -1.0)),
+        )
+    ).one()
+    modes = db.execute(
+        select(Edge.mode, func.count(Edge.id), func.sum(cast(Edge.id, Float))).group_by(Edge.mode).order_by(Edge.mode)
+    ).all()
+    # flat scalars only: the fingerprint is saved with contraction hierarchies as JSON
+    return tuple(float(v) for v in row) + tuple(v for mode, n, ids in modes for v in (mode, float(n), float(ids)))
+
+
+def _compile(db: Session, version: int, fingerprint: tuple) -> CompiledGraph:
+    rows = db.execute(
+        select(
+            Edge.id,
+            Edge.from_id,
+            Edge.to_id,
+            Edge.mode,
+            Edge.distance_km,
+            Edge.base_time_min,
+            Edge.base_cost,
+            Edge.co2e_kg,
+            Edge.shape_json,
+        )
+    ).all()
+
+    from_ids = np.array([int(r.from_id) for r in rows], dtype=np.int64)
+    to_ids = np.array([int(r.to_id) for r in rows], dtype=np.int64)
+    node_ids = np.unique(np.concatenate([from_ids, to_ids]))
+
+    coords = {
+        int(r.id): (float(r.lat), float(r.lon))
+        for r in db.execute(select(Location.id, Location.lat, Location.lon)).all()
+    }
+    node_coords = np.array(
+        [coords.get(int(loc_id), (np.nan, np.nan)) for loc_id in node_ids.tolist()], dtype=np.float64
+    ).reshape(-1, 2)
+
+    src = np.searchsorted(node_ids, from_ids)
+    order = np.argsort(src, kind="stable")
+    counts = np.bincount(src, minlength=node_ids.shape[0])
+    offsets = np.zeros(node_ids.shape[0] + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    def column(values: list, dtype) -> np.ndarray:
+        return np.asarray(values, dtype=dtype)[order]
+
+    return CompiledGraph(
+        version=version,
+        fingerprint=fingerprint,
+        node_ids=node_ids,
+        lat=node_coords[:, 0],
+        lon=node_coords[:, 1],
+        offsets=offsets,
+        sources=src[order].astype(np.int64),
+        targets=np.searchsorted(node_ids, to_ids)[order].astype(np.int64),
+        edge_ids=column([int(r.id) for r in rows], np.int64),
+        mode_codes=column([MODE_CODES.get(str(r.mode), -1) for r in rows], np.int8),
+        distance_km=column([float(r.distance_km) for r in rows], np.float64),
+        time_min=column([float(r.base_time_min) for r in rows], np.float64),
+        cost=column([float(r.base_cost) for r in rows], np.float64),
+        co2e_kg=column([float(r.co2e_kg or 0.0) for r in rows], np.float64),
+        shapes={int(r.id): r.shape_json for r in rows if r.shape_json is not None},
+    )
+
+
+def get_compiled_graph(db: Session, *, force: bool = False) -> CompiledGraph:
+    """
+    Return the process-wide compiled graph, rebuilding it when it was
+    invalidated or the edges fingerprint moved since the last check.
+    """
+    global _graph, _dirty, _last_check
+
+    now = time.monotonic()
+    graph = _graph
+    if graph is not None and not force and not _dirty and now - _last_check < GRAPH_CACHE_CHECK_SECONDS:
+        return graph
+
+    with _lock:
+        fingerprint = _fingerprint(db)
+        _last_check = time.monotonic()
+        if _graph is not None and not force and not _dirty and _graph.fingerprint == fingerprint:
+            return _graph
+
+        started = time.perf_counter()
+        _graph = _compile(db, version=_stats["version"] + 1, fingerprint=fingerprint)
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        _dirty = False
+
+        _stats["version"] = _graph.version
+        _stats["rebuilds"] += 1
+        _stats["last_rebuild_ms"] = round(elapsed_ms, 3)
+        _stats["total_rebuild_ms"] = round(_stats["total_rebuild_ms"] + elapsed_ms, 3)
+        _stats["last_rebuild_at"] = _graph.built_at
+        print(f"[graph] compiled v{_graph.version}: {_graph.num_nodes} nodes, {_graph.num_edges} edges in {elapsed_ms:.1f} ms")
+        return _graph
+
+
+def invalidate_graph() -> None:
+    """Mark the cached graph stale; the next query rebuilds it."""
+    global _dirty
+    _dirty = True
+
+
+def update_edge_weights(
+    edge_id: int,
+    *,
+    base_time_min: float | None = None,
+    base_cost: float | None = None,
+    co2e_kg: float | None = None,
+) -> bool:
+    """
+    Patch one edge's weights in place without recompiling the topology.
+    Returns False when the edge is unknown (caller should invalidate_graph()).
+    """
+    graph = _graph
+    if graph is None:
+        return False
+    pos = graph.edge_pos.get(int(edge_id))
+    if pos is None:
+        return False
+
+    with _lock:
+        if base_time_min is not None:
+            graph.time_min[pos] = float(base_time_min)
+        if base_cost is not None:
+            graph.cost[pos] = float(base_cost)
+        if co2e_kg is not None:
+            graph.co2e_kg[pos] = float(co2e_kg)
+        graph._weights.clear()
+        graph.min_rates.clear()
+        graph._compute_min_rates()
+        graph.patched = True
+        graph.version = _stats["version"] + 1
+        _stats["version"] = graph.version
+        _stats["incremental_updates"] += 1
+    return True
+
+
+def graph_cache_stats() -> dict[str, Any]:
+    graph = _graph
+    return {
+        **_stats,
+        "loaded": graph is not None,
+        "stale": _dirty,
+        "nodes": graph.num_nodes if graph is not None else 0,
+        "edges": graph.num_edges if graph is not None else 0,
+        "age_s": round(time.time() - graph.built_at, 1) if graph is not None else None,
+    }
@@ -1,14 +1,21 @@
 from __future__ import annotations
 
 import heapq
+import os
+import time
 from dataclasses import dataclass
 from typing import Iterable
 
+import numpy as np
+
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
-from app.db.models.edge import Edge
 from app.db.models.location import Location
+from app.services.contraction import find_hierarchy
+from app.services.graph_cache import GRAPH_WEIGHT_CACHE_SIZE, MODE_NAMES, CompiledGraph, get_compiled_graph
+from app.services.location_index import LocationPoint, get_location_index, nearest_locations
+from app.services.traffic_overlay import OverlaySnapshot, live_snapshot
 
 
 @dataclass
@@ -24,17 +31,169 @@ class GraphLeg:
     shape_json: list[list[float]] | None = None
 
 
-def _edge_weight(edge: Edge, objective: dict[str, float]) -> float:
-    return (
-        objective.get("time", 0.0) * float(edge.base_time_min)
-        + objective.get("cost", 0.0) * float(edge.base_cost)
-        + objective.get("co2e", 0.0) * float(edge.co2e_kg or 0.0)
-    )
+SEARCH_ENGINES = ("dijkstra", "astar", "bidirectional", "ch")
+GRAPH_SEARCH_ENGINE = os.getenv("GRAPH_SEARCH_ENGINE", "dijkstra")
+
+
+@dataclass
+class SearchStats:
+    engine: str = "dijkstra"
+    nodes_settled: int = 0
+    edges_relaxed: int = 0
+    elapsed_ms: float = 0.0
+    overlay_version: int | None = None  # traffic overlay applied to this query, if any
+    ch_bypass: str | None = None  # why a usable hierarchy was not used under the overlay
+
+
+_search_totals: dict[str, dict[str, float]] = {
+    engine: {"queries": 0, "nodes_settled": 0, "edges_relaxed": 0, "total_ms": 0.0}
+    for engine in SEARCH_ENGINES
+}
+
+
+# Queries that had a usable hierarchy while traffic factors hit the graph:
+# kept = CH path carries no factor and all factors are slowdowns, so it is still optimal;
+# bypass_speedup = some factor < 1 could make a non-CH path cheaper; bypass_path = a factor
+# sits on the CH path itself. Both bypasses re-run the search on overlaid weights.
+_ch_overlay_totals: dict[str, int] = {"kept": 0, "bypass_speedup": 0, "bypass_path": 0}
+
+# (graph, graph version, overlay version, objective, modes) -> weights with traffic applied
+_overlay_weights: dict[tuple, list[float]] = {}
+
+
+def _weights_with_overlay(
+    graph: CompiledGraph,
+    objective: dict[str, float],
+    allowed_modes: list[str],
+    overlay: OverlaySnapshot,
+    multipliers,
+) -> list[float]:
+    """Static weights with each edge's time term scaled by its traffic multiplier."""
+    key = (id(graph), graph.version, overlay.version, tuple(sorted(objective.items())), frozenset(allowed_modes))
+    cached = _overlay_weights.get(key)
+    if cached is not None:
+        return cached
+    base = np.asarray(graph.weights(objective, allowed_modes))
+    extra = float(objective.get("time", 0.0)) * graph.time_min * (multipliers - 1.0)
+    out = (base + extra).tolist()  # inf (disallowed mode) stays inf
+    if len(_overlay_weights) >= GRAPH_WEIGHT_CACHE_SIZE:
+        _overlay_weights.pop(next(iter(_overlay_weights)))
+    _overlay_weights[key] = out
+    return out
+
+
+def _unwind(previous: dict[int, tuple[int, int]], start: int, stop: int) -> list[int]:
+    """Follow predecessor links from `start` back to `stop`; edge positions in walk order."""
+    path: list[int] = []
+    current = start
+    while current != stop:
+        current, pos = previous[current]
+        path.append(pos)
+    return path
+
+
+def _dijkstra(
+    graph: CompiledGraph,
+    source: int,
+    target: int,
+    weights: list[float],
+    stats: SearchStats,
+    potential: list[float] | None = None,
+) -> list[int] | None:
+    """
+    Shortest path over the CSR arrays; returns edge positions in order, or None.
+    With a `potential` (admissible lower bound to target per node) this is A*.
+    """
+    offsets = graph.offsets_list
+    targets = graph.targets_list
+    inf = float("inf")
+
+    frontier: list[tuple[float, int]] = [(potential[source] if potential else 0.0, source)]
+    best_cost = {source: 0.0}
+    previous: dict[int, tuple[int, int]] = {}
+
+    while frontier:
+        key, node = heapq.heappop(frontier)
+        if node == target:
+            break
+        current_cost = best_cost[node]
+        if key > current_cost + (potential[node] if potential else 0.0):
+            continue
+        stats.nodes_settled += 1
+
+        for pos in range(offsets[node], offsets[node + 1]):
+            weight = weights[pos]
+            if weight == inf:
+                continue
+            stats.edges_relaxed += 1
+            next_node = targets[pos]
+            path_cost = current_cost + weight
+            if path_cost < best_cost.get(next_node, inf):
+                best_cost[next_node] = path_cost
+                previous[next_node] = (node, pos)
+                heapq.heappush(
+                    frontier, (path_cost + (potential[next_node] if potential else 0.0), next_node)
+                )
+
+    if target not in previous:
+        return None
+    path = _unwind(previous, target, source)
+    path.reverse()
+    return path
 
 
-def _allowed(mode: str, allowed_modes: Iterable[str]) -> bool:
-    allowed = set(allowed_modes)
-    return mode in allowed or mode == "transfer"
+def _bidirectional(
+    graph: CompiledGraph,
+    source: int,
+    target: int,
+    weights: list[float],
+    stats: SearchStats,
+) -> list[int] | None:
+    """Bidirectional Dijkstra: forward from source over CSR, backward from target over the reverse index."""
+    offsets, targets = graph.offsets_list, graph.targets_list
+    rev_offsets, rev_edges, sources = graph.rev_offsets_list, graph.rev_edges_list, graph.sources_list
+    inf = float("inf")
+
+    dist = ({source: 0.0}, {target: 0.0})
+    previous: tuple[dict[int, tuple[int, int]], dict[int, tuple[int, int]]] = ({}, {})
+    frontier: tuple[list[tuple[float, int]], list[tuple[float, int]]] = ([(0.0, source)], [(0.0, target)])
+    best_total = inf
+    meeting: int | None = None
+
+    while frontier[0] and frontier[1]:
+        if frontier[0][0][0] + frontier[1][0][0] >= best_total:
+            break
+        side = 0 if frontier[0][0][0] <= frontier[1][0][0] else 1
+        current_cost, node = heapq.heappop(frontier[side])
+        if current_cost > dist[side].get(node, inf):
+            continue
+        stats.nodes_settled += 1
+
+        if side == 0:
+            positions = range(offsets[node], offsets[node + 1])
+        else:
+            positions = (rev_edges[i] for i in range(rev_offsets[node], rev_offsets[node + 1]))
+        own, other = dist[side], dist[1 - side]
+        for pos in positions:
+            weight = weights[pos]
+            if weight == inf:
+                continue
+            stats.edges_relaxed += 1
+            next_node = targets[pos] if side == 0 else sources[pos]
+            path_cost = current_cost + weight
+            if path_cost < own.get(next_node, inf):
+                own[next_node] = path_cost
+                previous[side][next_node] = (node, pos)
+                heapq.heappush(frontier[side], (path_cost, next_node))
+                if next_node in other and path_cost + other[next_node] < best_total:
+                    best_total = path_cost + other[next_node]
+                    meeting = next_node
+
+    if meeting is None:
+        return None
+    path = _unwind(previous[0], meeting, source)
+    path.reverse()
+    return path + _unwind(previous[1], meeting, target)
 
 
 def compute_graph_route(
@@ -44,72 +203,144 @@ def compute_graph_route(
     destination_id: int,
     allowed_modes: list[str],
     objective: dict[str, float],
+    engine: str | None = None,
+    stats: SearchStats | None = None,
+    overlay: OverlaySnapshot | None = None,
 ) -> list[GraphLeg]:
-    edges = (
-        db.execute(select(Edge).where(Edge.mode.in_(allowed_modes + ["transfer"])))
-        .scalars()
-        .all()
-    )
-    adjacency: dict[int, list[Edge]] = {}
-    for edge in edges:
-        adjacency.setdefault(int(edge.from_id), []).append(edge)
-
-    frontier: list[tuple[float, int]] = [(0.0, origin_id)]
-    best_cost = {origin_id: 0.0}
-    previous: dict[int, tuple[int, Edge]] = {}
+    """
+    Best route by the scalarised objective. Live traffic factors (or the given
+    overlay snapshot, for a reproducible query) scale edge travel times.
+    Precomputed hierarchies encode static weights, so under traffic a CH path
+    is only kept when no factor touches it and none is below 1.0 (slowdowns
+    elsewhere can only make other paths dearer); otherwise the search re-runs
+    on the overlaid weights.
+    """
+    if engine is not None and engine not in SEARCH_ENGINES:
+        raise ValueError(f"Unknown search engine: {engine}")
+    stats = stats or SearchStats()
 
-    while frontier:
-        current_cost, node_id = heapq.heappop(frontier)
-        if node_id == destination_id:
-            break
-        if current_cost > best_cost.get(node_id, float("inf")):
-            continue
+    graph = get_compiled_graph(db)
+    source = graph.node_index.get(origin_id)
+    target = graph.node_index.get(destination_id)
+    if source is None or target is None or source == target:
+        return []
 
-        for edge in adjacency.get(node_id, []):
-            if not _allowed(edge.mode, allowed_modes):
-                continue
-            next_id = int(edge.to_id)
-            path_cost = current_cost + _edge_weight(edge, objective)
-            if path_cost < best_cost.get(next_id, float("inf")):
-                best_cost[next_id] = path_cost
-                previous[next_id] = (node_id, edge)
-                heapq.heappush(frontier, (path_cost, next_id))
-
-    if destination_id not in previous and destination_id != origin_id:
+    overlay = overlay if overlay is not None else live_snapshot(db)
+    multipliers = overlay.multipliers(graph) if overlay is not None else None
+    stats.overlay_version = overlay.version if multipliers is not None else None
+
+    # factors only enter the weights through the time term
+    if multipliers is not None and float(objective.get("time", 0.0)) == 0.0:
+        weight_multipliers = None
+    else:
+        weight_multipliers = multipliers
+
+    # A matching precomputed hierarchy wins unless the caller pinned a plain engine.
+    hierarchy = find_hierarchy(graph, allowed_modes, objective) if engine in (None, "ch") else None
+    if hierarchy is not None and weight_multipliers is not None and float(weight_multipliers.min()) < 1.0:
+        stats.ch_bypass = "bypass_speedup"
+        hierarchy = None
+    if hierarchy is None and engine in (None, "ch"):
+        engine = GRAPH_SEARCH_ENGINE if GRAPH_SEARCH_ENGINE != "ch" else "dijkstra"
+    stats.engine = engine = "ch" if hierarchy is not None else engine
+
+    started = time.perf_counter()
+    path = None
+    if hierarchy is not None:
+        edge_ids = hierarchy.query(origin_id, destination_id, stats)
+        path = [graph.edge_pos[edge_id] for edge_id in edge_ids] if edge_ids else None
+        if weight_multipliers is not None:
+            if path is not None and any(weight_multipliers[pos] != 1.0 for pos in path):
+                stats.ch_bypass = "bypass_path"
+                stats.engine = engine = GRAPH_SEARCH_ENGINE if GRAPH_SEARCH_ENGINE != "ch" else "dijkstra"
+            else:
+                _ch_overlay_totals["kept"] += 1
+    if engine != "ch":
+        if weight_multipliers is None:
+            weights = graph.weights(objective, allowed_modes)
+        else:
+            weights = _weights_with_overlay(graph, objective, allowed_modes, overlay, weight_multipliers)
+        if engine == "bidirectional":
+            path = _bidirectional(graph, source, target, weights, stats)
+        else:
+            potential = graph.heuristic(target, objective, allowed_modes) if engine == "astar" else None
+            if potential is not None and weight_multipliers is not None and overlay.min_factor < 1.0:
+                # a factor below 1 can undercut the static lower bound; shrink it to stay admissible
+                potential = [p * overlay.min_factor for p in potential]
+            path = _dijkstra(graph, source, target, weights, stats, potential=potential)
+    if stats.ch_bypass is not None:
+        _ch_overlay_totals[stats.ch_bypass] += 1
+    stats.elapsed_ms = (time.perf_counter() - started) * 1000.0
+
+    totals = _search_totals[engine]
+    totals["queries"] += 1
+    totals["nodes_settled"] += stats.nodes_settled
+    totals["edges_relaxed"] += stats.edges_relaxed
+    totals["total_ms"] += stats.elapsed_ms
+
+    if path is None:
         return []
 
     route_edges: list[GraphLeg] = []
-    current = destination_id
-    while current != origin_id:
-        prev_node, edge = previous[current]
+    for pos in path:
+        edge_id = int(graph.edge_ids[pos])
         route_edges.append(
             GraphLeg(
-                edge_id=int(edge.id),
-                from_id=int(edge.from_id),
-                to_id=int(edge.to_id),
-                mode=str(edge.mode),
-                distance_km=float(edge.distance_km),
-                time_min=float(edge.base_time_min),
-                cost=float(edge.base_cost),
-                co2e_kg=float(edge.co2e_kg or 0.0),
-                shape_json=edge.shape_json,  # type: ignore[arg-type]
+                edge_id=edge_id,
+                from_id=int(graph.node_ids[graph.sources_list[pos]]),
+                to_id=int(graph.node_ids[graph.targets_list[pos]]),
+                mode=MODE_NAMES.get(int(graph.mode_codes[pos]), "road"),
+                distance_km=float(graph.distance_km[pos]),
+                time_min=float(graph.time_min[pos] * (multipliers[pos] if multipliers is not None else 1.0)),
+                cost=float(graph.cost[pos]),
+                co2e_kg=float(graph.co2e_kg[pos]),
+                shape_json=graph.shapes.get(edge_id),
             )
         )
-        current = prev_node
-
-    route_edges.reverse()
     return route_edges
 
 
-def resolve_location_by_id(db: Session, location_id: int) -> Location | None:
-    return db.get(Location, location_id)
+def graph_search_stats() -> dict[str, dict[str, float]]:
+    out: dict[str, dict[str, float]] = {"ch_under_overlay": dict(_ch_overlay_totals)}
+    for engine, totals in _search_totals.items():
+        queries = max(1, int(totals["queries"]))
+        out[engine] = {
+            **totals,
+            "total_ms": round(totals["total_ms"], 3),
+            "avg_nodes_settled": round(totals["nodes_settled"] / queries, 1),
+            "avg_edges_relaxed": round(totals["edges_relaxed"] / queries, 1),
+            "avg_ms": round(totals["total_ms"] / queries, 3),
+        }
+    return out
 
 
-def resolve_nearest_location(db: Session, lat: float, lon: float) -> Location | None:
-    locations = db.execute(select(Location)).scalars().all()
-    if not locations:
-        return None
-    return min(
-        locations,
-        key=lambda location: (float(location.lat) - lat) ** 2 + (float(location.lon) - lon) ** 2,
-    )
+def resolve_location_by_id(db: Session, location_id: int) -> LocationPoint | None:
+    return resolve_locations_by_ids(db, [location_id]).get(location_id)
+
+
+def resolve_locations_by_ids(db: Session, location_ids: Iterable[int]) -> dict[int, LocationPoint]:
+    """
+    Coordinates for many locations at once: served from the spatial index's
+    in-memory rows, with a single IN query for anything it has not seen yet.
+    """
+    wanted = set(location_ids)
+    by_id = get_location_index(db).by_id
+    found = {loc_id: by_id[loc_id] for loc_id in wanted if loc_id in by_id}
+    missing = wanted - found.keys()
+    if missing:
+        rows = db.execute(
+            select(Location.id, Location.name, Location.type, Location.lat, Location.lon).where(Location.id.in_(missing))
+        ).all()
+        for r in rows:
+            found[int(r.id)] = LocationPoint(int(r.id), r.name, r.type, float(r.lat), float(r.lon))
+    return found
+
+
+def resolve_nearest_location(
+    db: Session,
+    lat: float,
+    lon: float,
+    types: Iterable[str] | None = None,
+) -> LocationPoint | None:
+    nearest = nearest_locations(db, lat, lon, k=1, types=types)
+    return nearest[0][0] if nearest else None
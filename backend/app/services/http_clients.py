@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import socket
+from dataclasses import dataclass, field
+from typing import Any
+
+import httpx
+
+# Shared pool sizing for every upstream (OSRM, Open-Meteo, ML delay service).
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY_S = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_S", "30"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "1") not in ("0", "false", "False")
+
+try:  # HTTP/2 needs the optional `h2` package (httpx[http2])
+    import h2  # noqa: F401
+    _H2_AVAILABLE = True
+except ImportError:
+    _H2_AVAILABLE = False
+
+
+@dataclass
+class _Upstream:
+    client: httpx.AsyncClient
+    loop: asyncio.AbstractEventLoop
+    stats: dict[str, int] = field(
+        default_factory=lambda: {"requests": 0, "in_flight": 0, "peak_in_flight": 0, "errors": 0}
+    )
+
+
+_upstreams: dict[str, _Upstream] = {}
+
+
+def _make_client(timeout: float) -> _Upstream:
+    client = httpx.AsyncClient(
+        timeout=timeout,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_S,
+        ),
+        http2=HTTP2_ENABLED and _H2_AVAILABLE,
+    )
+    return _Upstream(client=client, loop=asyncio.get_running_loop())
+
+
+def get_client(name: str, *, timeout: float) -> httpx.AsyncClient:
+    """
+    Application-lifetime keep-alive client for one upstream.
+    Created on first use inside the running loop; a new loop (e.g. a second
+    asyncio.run in a worker) gets a fresh client since pools are loop-bound.
+    """
+    return _get_upstream(name, timeout).client
+
+
+def _close_sockets(client: httpx.AsyncClient) -> int:
+    """Last resort when the client's loop is gone and aclose() can't run: close pooled sockets directly."""
+    closed = 0
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    for connection in list(getattr(pool, "connections", []) or []):
+        stream = getattr(getattr(connection, "_connection", None), "_network_stream", None)
+        sock = stream.get_extra_info("socket") if stream is not None else None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            closed += 1
+    return closed
+
+
+def _retire(upstream: _Upstream) -> None:
+    """Release the pool of a client bound to another loop before it is replaced."""
+    if upstream.client.is_closed:
+        return
+    old_loop = upstream.loop
+    if old_loop.is_running():
+        # still serving in another thread: close it there
+        asyncio.run_coroutine_threadsafe(upstream.client.aclose(), old_loop)
+        return
+    closed = _close_sockets(upstream.client)
+    if closed:
+        print(f"[http] closed {closed} pooled connection(s) left by a finished event loop")
+
+
+def _get_upstream(name: str, timeout: float) -> _Upstream:
+    upstream = _upstreams.get(name)
+    if upstream is None or upstream.loop is not asyncio.get_running_loop() or upstream.client.is_closed:
+        previous = upstream.stats if upstream is not None else None
+        if upstream is not None:
+            _retire(upstream)
+        upstream = _make_client(timeout)
+        if previous is not None:
+            upstream.stats = previous
+        _upstreams[name] = upstream
+    return upstream
+
+
+async def request(name: str, method: str, url: str, *, timeout: float, **kwargs: Any) -> httpx.Response:
+    """
+    Send through the pooled client for `name`, keeping utilisation counters.
+    `timeout` applies to this call, whatever the client was created with.
+    """
+    upstream = _get_upstream(name, timeout)
+    stats = upstream.stats
+    stats["requests"] += 1
+    stats["in_flight"] += 1
+    stats["peak_in_flight"] = max(stats["peak_in_flight"], stats["in_flight"])
+    try:
+        response = await upstream.client.request(method, url, timeout=timeout, **kwargs)
+    except Exception:
+        stats["errors"] += 1
+        raise
+    finally:
+        stats["in_flight"] -= 1
+    if response.status_code >= 500:
+        stats["errors"] += 1
+    return response
+
+
+async def close_clients() -> None:
+    for name in list(_upstreams):
+        upstream = _upstreams.pop(name)
+        if upstream.loop is asyncio.get_running_loop():
+            await upstream.client.aclose()
+
+
+def _pool_connections(client: httpx.AsyncClient) -> dict[str, int]:
+    # httpx does not expose pool state publicly; read httpcore's pool defensively.
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    connections = list(getattr(pool, "connections", []) or [])
+    idle = sum(1 for c in connections if getattr(c, "is_idle", lambda: False)())
+    return {"connections": len(connections), "idle_connections": idle, "active_connections": len(connections) - idle}
+
+
+def http_client_stats() -> dict[str, Any]:
+    return {
+        "max_connections": HTTP_MAX_CONNECTIONS,
+        "max_keepalive": HTTP_MAX_KEEPALIVE,
+        "http2": HTTP2_ENABLED and _H2_AVAILABLE,
+        "upstreams": {
+            name: {**upstream.stats, **_pool_connections(upstream.client)}
+            for name, upstream in _upstreams.items()
+        },
+    }
@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import heapq
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Iterable
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.db.models.location import Location
+from app.services.geo import haversine_km
+
+# How often (seconds) the index re-checks the locations table for out-of-process writes.
+LOCATION_INDEX_REFRESH_SECONDS = float(os.getenv("LOCATION_INDEX_REFRESH_SECONDS", "300"))
+# Inserted rows are scanned linearly until this many accumulate, then the trees are rebuilt.
+LOCATION_INDEX_PENDING_LIMIT = int(os.getenv("LOCATION_INDEX_PENDING_LIMIT", "64"))
+
+
+@dataclass(frozen=True)
+class LocationPoint:
+    """Read-only snapshot of a `locations` row (same attribute names as the ORM model)."""
+    id: int
+    name: str
+    type: str
+    lat: float
+    lon: float
+
+
+def _unit_vectors(lat, lon) -> np.ndarray:
+    lat, lon = np.radians(lat), np.radians(lon)
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+class KDTree:
+    """
+    Static 3-d tree over unit vectors. Chord length grows monotonically with
+    great-circle distance, so Euclidean nearest neighbours are geodesic ones.
+    """
+
+    def __init__(self, points: list[LocationPoint]):
+        self.points = points
+        self.xyz = _unit_vectors(
+            np.array([p.lat for p in points], dtype=np.float64),
+            np.array([p.lon for p in points], dtype=np.float64),
+        ).reshape(-1, 3)
+        n = len(points)
+        self.split_dim = [0] * n
+        self.left = [-1] * n
+        self.right = [-1] * n
+        self.root = self._build(np.arange(n)) if n else -1
+        self._xyz = self.xyz.tolist()
+
+    def _build(self, idx: np.ndarray) -> int:
+        if idx.size == 0:
+            return -1
+        spread = self.xyz[idx].max(axis=0) - self.xyz[idx].min(axis=0)
+        dim = int(np.argmax(spread))
+        idx = idx[np.argsort(self.xyz[idx, dim], kind="stable")]
+        mid = idx.size // 2
+        node = int(idx[mid])
+        self.split_dim[node] = dim
+        self.left[node] = self._build(idx[:mid])
+        self.right[node] = self._build(idx[mid + 1:])
+        return node
+
+    def nearest(self, xyz: list[float], k: int) -> list[tuple[float, int]]:
+        """k nearest as (squared chord, point index), closest first."""
+        best: list[tuple[float, int]] = []  # max-heap via negated distance
+        stack = [(self.root, 0.0)]  # (node, lower bound on squared distance to its subtree)
+        while stack:
+            node, bound = stack.pop()
+            if node < 0 or (len(best) == k and bound >= -best[0][0]):
+                continue
+            p = self._xyz[node]
+            d2 = (p[0] - xyz[0]) ** 2 + (p[1] - xyz[1]) ** 2 + (p[2] - xyz[2]) ** 2
+            if len(best) < k:
+                heapq.heappush(best, (-d2, node))
+            elif d2 < -best[0][0]:
+                heapq.heapreplace(best, (-d2, node))
+
+            dim = self.split_dim[node]
+            diff = xyz[dim] - p[dim]
+            near, far = (self.left[node], self.right[node]) if diff < 0 else (self.right[node], self.left[node])
+            # LIFO: the near side is explored first, the far side is pruned when popped.
+            stack.append((far, max(bound, diff * diff)))
+            stack.append((near, bound))
+        return sorted((-d, i) for d, i in best)
+
+
+class LocationIndex:
+    def __init__(self, points: list[LocationPoint], fingerprint: tuple):
+        self.fingerprint = fingerprint
+        self.built_at = time.time()
+        self.by_id = {p.id: p for p in points}
+        by_type: dict[str, list[LocationPoint]] = {}
+        for p in points:
+            by_type.setdefault(p.type, []).append(p)
+        self.trees = {loc_type: KDTree(items) for loc_type, items in by_type.items()}
+        self.pending: list[LocationPoint] = []
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+    def add(self, point: LocationPoint) -> None:
+        self.by_id[point.id] = point
+        self.pending.append(point)
+
+    def nearest(
+        self,
+        lat: float,
+        lon: float,
+        k: int = 1,
+        types: Iterable[str] | None = None,
+    ) -> list[tuple[LocationPoint, float]]:
+        """k nearest locations (optionally restricted to `types`) with geodesic km, closest first."""
+        wanted = set(types) if types else None
+        xyz = _unit_vectors(lat, lon).tolist()
+        candidates: list[tuple[float, LocationPoint]] = []
+        for loc_type, tree in self.trees.items():
+            if wanted is not None and loc_type not in wanted:
+                continue
+            candidates.extend((d2, tree.points[i]) for d2, i in tree.nearest(xyz, k))
+        for p in self.pending:
+            if wanted is None or p.type in wanted:
+                q = _unit_vectors(p.lat, p.lon)
+                candidates.append((float(((q - xyz) ** 2).sum()), p))
+        candidates.sort(key=lambda c: c[0])
+        return [(p, float(haversine_km(lat, lon, p.lat, p.lon))) for _, p in candidates[:k]]
+
+
+_lock = threading.Lock()
+_index: LocationIndex | None = None
+_last_check = 0.0
+_stats: dict[str, Any] = {"rebuilds": 0, "last_rebuild_ms": None, "queries": 0, "inserts": 0}
+
+
+def _fingerprint(db: Session) -> tuple:
+    row = db.execute(select(func.count(Location.id), func.coalesce(func.max(Location.id), 0))).one()
+    return tuple(int(v) for v in row)
+
+
+def _load_points(db: Session) -> list[LocationPoint]:
+    rows = db.execute(select(Location.id, Location.name, Location.type, Location.lat, Location.lon)).all()
+    return [LocationPoint(int(r.id), r.name, r.type, float(r.lat), float(r.lon)) for r in rows]
+
+
+def _rebuild(points: list[LocationPoint], fingerprint: tuple) -> LocationIndex:
+    global _index
+    started = time.perf_counter()
+    _index = LocationIndex(points, fingerprint)
+    _stats["rebuilds"] += 1
+    _stats["last_rebuild_ms"] = round((time.perf_counter() - started) * 1000.0, 3)
+    return _index
+
+
+def get_location_index(db: Session) -> LocationIndex:
+    """Process-wide index, rebuilt when the locations table moved or too many inserts are pending."""
+    global _last_check
+    index = _index
+    now = time.monotonic()
+    if index is not None and now - _last_check < LOCATION_INDEX_REFRESH_SECONDS:
+        if len(index.pending) <= LOCATION_INDEX_PENDING_LIMIT:
+            return index
+
+    with _lock:
+        fingerprint = _fingerprint(db)
+        _last_check = time.monotonic()
+        if _index is not None and _index.fingerprint == fingerprint:
+            if len(_index.pending) > LOCATION_INDEX_PENDING_LIMIT:
+                _rebuild(list(_index.by_id.values()), fingerprint)
+            return _index
+        return _rebuild(_load_points(db), fingerprint)
+
+
+def register_location(location: Location) -> None:
+    """Make a freshly committed row visible to snapping without a full reload."""
+    index = _index
+    if index is None:
+        return
+    point = LocationPoint(int(location.id), location.name, location.type, float(location.lat), float(location.lon))
+    with _lock:
+        index.add(point)
+        count, max_id = index.fingerprint
+        index.fingerprint = (count + 1, max(max_id, point.id))
+        _stats["inserts"] += 1
+
+
+def nearest_locations(
+    db: Session,
+    lat: float,
+    lon: float,
+    k: int = 1,
+    types: Iterable[str] | None = None,
+) -> list[tuple[LocationPoint, float]]:
+    _stats["queries"] += 1
+    return get_location_index(db).nearest(lat, lon, k=k, types=types)
+
+
+def location_index_stats() -> dict[str, Any]:
+    index = _index
+    return {
+        **_stats,
+        "loaded": index is not None,
+        "locations": len(index) if index is not None else 0,
+        "pending": len(index.pending) if index is not None else 0,
+        "types": sorted(index.trees) if index is not None else [],
+    }
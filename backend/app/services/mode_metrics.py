@@ -1,3 +1,5 @@
+import numpy as np
+
 from app.services.mode_params import MODE_PARAMS
 
 
@@ -31,3 +33,27 @@ def compute_mode_metrics(distance_km, delay):
         }
 
     return results
+
+
+def compute_mode_metrics_batch(distance_km, delay_prob, expected_delay_min):
+    """
+    compute_mode_metrics over arrays of plans: same formulas, every metric
+    is an ndarray aligned with the inputs.
+    """
+    distance_km = np.asarray(distance_km, dtype=np.float64)
+    delay_prob = np.asarray(delay_prob, dtype=np.float64)
+    expected_delay_min = np.asarray(expected_delay_min, dtype=np.float64)
+
+    results = {}
+
+    for mode, p in MODE_PARAMS.items():
+        time_min = (distance_km / p["speed_kph"]) * 60 + p["transfer_penalty_min"]
+
+        results[mode] = {
+            "time_min": time_min,
+            "delay_penalty_min": delay_prob * time_min + expected_delay_min,
+            "emissions_kg": distance_km * p["emission_kg_per_km"],
+            "cost": distance_km * p["cost_per_km"],
+        }
+
+    return results
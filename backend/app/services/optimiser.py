@@ -77,73 +77,159 @@ def select_best_transport_plan(
     }
 
 
+import os
+import time
+
+import numpy as np
+from sqlalchemy import insert, update
+
 from app.db.models.event import Event
-from app.services.mode_metrics import compute_mode_metrics
+from app.db.models.plan import Plan
+from app.services.mode_metrics import compute_mode_metrics_batch
+
+# Plans re-optimised per bulk UPDATE/INSERT pair (and per transaction when committing).
+OPTIMISE_BATCH_SIZE = int(os.getenv("OPTIMISE_BATCH_SIZE", "500"))
+
+DEFAULT_WEIGHTS = {
+    "time": 0.4,
+    "delay": 0.3,
+    "emissions": 0.2,
+    "cost": 0.1,
+}
 
 
-async def optimise_plan(plan, db):
+async def optimise_plan(plan, db, commit: bool = True):
     """
     Recompute routing & mode selection for a plan
     when a re-routing event is triggered.
+    A one-plan optimise_plans call, so both paths always make the same
+    decision and write the same rows. commit=False leaves the changes pending.
     """
+    return optimise_plans([plan], db, commit=commit)
 
-    # --- NOTE ---
-    #  we DO NOT recompute the full VRP graph here.
-    # We demonstrate orchestration + reuse of existing modules.
 
-    # Example placeholders (replace with real values later)
-    distance_km = plan.total_distance_km or 500
-
-    delay = {
-        "delay_prob": plan.delay_prob or 0.4,
-        "expected_delay_min": plan.expected_delay_min or 20,
+def evaluate_chain_batch(chain, distance_km, delay_prob):
+    """evaluate_chain over arrays of plans; returns the totals without scoring them."""
+    total = {
+        "time_min": np.zeros_like(distance_km),
+        "delay_penalty_min": np.zeros_like(distance_km),
+        "emissions_kg": np.zeros_like(distance_km),
+        "cost": np.zeros_like(distance_km),
     }
 
-    weights = {
-        "time": 0.4,
-        "delay": 0.3,
-        "emissions": 0.2,
-        "cost": 0.1,
-    }
+    segment_distance = distance_km / len(chain)
 
-    # STEP-3 reuse: compute mode metrics
-    mode_metrics = compute_mode_metrics(distance_km, delay)
+    for mode in chain:
+        p = MODE_PARAMS[mode]
 
-    # STEP-3 reuse: select best mode / chain
-    result = select_best_transport_plan(
-        distance_km=distance_km,
-        delay=delay,
-        weights=weights,
-        mode_metrics=mode_metrics,
-    )
+        time_min = (segment_distance / p["speed_kph"]) * 60
+        time_min += p["transfer_penalty_min"]
 
-    # Persist the reroute decision inside the existing JSON payload.
-    details = dict(plan.details_json or {})
-    details["selected_mode"] = result["selected_mode"]
-    details["is_multimodal"] = result["is_multimodal"]
-    details["optimised_metrics"] = result["metrics"]
-    plan.details_json = details
-    plan.status = "rerouted"
-    plan.was_rerouted = True
-    plan.reroute_reason = "EVENT_TRIGGERED"
-
-    # Emit reroute event for frontend
-    db.add(
-        Event(
-            plan_id=plan.id,
-            type="reroute",
-            source="reroute-engine",
-            severity="moderate",
-            payload_json={
-                "plan_id": plan.id,
-                "reason": plan.reroute_reason,
-                "new_mode": result["selected_mode"],
-                "is_multimodal": result["is_multimodal"],
-                "metrics": result["metrics"],
-            },
+        total["time_min"] += time_min
+        total["delay_penalty_min"] += delay_prob * time_min
+        total["emissions_kg"] += segment_distance * p["emission_kg_per_km"]
+        total["cost"] += segment_distance * p["cost_per_km"]
+
+    return total
+
+
+def select_best_transport_plans(distance_km, delay_prob, expected_delay_min, weights):
+    """
+    select_best_transport_plan for many plans at once. Every single mode and
+    chain is scored as one column of an (n, candidates) matrix; argmin keeps
+    the first of equal scores, so ties resolve exactly as in the scalar path
+    (modes in MODE_PARAMS order, then the single mode over chains).
+    """
+    distance_km = np.asarray(distance_km, dtype=np.float64)
+    delay_prob = np.asarray(delay_prob, dtype=np.float64)
+
+    candidates = [
+        (mode, False, metrics)
+        for mode, metrics in compute_mode_metrics_batch(distance_km, delay_prob, expected_delay_min).items()
+    ]
+    candidates += [(chain, True, evaluate_chain_batch(chain, distance_km, delay_prob)) for chain in MULTIMODAL_CHAINS]
+
+    scores = np.column_stack([score_route(metrics, weights) for _, _, metrics in candidates])
+    best = np.argmin(scores, axis=1)
+
+    results = []
+    for i, c in enumerate(best.tolist()):
+        selected, is_multimodal, metrics = candidates[c]
+        results.append({
+            "selected_mode": selected,
+            "is_multimodal": is_multimodal,
+            "metrics": {k: float(v[i]) for k, v in metrics.items()},
+        })
+    return results
+
+
+def optimise_plans(plans, db, commit: bool = True, weights=None):
+    """
+    Re-optimise many plans: mode selection is vectorized over all
+    plans, and each batch of OPTIMISE_BATCH_SIZE plans is written with one
+    bulk UPDATE of plans plus one bulk INSERT of reroute events.
+    commit=True commits once per batch; commit=False leaves everything
+    pending for the caller. Returns counts and throughput.
+    """
+    weights = weights or DEFAULT_WEIGHTS
+    started = time.perf_counter()
+    batches = 0
+
+    for offset in range(0, len(plans), OPTIMISE_BATCH_SIZE):
+        batch = plans[offset:offset + OPTIMISE_BATCH_SIZE]
+        # --- NOTE ---
+        #  we DO NOT recompute the full VRP graph here; placeholder values
+        #  stand in for plans that have no distance/delay yet.
+        results = select_best_transport_plans(
+            distance_km=[p.total_distance_km or 500 for p in batch],
+            delay_prob=[p.delay_prob or 0.4 for p in batch],
+            expected_delay_min=[p.expected_delay_min or 20 for p in batch],
+            weights=weights,
         )
-    )
-    db.commit()
+
+        plan_rows = []
+        event_rows = []
+        for plan, result in zip(batch, results):
+            details = dict(plan.details_json or {})
+            details["selected_mode"] = result["selected_mode"]
+            details["is_multimodal"] = result["is_multimodal"]
+            details["optimised_metrics"] = result["metrics"]
+            plan_rows.append({
+                "id": plan.id,
+                "details_json": details,
+                "status": "rerouted",
+                "was_rerouted": True,
+                "reroute_reason": "EVENT_TRIGGERED",
+            })
+            event_rows.append({
+                "plan_id": plan.id,
+                "type": "reroute",
+                "source": "reroute-engine",
+                "severity": "moderate",
+                "payload_json": {
+                    "plan_id": plan.id,
+                    "reason": "EVENT_TRIGGERED",
+                    "new_mode": result["selected_mode"],
+                    "is_multimodal": result["is_multimodal"],
+                    "metrics": result["metrics"],
+                },
+            })
+
+        db.execute(update(Plan), plan_rows)
+        db.execute(insert(Event), event_rows)
+        for plan in batch:
+            db.expire(plan)  # reload the new values on next access
+        if commit:
+            db.commit()
+        batches += 1
+
+    elapsed = time.perf_counter() - started
+    return {
+        "plans": len(plans),
+        "batches": batches,
+        "elapsed_ms": round(elapsed * 1000.0, 3),
+        "plans_per_s": round(len(plans) / elapsed, 1) if plans and elapsed > 0 else None,
+    }
 
 
 def compute_improvements(baseline, optimised):
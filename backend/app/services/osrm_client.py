@@ -1,24 +1,106 @@
 from __future__ import annotations
 
+import asyncio
 import os
-import httpx
+from dataclasses import dataclass
+
+import numpy as np
 from pydantic import BaseModel
 
+from app.services import http_clients
+from app.services.geo import haversine_km
+from app.services.mode_params import MODE_PARAMS
+from app.services.ttl_cache import DiskStore, TTLCache
+
 OSRM_URL = os.getenv("OSRM_URL", "http://localhost:5000")
+OSRM_TIMEOUT = float(os.getenv("OSRM_TIMEOUT", "30"))
+
+# Route cache: coordinates are rounded to OSRM_CACHE_PRECISION decimals (5 ≈ 1 m) before keying.
+OSRM_CACHE_SIZE = int(os.getenv("OSRM_CACHE_SIZE", "4096"))
+OSRM_CACHE_TTL_S = float(os.getenv("OSRM_CACHE_TTL_S", "21600"))
+OSRM_CACHE_PRECISION = int(os.getenv("OSRM_CACHE_PRECISION", "5"))
+OSRM_CACHE_PATH = os.getenv("OSRM_CACHE_PATH", "")  # e.g. data/cache/osrm.sqlite to persist across restarts
+
+_route_cache = TTLCache(
+    maxsize=OSRM_CACHE_SIZE,
+    ttl_s=OSRM_CACHE_TTL_S,
+    disk=DiskStore(OSRM_CACHE_PATH, "osrm_routes") if OSRM_CACHE_PATH else None,
+)
+_in_flight: dict[str, asyncio.Future] = {}
+
+# /table: OSRM rejects requests with more than --max-table-size coordinates (default 100),
+# so large matrices are assembled from source x destination blocks that fit under it.
+OSRM_TABLE_MAX_LOCATIONS = int(os.getenv("OSRM_TABLE_MAX_LOCATIONS", "100"))
+OSRM_TABLE_CONCURRENCY = int(os.getenv("OSRM_TABLE_CONCURRENCY", "4"))
+
+_table_stats = {"tables": 0, "requests": 0, "errors": 0, "fallback_cells": 0}
 
 class OSRMCoor(BaseModel):
     lat: float
     lon: float
 
+def _cache_key(coords: list[OSRMCoor], profile: str) -> str:
+    p = OSRM_CACHE_PRECISION
+    return profile + "|" + ";".join(f"{round(c.lon, p)},{round(c.lat, p)}" for c in coords)
+
+async def _cache_get(key: str) -> dict | None:
+    """Memory first; with OSRM_CACHE_PATH the sqlite lookup runs on a worker thread."""
+    if _route_cache.disk is None:
+        return _route_cache.get(key)
+    cached = _route_cache.get_many([key], disk=False).get(key)
+    if cached is None:
+        cached = await asyncio.to_thread(_route_cache.get, key)
+    return cached
+
+async def _cache_set(key: str, data: dict) -> None:
+    if _route_cache.disk is None:
+        _route_cache.set(key, data)
+    else:
+        await asyncio.to_thread(_route_cache.set, key, data)
+
 async def route(coords: list[OSRMCoor], profile: str = "car") -> dict:
     """
     Call OSRM /route when you enable it.
     coords: [OSRMCoor(...), OSRMCoor(...)]
     profile: car|bike|foot (OSRM profiles)
+    Responses are cached by rounded coordinates + profile; concurrent
+    identical requests share one upstream call.
     """
     if len(coords) < 2:
         raise ValueError("At least two coordinates required")
 
+    key = _cache_key(coords, profile)
+    cached = await _cache_get(key)
+    if cached is not None:
+        return cached
+    pending = _in_flight.get(key)
+    if pending is not None and pending.get_loop() is asyncio.get_running_loop():
+        try:
+            return await asyncio.shield(pending)
+        except asyncio.CancelledError:
+            if not pending.cancelled():
+                raise
+            # the owning call was cancelled (e.g. its deadline); fetch on our own
+
+    future = asyncio.get_running_loop().create_future()
+    _in_flight[key] = future
+    try:
+        data = await _fetch_route(coords, profile)
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # mark retrieved when nobody else is waiting
+        raise
+    else:
+        future.set_result(data)
+        await _cache_set(key, data)
+        return data
+    finally:
+        _in_flight.pop(key, None)
+
+async def _fetch_route(coords: list[OSRMCoor], profile: str) -> dict:
     path = ";".join([f"{c.lon},{c.lat}" for c in coords])
     url = f"{OSRM_URL}/route/v1/{profile}/{path}"
     params = {
@@ -26,7 +108,116 @@ async def route(coords: list[OSRMCoor], profile: str = "car") -> dict:
         "geometries": "polyline",
         "annotations": "distance,duration",
     }
-    async with httpx.AsyncClient(timeout=30) as client:
-        r = await client.get(url, params=params)
-        r.raise_for_status()
-        return r.json()
+    r = await http_clients.request("osrm", "GET", url, timeout=OSRM_TIMEOUT, params=params)
+    r.raise_for_status()
+    return r.json()
+
+@dataclass
+class TableResult:
+    """Full many-to-many matrices; row i is sources[i], column j is destinations[j]."""
+    durations_s: np.ndarray
+    distances_m: np.ndarray
+    source: str  # "osrm" | "heuristic" | "mixed"
+
+    def time_matrix_min(self) -> list[list[int]]:
+        """Integer minutes, the shape `vrp.solve_vrptw` expects."""
+        return np.rint(self.durations_s / 60.0).astype(np.int64).tolist()
+
+
+def haversine_table(
+    sources: list[OSRMCoor],
+    destinations: list[OSRMCoor],
+    speed_kph: float = MODE_PARAMS["road"]["speed_kph"],
+) -> TableResult:
+    """Straight-line matrices at a constant road speed, used when OSRM is unavailable."""
+    src = np.array([(c.lat, c.lon) for c in sources], dtype=np.float64).reshape(-1, 2)
+    dst = np.array([(c.lat, c.lon) for c in destinations], dtype=np.float64).reshape(-1, 2)
+    km = np.asarray(haversine_km(src[:, None, 0], src[:, None, 1], dst[None, :, 0], dst[None, :, 1]))
+    km = km.reshape(len(sources), len(destinations))
+    return TableResult(durations_s=km / speed_kph * 3600.0, distances_m=km * 1000.0, source="heuristic")
+
+
+async def table(
+    sources: list[OSRMCoor],
+    destinations: list[OSRMCoor] | None = None,
+    profile: str = "car",
+) -> TableResult:
+    """
+    Duration (s) and distance (m) matrices from OSRM /table.
+    destinations defaults to sources (square matrix for the VRP). Location sets
+    larger than OSRM_TABLE_MAX_LOCATIONS are split into blocks fetched
+    concurrently. Blocks that fail, and cells OSRM reports as unreachable, are
+    filled from the haversine matrix.
+    """
+    square = destinations is None or destinations is sources
+    destinations = sources if destinations is None else destinations
+    _table_stats["tables"] += 1
+    fallback = haversine_table(sources, destinations)
+    if not sources or not destinations:
+        return fallback
+
+    durations = np.full(fallback.durations_s.shape, np.nan)
+    distances = np.full(fallback.distances_m.shape, np.nan)
+    # a square matrix that fits in one request is sent without duplicating coordinates
+    block = len(sources) if square and len(sources) <= OSRM_TABLE_MAX_LOCATIONS else max(1, OSRM_TABLE_MAX_LOCATIONS // 2)
+    semaphore = asyncio.Semaphore(OSRM_TABLE_CONCURRENCY)
+
+    async def fetch_block(si: int, di: int) -> None:
+        src, dst = sources[si:si + block], destinations[di:di + block]
+        async with semaphore:
+            try:
+                dur, dist = await _fetch_table(src, None if square and si == di else dst, profile)
+            except Exception as e:
+                _table_stats["errors"] += 1
+                print(f"[osrm] table block ({si},{di}) failed, using haversine: {e}")
+                return
+        durations[si:si + len(src), di:di + len(dst)] = dur
+        distances[si:si + len(src), di:di + len(dst)] = dist
+
+    await asyncio.gather(*(
+        fetch_block(si, di)
+        for si in range(0, len(sources), block)
+        for di in range(0, len(destinations), block)
+    ))
+
+    missing = np.isnan(durations) | np.isnan(distances)
+    n_missing = int(missing.sum())
+    _table_stats["fallback_cells"] += n_missing
+    if n_missing == missing.size:
+        return fallback
+    durations[missing] = fallback.durations_s[missing]
+    distances[missing] = fallback.distances_m[missing]
+    return TableResult(durations_s=durations, distances_m=distances, source="mixed" if n_missing else "osrm")
+
+
+async def _fetch_table(
+    sources: list[OSRMCoor],
+    destinations: list[OSRMCoor] | None,
+    profile: str,
+) -> tuple[np.ndarray, np.ndarray]:
+    """One /table call; destinations=None means all-to-all over `sources`."""
+    coords = sources + (destinations or [])
+    path = ";".join([f"{c.lon},{c.lat}" for c in coords])
+    url = f"{OSRM_URL}/table/v1/{profile}/{path}"
+    params = {"annotations": "duration,distance"}
+    if destinations is not None:
+        params["sources"] = ";".join(str(i) for i in range(len(sources)))
+        params["destinations"] = ";".join(str(len(sources) + j) for j in range(len(destinations)))
+    _table_stats["requests"] += 1
+    r = await http_clients.request("osrm", "GET", url, timeout=OSRM_TIMEOUT, params=params)
+    r.raise_for_status()
+    data = r.json()
+    if data.get("code") != "Ok":
+        raise RuntimeError(f"OSRM table returned {data.get('code')}: {data.get('message')}")
+    # null entries (unreachable pairs) become NaN and are filled by the caller
+    durations = np.array(data["durations"], dtype=np.float64)
+    distances = np.array(data.get("distances") or np.full(durations.shape, np.nan), dtype=np.float64)
+    return durations, distances
+
+
+def table_stats() -> dict:
+    return {**_table_stats, "max_locations": OSRM_TABLE_MAX_LOCATIONS}
+
+
+def route_cache_stats() -> dict:
+    return {**_route_cache.snapshot_stats(), "persistent": bool(OSRM_CACHE_PATH), "in_flight": len(_in_flight)}
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import os
+import re
+import threading
+import time
+from typing import Any, Iterable
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.db.models.edge import Edge
+from app.db.models.plan import Plan
+from app.db.models.plan_leg import PlanLeg
+from app.db.models.shipment import Shipment
+from app.services.location_index import nearest_locations
+
+# How often (seconds) the index diffs its plan set against the active plans in the DB.
+PLAN_INDEX_REFRESH_SECONDS = float(os.getenv("PLAN_INDEX_REFRESH_SECONDS", "5"))
+# Events carrying only lat/lon affect plans touching a location within this radius.
+PLAN_EVENT_RADIUS_KM = float(os.getenv("PLAN_EVENT_RADIUS_KM", "25"))
+PLAN_EVENT_NEAREST_K = int(os.getenv("PLAN_EVENT_NEAREST_K", "8"))
+
+
+class PlanSpatialIndex:
+    """Location id -> ids of active plans whose legs or shipments touch it."""
+
+    def __init__(self) -> None:
+        self.by_location: dict[int, set[str]] = {}
+        self.plan_locations: dict[str, set[int]] = {}
+        self.edge_endpoints: dict[int, tuple[int, int] | None] = {}
+
+    def __len__(self) -> int:
+        return len(self.plan_locations)
+
+    def add(self, plan_id: str, location_ids: Iterable[int]) -> None:
+        self.discard(plan_id)
+        locations = {int(l) for l in location_ids if l is not None}
+        self.plan_locations[plan_id] = locations
+        for loc in locations:
+            self.by_location.setdefault(loc, set()).add(plan_id)
+
+    def discard(self, plan_id: str) -> None:
+        for loc in self.plan_locations.pop(plan_id, ()):
+            plans = self.by_location.get(loc)
+            if plans is not None:
+                plans.discard(plan_id)
+                if not plans:
+                    del self.by_location[loc]
+
+    def plans_at(self, location_ids: Iterable[int]) -> set[str]:
+        found: set[str] = set()
+        for loc in location_ids:
+            found |= self.by_location.get(int(loc), set())
+        return found
+
+
+_lock = threading.Lock()
+_index = PlanSpatialIndex()
+_last_refresh: float | None = None
+_stats: dict[str, Any] = {"refreshes": 0, "plans_loaded": 0, "plans_dropped": 0, "lookups": 0, "unscoped": 0, "unresolved_edges": 0}
+
+
+def _load_plan_locations(db: Session, plan_ids: list[str]) -> dict[str, set[int]]:
+    """Legs' endpoints plus the origin/destination of every shipment in the plan (two queries)."""
+    locations: dict[str, set[int]] = {pid: set() for pid in plan_ids}
+    plans = db.execute(select(Plan.id, Plan.details_json).where(Plan.id.in_(plan_ids))).all()
+    legs = db.execute(select(PlanLeg.plan_id, PlanLeg.from_id, PlanLeg.to_id).where(PlanLeg.plan_id.in_(plan_ids))).all()
+    for leg in legs:
+        locations[leg.plan_id].update(l for l in (leg.from_id, leg.to_id) if l is not None)
+
+    shipment_plans: dict[str, list[str]] = {}
+    for plan in plans:
+        for shipment_id in (plan.details_json or {}).get("shipment_ids") or []:
+            shipment_plans.setdefault(shipment_id, []).append(plan.id)
+    if shipment_plans:
+        rows = db.execute(
+            select(Shipment.id, Shipment.origin_id, Shipment.destination_id).where(Shipment.id.in_(list(shipment_plans)))
+        ).all()
+        for row in rows:
+            for pid in shipment_plans[row.id]:
+                locations[pid].update((row.origin_id, row.destination_id))
+    return locations
+
+
+def refresh(db: Session, force: bool = False) -> PlanSpatialIndex:
+    """Add newly active plans and drop ones that left the active set."""
+    global _last_refresh
+    now = time.monotonic()
+    if not force and _last_refresh is not None and now - _last_refresh < PLAN_INDEX_REFRESH_SECONDS:
+        return _index
+    with _lock:
+        active = set(db.execute(select(Plan.id).where(Plan.status == "active")).scalars())
+        known = set(_index.plan_locations)
+        for plan_id in known - active:
+            _index.discard(plan_id)
+        new = sorted(active - known)
+        if new:
+            for plan_id, locations in _load_plan_locations(db, new).items():
+                _index.add(plan_id, locations)
+        _last_refresh = time.monotonic()
+        _stats["refreshes"] += 1
+        _stats["plans_loaded"] += len(new)
+        _stats["plans_dropped"] += len(known - active)
+    return _index
+
+
+def discard_plan(plan_id: str) -> None:
+    with _lock:
+        _index.discard(plan_id)
+
+
+def _edge_endpoints(db: Session, edge_id: Any) -> tuple[int, int] | None:
+    # traffic events use "E-123" style ids; the edges table uses integers
+    digits = re.sub(r"\D", "", str(edge_id))
+    if not digits:
+        return None
+    key = int(digits)
+    if key not in _index.edge_endpoints:
+        row = db.execute(select(Edge.from_id, Edge.to_id).where(Edge.id == key)).first()
+        _index.edge_endpoints[key] = (int(row.from_id), int(row.to_id)) if row is not None else None
+    return _index.edge_endpoints[key]
+
+
+def event_locations(db: Session, payload: dict) -> set[int] | None:
+    """
+    Location ids an event payload refers to, or None if it carries no spatial
+    information at all (a global event). An edge id that resolves to no edge
+    falls back to the payload's lat/lon, and otherwise matches no plans.
+    """
+    if payload.get("location_id") is not None:
+        return {int(payload["location_id"])}
+    if payload.get("edge_id") is not None:
+        endpoints = _edge_endpoints(db, payload["edge_id"])
+        if endpoints is not None:
+            return set(endpoints)
+        _stats["unresolved_edges"] += 1
+    if payload.get("lat") is not None and payload.get("lon") is not None:
+        nearby = nearest_locations(db, float(payload["lat"]), float(payload["lon"]), k=PLAN_EVENT_NEAREST_K)
+        return {p.id for p, km in nearby if km <= PLAN_EVENT_RADIUS_KM}
+    if payload.get("edge_id") is not None:
+        return set()
+    return None
+
+
+def plans_for_event(db: Session, payload: dict) -> set[str] | None:
+    """
+    Active plans touching the event's location/edge/coordinates, from one
+    index lookup. None means the event is not spatial and affects every plan.
+    """
+    locations = event_locations(db, payload)
+    _stats["lookups"] += 1
+    if locations is None:
+        _stats["unscoped"] += 1
+        return None
+    return refresh(db).plans_at(locations)
+
+
+def plan_index_stats() -> dict[str, Any]:
+    return {
+        **_stats,
+        "plans": len(_index),
+        "locations": len(_index.by_location),
+    }
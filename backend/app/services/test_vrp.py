@@ -1,31 +1,36 @@
+import asyncio
+
+from app.services.osrm_client import OSRMCoor
 from app.services.vrp import (
     solve_vrptw,
-    build_delay_aware_time_matrix,
+    build_vrp_matrices,
     compute_delay_penalty_used,
 )
 
-# --- Base matrix ---
-base_time_matrix = [
-    [0, 12, 20],
-    [12, 0, 15],
-    [20, 15, 0],
-]
-
-# --- Delay penalties ---
-delay_penalties = [
-    [0, 8, 15],
-    [8, 0, 4],
-    [15, 4, 0],
+# --- Stops (node 0 is the depot) ---
+coords = [
+    OSRMCoor(lat=12.9716, lon=77.5946),
+    OSRMCoor(lat=12.9698, lon=77.7500),
+    OSRMCoor(lat=12.8452, lon=77.6602),
 ]
 
-# Build delay-aware matrix
-final_matrix = build_delay_aware_time_matrix(
-    base_time_matrix,
-    delay_penalties,
-    alpha=1.0,
+# --- Base matrix, delay penalties and delay-aware matrix ---
+# OSRM /table when reachable (haversine otherwise); penalties from the delay model
+matrices = asyncio.run(
+    build_vrp_matrices(
+        coords,
+        avg_weight=500.0,
+        avg_priority=2,
+        weather={"temperature_c": 25.0, "precipitation_mm": 0.0, "wind_speed_mps": 2.0},
+        traffic={"congestion_index": 0.4, "avg_speed_kph": 35.0},
+        alpha=1.0,
+    )
 )
+base_time_matrix = matrices["time_matrix"]
+delay_penalties = matrices["delay_penalties"]
+final_matrix = matrices["delay_aware_time_matrix"]
 
-print("Base matrix:")
+print(f"Base matrix ({matrices['source']}):")
 for r in base_time_matrix:
     print(r)
 
@@ -35,7 +40,7 @@ for r in final_matrix:
 
 # --- Minimal VRP constraints ---
 demands = [0, 1, 1]
-time_windows = [(0, 100)] * 3
+time_windows = [(0, 24 * 60)] * 3
 vehicle_capacities = [2]
 num_vehicles = 1
 
@@ -1,10 +1,11 @@
 # backend/app/services/traffic_client.py
 from __future__ import annotations
 
-import math
 from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Optional
+from typing import List, Optional, Sequence, Union
+
+import numpy as np
 
 @dataclass
 class TrafficSnapshot:
@@ -24,73 +25,174 @@ def _weekday(ts: Optional[datetime] = None) -> int:
     ts = ts or datetime.now(timezone.utc)
     return ts.weekday()  # Monday=0..Sunday=6
 
-def _peak_curve(minutes: int) -> float:
+def _peak_curve(minutes):
     """
     Produce morning & evening peaks using a smooth sinusoid blend.
-    Returns 0..1
+    Returns 0..1 (elementwise for arrays of minutes)
     - Morning peak around ~9:00
     - Evening peak around ~18:00
     """
     # Map minutes to radians for two peaks/day
-    x = (minutes / (24 * 60)) * 2 * math.pi
+    x = (np.asarray(minutes, dtype=np.float64) / (24 * 60)) * 2 * np.pi
     # two-period sine -> peaks near morning/evening
-    val = (math.sin(2 * x - 0.5) + math.sin(2 * x + 1.0)) / 2.0
+    val = (np.sin(2 * x - 0.5) + np.sin(2 * x + 1.0)) / 2.0
     # normalize to 0..1
     return (val + 1) / 2
 
-def _weekday_modifier(weekday: int) -> float:
-    """Slightly higher congestion Mon–Fri, lower on weekends."""
-    if weekday < 5:   # Mon-Fri
-        return 1.0
-    # Weekend
-    return 0.7
+def _weekday_modifier(weekday):
+    """Slightly higher congestion Mon–Fri (1.0), lower on weekends (0.7)."""
+    return np.where(np.asarray(weekday) < 5, 1.0, 0.7)
 
-def _weather_modifier(rain_mm: float | None) -> float:
-    """Rain increases congestion and reduces speed."""
-    if not rain_mm or rain_mm <= 0:
-        return 1.0
-    # Cap rain effect
-    return min(1.0 + (rain_mm * 0.08), 1.4)
+def _weather_modifier(rain_mm):
+    """Rain increases congestion and reduces speed (capped at 1.4); None/NaN means no rain."""
+    rain = np.nan_to_num(np.asarray(rain_mm if rain_mm is not None else 0.0, dtype=np.float64))
+    return np.where(rain > 0, np.minimum(1.0 + rain * 0.08, 1.4), 1.0)
 
-def get_area_traffic(
-    lat: float,
-    lon: float,
-    ts: Optional[datetime] = None,
-    rain_mm: Optional[float] = None,
+
+@dataclass
+class TrafficBatch:
+    """Columnar traffic estimates for many points (arrays aligned with the inputs)."""
+    lat: np.ndarray
+    lon: np.ndarray
+    ts: List[datetime]
+    congestion_index: np.ndarray
+    avg_speed_kph: np.ndarray
+    source: str = "stub-traffic"
+
+
+def _timestamps(ts: Union[datetime, Sequence[datetime], None], n: int) -> List[datetime]:
+    if ts is None or isinstance(ts, datetime):
+        return [ts or datetime.now(timezone.utc)] * n
+    ts = list(ts)
+    if len(ts) != n:
+        raise ValueError(f"got {len(ts)} timestamps for {n} points")
+    return ts
+
+
+def get_area_traffic_batch(
+    lats: Sequence[float],
+    lons: Sequence[float],
+    ts: Union[datetime, Sequence[datetime], None] = None,
+    rain_mm: Union[float, Sequence[Optional[float]], None] = None,
     freeflow_speed_kph: float = 50.0,
-) -> TrafficSnapshot:
+) -> TrafficBatch:
     """
-    Deterministic area-level traffic estimate.
-    Use this for:
-      - Generating traffic 'events'
-      - Adjusting ETA heuristics until real data is plugged in
+    get_area_traffic for many points in one call. `ts` and `rain_mm` are
+    either shared by every point or given per point.
     """
-    ts = ts or datetime.now(timezone.utc)
-    minutes = _time_of_day_minutes(ts)
-    wk = _weekday(ts)
+    lat = np.asarray(lats, dtype=np.float64)
+    lon = np.asarray(lons, dtype=np.float64)
+    stamps = _timestamps(ts, lat.size)
+    if stamps and all(t is stamps[0] for t in stamps):
+        minutes = np.full(lat.size, _time_of_day_minutes(stamps[0]))
+        wk = np.full(lat.size, _weekday(stamps[0]))
+    else:
+        minutes = np.fromiter((_time_of_day_minutes(t) for t in stamps), dtype=np.int64, count=lat.size)
+        wk = np.fromiter((_weekday(t) for t in stamps), dtype=np.int64, count=lat.size)
+    if rain_mm is not None and not np.isscalar(rain_mm):
+        rain_mm = np.array([np.nan if r is None else r for r in rain_mm], dtype=np.float64)
 
     peak = _peak_curve(minutes)                # 0..1
     weekday_mod = _weekday_modifier(wk)        # ~0.7..1.0
-    weather_mod = _weather_modifier(rain_mm or 0.0)  # 1.0..1.4
+    weather_mod = _weather_modifier(rain_mm)   # 1.0..1.4
 
     # Base congestion from time of day + weekday
     base_cong = peak * 0.75 * weekday_mod      # cap base at 0.75 typically
 
     # Weather pushes congestion up (capped at 1.0)
-    congestion = min(1.0, base_cong * weather_mod)
+    congestion = np.minimum(1.0, base_cong * weather_mod)
 
     # Convert congestion to speed (simple linear map)
     # 0.0 congestion → freeflow, 1.0 congestion → 25% of freeflow
-    speed_kph = max(5.0, freeflow_speed_kph * (0.25 + 0.75 * (1.0 - congestion)))
+    speed_kph = np.maximum(5.0, freeflow_speed_kph * (0.25 + 0.75 * (1.0 - congestion)))
+
+    return TrafficBatch(
+        lat=lat,
+        lon=lon,
+        ts=stamps,
+        congestion_index=np.round(congestion, 3),
+        avg_speed_kph=np.round(speed_kph, 1),
+    )
 
+def get_area_traffic(
+    lat: float,
+    lon: float,
+    ts: Optional[datetime] = None,
+    rain_mm: Optional[float] = None,
+    freeflow_speed_kph: float = 50.0,
+) -> TrafficSnapshot:
+    """
+    Deterministic area-level traffic estimate.
+    Use this for:
+      - Generating traffic 'events'
+      - Adjusting ETA heuristics until real data is plugged in
+    Computed as a batch of one, so it always matches get_area_traffic_batch.
+    """
+    batch = get_area_traffic_batch([lat], [lon], ts=ts, rain_mm=rain_mm, freeflow_speed_kph=freeflow_speed_kph)
     return TrafficSnapshot(
         lat=lat,
         lon=lon,
-        ts=ts,
-        congestion_index=round(congestion, 3),
-        avg_speed_kph=round(speed_kph, 1),
+        ts=batch.ts[0],
+        congestion_index=float(batch.congestion_index[0]),
+        avg_speed_kph=float(batch.avg_speed_kph[0]),
     )
 
+def get_edge_factor_batch(
+    edge_ids: Sequence[str],
+    base_travel_time_min: Union[float, Sequence[float]],
+    lats: Sequence[float],
+    lons: Sequence[float],
+    ts: Union[datetime, Sequence[datetime], None] = None,
+    rain_mm: Union[float, Sequence[Optional[float]], None] = None,
+) -> dict:
+    """
+    get_edge_factor for many edges: columnar arrays instead of one dict per edge
+    (see edge_factor_payloads to turn them into event payloads).
+    """
+    snap = get_area_traffic_batch(lats, lons, ts=ts, rain_mm=rain_mm)
+    # Convert congestion (0..1) to multiplicative factor (1.0.. ~1.6)
+    factor = 1.0 + snap.congestion_index * 0.6
+    delta_min = np.maximum(0.0, (factor - 1.0) * np.asarray(base_travel_time_min, dtype=np.float64))
+    return {
+        "edge_id": list(edge_ids),
+        "factor": np.round(factor, 3),
+        "delta_min": np.round(delta_min, 2),
+        "congestion_index": snap.congestion_index,
+        "avg_speed_kph": snap.avg_speed_kph,
+        "rain_mm": rain_mm,
+        "ts": snap.ts,
+    }
+
+def edge_factor_payloads(batch: dict) -> List[dict]:
+    """Per-edge payload dicts (the get_edge_factor format) from get_edge_factor_batch output."""
+    n = len(batch["edge_id"])
+    rain = batch["rain_mm"]
+    rains = [rain] * n if rain is None or np.isscalar(rain) else list(rain)
+    payloads = []
+    for edge_id, factor, delta_min, congestion, speed, rain_mm, ts in zip(
+        batch["edge_id"],
+        batch["factor"].tolist(),
+        batch["delta_min"].tolist(),
+        batch["congestion_index"].tolist(),
+        batch["avg_speed_kph"].tolist(),
+        rains,
+        batch["ts"],
+    ):
+        note = f"congestion={congestion}, speed~{speed}kph"
+        if rain_mm and rain_mm > 0:
+            note += f", rain={rain_mm}mm"
+        payloads.append({
+            "edge_id": edge_id,
+            "factor": factor,
+            "delta_min": delta_min,
+            "congestion_index": congestion,
+            "avg_speed_kph": speed,
+            "note": note,
+            "ts": ts.isoformat(),
+            "source": "stub-traffic",
+        })
+    return payloads
+
 def get_edge_factor(
     edge_id: str,
     base_travel_time_min: float,
@@ -107,22 +209,5 @@ def get_edge_factor(
     factor = get_edge_factor("E-123", 10.0, 12.97, 77.59)
     # => {'edge_id': 'E-123', 'factor': 1.18, 'delta_min': 1.8, 'note': '...'}
     """
-    snap = get_area_traffic(lat=lat, lon=lon, ts=ts, rain_mm=rain_mm)
-    # Convert congestion (0..1) to multiplicative factor (1.0.. ~1.6)
-    factor = 1.0 + snap.congestion_index * 0.6
-    delta_min = max(0.0, (factor - 1.0) * base_travel_time_min)
-
-    note = f"congestion={snap.congestion_index}, speed~{snap.avg_speed_kph}kph"
-    if rain_mm and rain_mm > 0:
-        note += f", rain={rain_mm}mm"
-
-    return {
-        "edge_id": edge_id,
-        "factor": round(factor, 3),
-        "delta_min": round(delta_min, 2),
-        "congestion_index": snap.congestion_index,
-        "avg_speed_kph": snap.avg_speed_kph,
-        "note": note,
-        "ts": snap.ts.isoformat(),
-        "source": "stub-traffic",
-    }
+    batch = get_edge_factor_batch([edge_id], base_travel_time_min, [lat], [lon], ts=ts, rain_mm=rain_mm)
+    return edge_factor_payloads(batch)[0]
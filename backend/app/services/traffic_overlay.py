@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterable, Mapping
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.db.models.event import Event
+from app.services.graph_cache import CompiledGraph
+
+TRAFFIC_OVERLAY_ENABLED = os.getenv("TRAFFIC_OVERLAY_ENABLED", "1") not in ("0", "false", "False")
+# A factor stops applying this long after the traffic event that set it.
+TRAFFIC_OVERLAY_TTL_S = float(os.getenv("TRAFFIC_OVERLAY_TTL_S", "900"))
+# How often (seconds) a routing query may pull new traffic events into the overlay.
+TRAFFIC_OVERLAY_SYNC_S = float(os.getenv("TRAFFIC_OVERLAY_SYNC_S", "5"))
+# Events read per query; a sync keeps paging until it has caught up.
+TRAFFIC_OVERLAY_SYNC_LIMIT = int(os.getenv("TRAFFIC_OVERLAY_SYNC_LIMIT", "5000"))
+
+
+def edge_key(edge_id: Any) -> int | None:
+    """traffic events use "E-123" style ids; the edges table uses integers."""
+    digits = re.sub(r"\D", "", str(edge_id))
+    return int(digits) if digits else None
+
+
+@dataclass(frozen=True)
+class OverlaySnapshot:
+    """
+    Immutable view of the overlay: sorted Edge.ids with their travel-time
+    multipliers. Pass one to compute_graph_route to repeat a query against
+    exactly the same traffic state.
+    """
+    version: int
+    edge_ids: np.ndarray     # int64, sorted
+    factors: np.ndarray      # float32 multiplier on the edge's base time
+    expires_at: np.ndarray   # epoch seconds
+    taken_at: float = field(default_factory=time.time)
+
+    def __len__(self) -> int:
+        return int(self.edge_ids.size)
+
+    @property
+    def min_factor(self) -> float:
+        return float(self.factors.min()) if self.factors.size else 1.0
+
+    def multipliers(self, graph: CompiledGraph) -> np.ndarray | None:
+        """Per graph edge position multiplier (1.0 where unset), or None if no factor hits the graph."""
+        if not self.edge_ids.size:
+            return None
+        idx = np.searchsorted(self.edge_ids, graph.edge_ids)
+        idx[idx == self.edge_ids.size] = 0
+        hit = self.edge_ids[idx] == graph.edge_ids
+        if not hit.any():
+            return None
+        return np.where(hit, self.factors[idx].astype(np.float64), 1.0)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "version": self.version,
+            "taken_at": self.taken_at,
+            "factors": {int(e): float(f) for e, f in zip(self.edge_ids.tolist(), self.factors.tolist())},
+        }
+
+
+def _empty(version: int) -> OverlaySnapshot:
+    return OverlaySnapshot(
+        version=version,
+        edge_ids=np.empty(0, dtype=np.int64),
+        factors=np.empty(0, dtype=np.float32),
+        expires_at=np.empty(0, dtype=np.float64),
+    )
+
+
+class TrafficOverlay:
+    """
+    Live per-edge travel-time multipliers. Every change builds new arrays, so
+    a snapshot handed out earlier never changes underneath its reader.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._current = _empty(0)
+        self.last_event_id = 0
+        self.last_sync: float | None = None
+        self.stats = {"updates": 0, "factors_applied": 0, "expired": 0, "syncs": 0, "events_read": 0, "rejected": 0}
+
+    def update(self, factors: Mapping[int, tuple[float, float]]) -> int:
+        """Set edge -> (factor, expires_at); later values for the same edge replace earlier ones."""
+        if not factors:
+            return 0
+        ids = np.fromiter(factors.keys(), dtype=np.int64, count=len(factors))
+        values = np.array([f for f, _ in factors.values()], dtype=np.float32)
+        expiry = np.array([e for _, e in factors.values()], dtype=np.float64)
+        with self._lock:
+            current = self._current
+            keep = ~np.isin(current.edge_ids, ids)
+            edge_ids = np.concatenate([current.edge_ids[keep], ids])
+            order = np.argsort(edge_ids, kind="stable")
+            self._current = OverlaySnapshot(
+                version=current.version + 1,
+                edge_ids=edge_ids[order],
+                factors=np.concatenate([current.factors[keep], values])[order],
+                expires_at=np.concatenate([current.expires_at[keep], expiry])[order],
+            )
+            self.stats["updates"] += 1
+            self.stats["factors_applied"] += len(factors)
+        return len(factors)
+
+    def prune(self, now: float | None = None) -> int:
+        now = time.time() if now is None else now
+        with self._lock:
+            current = self._current
+            live = current.expires_at > now
+            dropped = int(current.edge_ids.size - live.sum())
+            if dropped:
+                self._current = OverlaySnapshot(
+                    version=current.version + 1,
+                    edge_ids=current.edge_ids[live],
+                    factors=current.factors[live],
+                    expires_at=current.expires_at[live],
+                )
+                self.stats["expired"] += dropped
+        return dropped
+
+    def snapshot(self) -> OverlaySnapshot:
+        """The current factors with expired ones dropped; the version identifies the content."""
+        self.prune()
+        return self._current
+
+    def apply_events(self, events: Iterable[Event]) -> int:
+        """Take `factor` from traffic events that carry an `edge_id`; expiry counts from the event time."""
+        factors: dict[int, tuple[float, float]] = {}
+        for ev in events:
+            payload = ev.payload_json or {}
+            key = edge_key(payload.get("edge_id")) if payload.get("edge_id") is not None else None
+            if key is None or payload.get("factor") is None:
+                continue
+            try:
+                factor = float(payload["factor"])
+            except (TypeError, ValueError):
+                factor = float("nan")
+            if not np.isfinite(factor) or factor <= 0:
+                # a zero/negative time term would break the shortest-path search
+                self.stats["rejected"] += 1
+                continue
+            ts = ev.ts or datetime.now(timezone.utc)
+            if ts.tzinfo is None:
+                ts = ts.replace(tzinfo=timezone.utc)
+            factors[key] = (factor, ts.timestamp() + TRAFFIC_OVERLAY_TTL_S)
+        return self.update(factors)
+
+    def sync(self, db: Session, force: bool = False) -> OverlaySnapshot:
+        """Read traffic events newer than the last one seen (at most every TRAFFIC_OVERLAY_SYNC_S)."""
+        now = time.monotonic()
+        if not force and self.last_sync is not None and now - self.last_sync < TRAFFIC_OVERLAY_SYNC_S:
+            return self.snapshot()
+        self.last_sync = now
+
+        query = select(Event).where(Event.type == "traffic")
+        if db.get_bind().dialect.name == "postgresql":
+            # area snapshots (one per location per cycle) carry no edge_id; skip them in SQL
+            query = query.where(Event.payload_json.has_key("edge_id"))
+        if self.last_event_id == 0:
+            # first sync: only events recent enough to still apply
+            query = query.where(Event.ts >= datetime.now(timezone.utc) - timedelta(seconds=TRAFFIC_OVERLAY_TTL_S))
+
+        # page until caught up, so a burst of events can't leave factors unread for whole cycles
+        read = 0
+        while True:
+            page = list(db.execute(
+                query.where(Event.id > self.last_event_id).order_by(Event.id).limit(TRAFFIC_OVERLAY_SYNC_LIMIT)
+            ).scalars())
+            if not page:
+                break
+            self.last_event_id = int(page[-1].id)
+            self.apply_events(page)
+            read += len(page)
+            if len(page) < TRAFFIC_OVERLAY_SYNC_LIMIT:
+                break
+        self.stats["syncs"] += 1
+        self.stats["events_read"] += read
+        return self.snapshot()
+
+
+_overlay = TrafficOverlay()
+
+
+def get_overlay() -> TrafficOverlay:
+    return _overlay
+
+
+def snapshot() -> OverlaySnapshot:
+    return _overlay.snapshot()
+
+
+def live_snapshot(db: Session) -> OverlaySnapshot | None:
+    """Synced snapshot for a routing query, or None when the overlay is disabled."""
+    return _overlay.sync(db) if TRAFFIC_OVERLAY_ENABLED else None
+
+
+def traffic_overlay_stats() -> dict[str, Any]:
+    current = _overlay._current
+    return {
+        **_overlay.stats,
+        "enabled": TRAFFIC_OVERLAY_ENABLED,
+        "version": current.version,
+        "edges": len(current),
+        "min_factor": current.min_factor if len(current) else None,
+        "max_factor": float(current.factors.max()) if len(current) else None,
+        "last_event_id": _overlay.last_event_id,
+        "ttl_s": TRAFFIC_OVERLAY_TTL_S,
+    }
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Hashable
+
+
+class DiskStore:
+    """Tiny sqlite-backed key/value store so a cache survives restarts."""
+
+    def __init__(self, path: str | Path, table: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._table = table
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def get(self, key: str) -> tuple[Any, float] | None:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self._table} WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), float(row[1])
+
+    def get_many(self, keys: list[str]) -> dict[str, tuple[Any, float]]:
+        """One SELECT ... IN (...) per chunk of keys (sqlite caps bound parameters)."""
+        found: dict[str, tuple[Any, float]] = {}
+        with self._lock:
+            for offset in range(0, len(keys), 500):
+                chunk = keys[offset:offset + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, value, expires_at FROM {self._table} WHERE key IN ({', '.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for key, value, expires_at in rows:
+                    found[key] = (json.loads(value), float(expires_at))
+        return found
+
+    def set(self, key: str, value: Any, expires_at: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self._table} (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+
+    def set_many(self, items: list[tuple[str, Any, float]]) -> None:
+        """(key, value, expires_at) rows written in one transaction."""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO {self._table} (key, value, expires_at) VALUES (?, ?, ?)",
+                    [(key, json.dumps(value), expires_at) for key, value, expires_at in items],
+                )
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self._table} WHERE key = ?", (key,))
+
+    def purge_expired(self, now: float) -> None:
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self._table} WHERE expires_at <= ?", (now,))
+
+
+class TTLCache:
+    """
+    In-process LRU with per-entry TTL and hit/miss/eviction counters.
+    With a DiskStore, misses fall through to disk and writes go to both
+    (keys must then be strings and values JSON-serialisable).
+    """
+
+    def __init__(self, maxsize: int, ttl_s: float, disk: DiskStore | None = None):
+        self.maxsize = maxsize
+        self.ttl_s = ttl_s
+        self.disk = disk
+        self._data: OrderedDict[Hashable, tuple[Any, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "disk_hits": 0, "evictions": 0, "expirations": 0}
+        if disk is not None:
+            disk.purge_expired(time.time())
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Any | None:
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._data.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return value
+                del self._data[key]
+                self.stats["expirations"] += 1
+
+        if self.disk is not None:
+            stored = self.disk.get(str(key))
+            if stored is not None and stored[1] > now:
+                with self._lock:
+                    self._put(key, stored[0], stored[1])
+                    self.stats["disk_hits"] += 1
+                    self.stats["hits"] += 1
+                return stored[0]
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def get_many(self, keys: list[Hashable], disk: bool = True) -> dict[Hashable, Any]:
+        """
+        The live entries among `keys`: memory first, then one disk query for
+        the rest (disk=False stays in memory, so it is safe on an event loop).
+        Only hits are counted; a caller probing several keys for one value
+        knows better what counts as a miss.
+        """
+        now = time.time()
+        found: dict[Hashable, Any] = {}
+        with self._lock:
+            for key in keys:
+                entry = self._data.get(key)
+                if entry is None:
+                    continue
+                value, expires_at = entry
+                if expires_at > now:
+                    self._data.move_to_end(key)
+                    found[key] = value
+                else:
+                    del self._data[key]
+                    self.stats["expirations"] += 1
+            self.stats["hits"] += len(found)
+
+        rest = [key for key in keys if key not in found]
+        if disk and self.disk is not None and rest:
+            stored = self.disk.get_many([str(key) for key in rest])
+            with self._lock:
+                for key in rest:
+                    entry = stored.get(str(key))
+                    if entry is not None and entry[1] > now:
+                        self._put(key, entry[0], entry[1])
+                        found[key] = entry[0]
+                        self.stats["disk_hits"] += 1
+                        self.stats["hits"] += 1
+        return found
+
+    def set(self, key: Hashable, value: Any, ttl_s: float | None = None) -> None:
+        expires_at = time.time() + (self.ttl_s if ttl_s is None else ttl_s)
+        with self._lock:
+            self._put(key, value, expires_at)
+        if self.disk is not None:
+            self.disk.set(str(key), value, expires_at)
+
+    def set_many(self, items: list[tuple[Hashable, Any, float]]) -> None:
+        """(key, value, ttl_s) entries; the disk copy is written in one transaction."""
+        now = time.time()
+        rows = [(key, value, now + ttl_s) for key, value, ttl_s in items]
+        with self._lock:
+            for key, value, expires_at in rows:
+                self._put(key, value, expires_at)
+        if self.disk is not None and rows:
+            self.disk.set_many([(str(key), value, expires_at) for key, value, expires_at in rows])
+
+    def _put(self, key: Hashable, value: Any, expires_at: float) -> None:
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def snapshot_stats(self) -> dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else None,
+        }
@@ -1,6 +1,58 @@
 from typing import List, Dict, Any
 from ortools.constraint_solver import pywrapcp, routing_enums_pb2
 
+from app.services.delay_penalty_builder import build_delay_penalties
+from app.services.osrm_client import OSRMCoor, TableResult, haversine_table, table as osrm_table
+
+
+async def build_base_matrices(coords: List[OSRMCoor], profile: str = "car") -> Dict[str, Any]:
+    """
+    Travel-time (integer minutes) and distance (km) matrices over `coords`,
+    node i being coords[i], from one OSRM /table pass. Cells OSRM can't
+    provide come from the haversine matrix, as does the whole result if the
+    table call fails outright.
+    """
+    try:
+        result: TableResult = await osrm_table(coords, profile=profile)
+    except Exception as e:
+        print(f"[vrp] OSRM table failed, using haversine matrices: {e}")
+        result = haversine_table(coords, coords)
+
+    return {
+        "time_matrix": result.time_matrix_min(),
+        "dist_km": (result.distances_m / 1000.0).tolist(),
+        "source": result.source,
+    }
+
+
+async def build_vrp_matrices(
+    coords: List[OSRMCoor],
+    avg_weight: float,
+    avg_priority: int,
+    weather: Dict[str, Any],
+    traffic: Dict[str, Any],
+    alpha: float = 1.0,
+    profile: str = "car",
+) -> Dict[str, Any]:
+    """
+    Base matrices plus the delay penalties and delay-aware time matrix that
+    solve_vrptw is run on, for a set of stops (coords[depot] included).
+    """
+    base = await build_base_matrices(coords, profile=profile)
+    penalties = await build_delay_penalties(
+        base["time_matrix"],
+        base["dist_km"],
+        avg_weight,
+        avg_priority,
+        weather,
+        traffic,
+    )
+    return {
+        **base,
+        "delay_penalties": penalties,
+        "delay_aware_time_matrix": build_delay_aware_time_matrix(base["time_matrix"], penalties, alpha=alpha),
+    }
+
 
 def solve_vrptw(
     time_matrix: List[List[int]],
@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import os
+import threading
+import time
+from typing import Any, Sequence
+
+from app.services.ttl_cache import DiskStore, TTLCache
+from app.services.weather_client import WeatherSnapshot, fetch_current_weather_many
+
+# Snapshots are shared per grid cell (0.1° ≈ 11 km) and per time bucket.
+WEATHER_CACHE_CELL_DEG = float(os.getenv("WEATHER_CACHE_CELL_DEG", "0.1"))
+WEATHER_CACHE_BUCKET_S = int(os.getenv("WEATHER_CACHE_BUCKET_S", "900"))
+# Younger than TTL: served as is. Up to TTL + STALE: served, then refreshed in the background.
+WEATHER_CACHE_TTL_S = float(os.getenv("WEATHER_CACHE_TTL_S", "900"))
+WEATHER_CACHE_STALE_S = float(os.getenv("WEATHER_CACHE_STALE_S", "3600"))
+WEATHER_CACHE_SIZE = int(os.getenv("WEATHER_CACHE_SIZE", "20000"))
+# e.g. data/cache/weather.sqlite so the API reads what the ingest worker wrote; empty keeps it in-process.
+WEATHER_CACHE_PATH = os.getenv("WEATHER_CACHE_PATH", "")
+
+_cache: TTLCache | None = None
+_cache_lock = threading.Lock()
+_revalidating: set[str] = set()
+_tasks: set[asyncio.Task] = set()
+_stats: dict[str, Any] = {"fresh_hits": 0, "stale_hits": 0, "misses": 0, "stores": 0, "revalidations": 0, "revalidation_errors": 0}
+
+
+def _get_cache() -> TTLCache:
+    """Built on first use, so importing this module opens no sqlite file."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = TTLCache(
+                maxsize=WEATHER_CACHE_SIZE,
+                ttl_s=WEATHER_CACHE_TTL_S + WEATHER_CACHE_STALE_S,
+                disk=DiskStore(WEATHER_CACHE_PATH, "weather_cells") if WEATHER_CACHE_PATH else None,
+            )
+        return _cache
+
+
+def cell_of(lat: float, lon: float) -> str:
+    size = WEATHER_CACHE_CELL_DEG
+    return f"{math.floor(lat / size)}:{math.floor(lon / size)}"
+
+
+def _key(cell: str, bucket: int) -> str:
+    return f"{cell}@{bucket}"
+
+
+def _entry(snapshot: WeatherSnapshot) -> tuple[str, dict, float]:
+    """Cache key (cell + bucket of the retrieval time), value and remaining TTL."""
+    retrieved = snapshot.retrieved_at.timestamp()
+    bucket = int(retrieved // WEATHER_CACHE_BUCKET_S)
+    age = max(0.0, time.time() - retrieved)
+    value = snapshot.model_dump(mode="json", exclude={"raw"})
+    return _key(cell_of(snapshot.lat, snapshot.lon), bucket), value, WEATHER_CACHE_TTL_S + WEATHER_CACHE_STALE_S - age
+
+
+def put(snapshot: WeatherSnapshot) -> None:
+    put_many([snapshot])
+
+
+def put_many(snapshots: Sequence[WeatherSnapshot | None]) -> None:
+    """Store snapshots in memory and, in one transaction, on disk."""
+    entries = [_entry(s) for s in snapshots if s is not None]
+    _get_cache().set_many(entries)
+    _stats["stores"] += len(entries)
+
+
+def _candidate_keys(cell: str, now: float) -> list[str]:
+    """Keys of every bucket that can still hold a usable snapshot, newest first."""
+    bucket = int(now // WEATHER_CACHE_BUCKET_S)
+    oldest = int((now - WEATHER_CACHE_TTL_S - WEATHER_CACHE_STALE_S) // WEATHER_CACHE_BUCKET_S)
+    return [_key(cell, b) for b in range(bucket, oldest - 1, -1)]
+
+
+def _newest(keys: list[str], found: dict, now: float) -> tuple[int, tuple[WeatherSnapshot, float] | None]:
+    """Position of the newest found key in `keys` (len(keys) if none) and its snapshot with age."""
+    for i, key in enumerate(keys):
+        if key in found:
+            snapshot = WeatherSnapshot(**found[key])
+            return i, (snapshot, now - snapshot.retrieved_at.timestamp())
+    return len(keys), None
+
+
+async def lookup_many(points: Sequence[tuple[float, float]]) -> list[tuple[WeatherSnapshot, float] | None]:
+    """
+    Newest snapshot for each point's cell within TTL + STALE, with its age in
+    seconds. All candidate buckets are checked in memory first. Cells with
+    nothing fresh there (the ingest worker may have written a newer bucket)
+    then go to disk for their newer buckets, in one query on a worker thread.
+    """
+    now = time.time()
+    keys = {cell: _candidate_keys(cell, now) for cell in {cell_of(lat, lon) for lat, lon in points}}
+    cache = _get_cache()
+    in_memory = cache.get_many([k for ks in keys.values() for k in ks], disk=False)
+    newest = {cell: _newest(ks, in_memory, now) for cell, ks in keys.items()}
+
+    probe = [
+        k
+        for cell, (pos, found) in newest.items()
+        if found is None or found[1] > WEATHER_CACHE_TTL_S
+        for k in keys[cell][:pos]
+    ]
+    if probe and cache.disk is not None:
+        on_disk = await asyncio.to_thread(cache.get_many, probe)
+        for cell, (pos, _) in list(newest.items()):
+            disk_pos, found = _newest(keys[cell][:pos], on_disk, now)
+            if found is not None:
+                newest[cell] = (disk_pos, found)
+
+    return [newest[cell_of(lat, lon)][1] for lat, lon in points]
+
+
+async def _revalidate(points: list[tuple[float, float]], cells: list[str]) -> None:
+    try:
+        fetched = await fetch_current_weather_many(points)
+        await asyncio.to_thread(put_many, fetched)
+        _stats["revalidations"] += 1
+    except Exception as e:
+        _stats["revalidation_errors"] += 1
+        print(f"[weather-cache] revalidation of {len(points)} cells failed: {e}")
+    finally:
+        _revalidating.difference_update(cells)
+
+
+async def get_weather_many(points: Sequence[tuple[float, float]]) -> list[WeatherSnapshot | None]:
+    """
+    Cached current weather for many points. Fresh cells are returned directly,
+    stale ones are returned and refreshed in the background, and only cells
+    with nothing usable are fetched upstream (in one batched call).
+    """
+    results: list[WeatherSnapshot | None] = [None] * len(points)
+    missing: list[int] = []
+    stale: dict[str, tuple[float, float]] = {}
+    for i, ((lat, lon), found) in enumerate(zip(points, await lookup_many(points))):
+        if found is None:
+            missing.append(i)
+            _stats["misses"] += 1
+            continue
+        snapshot, age = found
+        results[i] = snapshot.model_copy(update={"lat": lat, "lon": lon})
+        if age <= WEATHER_CACHE_TTL_S:
+            _stats["fresh_hits"] += 1
+        else:
+            _stats["stale_hits"] += 1
+            cell = cell_of(lat, lon)
+            if cell not in _revalidating:
+                stale[cell] = (lat, lon)
+
+    if stale:
+        _revalidating.update(stale)
+        task = asyncio.create_task(_revalidate(list(stale.values()), list(stale)))
+        _tasks.add(task)
+        task.add_done_callback(_tasks.discard)
+
+    if missing:
+        fetched = await fetch_current_weather_many([points[i] for i in missing])
+        await asyncio.to_thread(put_many, fetched)
+        for i, snapshot in zip(missing, fetched):
+            results[i] = snapshot
+    return results
+
+
+def weather_cache_stats() -> dict[str, Any]:
+    return {
+        **_stats,
+        **{f"store_{k}": v for k, v in (_cache.snapshot_stats() if _cache is not None else {}).items()},
+        "cell_deg": WEATHER_CACHE_CELL_DEG,
+        "bucket_s": WEATHER_CACHE_BUCKET_S,
+        "ttl_s": WEATHER_CACHE_TTL_S,
+        "stale_s": WEATHER_CACHE_STALE_S,
+        "revalidating": len(_revalidating),
+        "shared_path": WEATHER_CACHE_PATH or None,
+    }
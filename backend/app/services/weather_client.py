@@ -1,13 +1,17 @@
 # backend/app/services/weather_client.py
 from __future__ import annotations
 
+import asyncio
 import os
 from datetime import datetime, timezone
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 import httpx
+
 from pydantic import BaseModel, Field, ValidationError
 
+from app.services import http_clients
+
 # ---- Config ----
 OPEN_METEO_BASE = os.getenv("OPEN_METEO_BASE", "https://api.open-meteo.com/v1/forecast")
 HTTP_TIMEOUT_S = float(os.getenv("WEATHER_HTTP_TIMEOUT", "10"))
@@ -17,6 +21,10 @@ DEFAULT_CURRENT_VARS = os.getenv(
     "WEATHER_CURRENT_VARS",
     "temperature_2m,precipitation,wind_speed_10m,relative_humidity_2m"
 )
+# Multi-location requests: keep the URL under this length and this many points.
+WEATHER_MAX_URL_LENGTH = int(os.getenv("WEATHER_MAX_URL_LENGTH", "2000"))
+WEATHER_MAX_POINTS_PER_REQUEST = int(os.getenv("WEATHER_MAX_POINTS_PER_REQUEST", "100"))
+WEATHER_BATCH_CONCURRENCY = int(os.getenv("WEATHER_BATCH_CONCURRENCY", "4"))
 
 class WeatherSnapshot(BaseModel):
     """Normalized weather snapshot for a single (lat, lon) at 'retrieved_at'."""
@@ -48,11 +56,13 @@ async def fetch_current_weather(
         "timezone": tz,
     }
 
-    async with httpx.AsyncClient(timeout=HTTP_TIMEOUT_S) as client:
-        r = await client.get(OPEN_METEO_BASE, params=params)
-        r.raise_for_status()
-        data = r.json()
+    r = await http_clients.request("open-meteo", "GET", OPEN_METEO_BASE, timeout=HTTP_TIMEOUT_S, params=params)
+    r.raise_for_status()
+    return _snapshot_from(r.json(), lat, lon)
 
+
+def _snapshot_from(data: Dict[str, Any], lat: float, lon: float) -> WeatherSnapshot:
+    """Normalise one location's Open-Meteo response object."""
     # Try new "current" object first
     current = data.get("current")
     if isinstance(current, dict):
@@ -90,6 +100,98 @@ async def fetch_current_weather(
     return snap
 
 
+def pack_points(
+    points: Sequence[Tuple[float, float]],
+    current_vars: str = DEFAULT_CURRENT_VARS,
+    tz: str = "UTC",
+) -> List[List[int]]:
+    """
+    Group point indices into as few Open-Meteo requests as WEATHER_MAX_URL_LENGTH
+    and WEATHER_MAX_POINTS_PER_REQUEST allow (greedy, in input order).
+    """
+    base = len(str(httpx.URL(OPEN_METEO_BASE, params={
+        "latitude": "", "longitude": "", "current": current_vars, "timezone": tz,
+    })))
+    separator = len("%2C") * 2  # one encoded comma in each coordinate list
+    groups: List[List[int]] = []
+    group: List[int] = []
+    length = base
+    for i, (lat, lon) in enumerate(points):
+        added = len(f"{lat:.6f}") + len(f"{lon:.6f}") + (separator if group else 0)
+        if group and (length + added > WEATHER_MAX_URL_LENGTH or len(group) >= WEATHER_MAX_POINTS_PER_REQUEST):
+            groups.append(group)
+            group, length = [], base
+            added -= separator
+        group.append(i)
+        length += added
+    if group:
+        groups.append(group)
+    return groups
+
+
+async def fetch_group(
+    points: Sequence[Tuple[float, float]],
+    current_vars: str = DEFAULT_CURRENT_VARS,
+    tz: str = "UTC",
+) -> List[WeatherSnapshot]:
+    """
+    One multi-location request for points already packed by pack_points;
+    raises if the request fails.
+    """
+    params = {
+        "latitude": ",".join(f"{lat:.6f}" for lat, _ in points),
+        "longitude": ",".join(f"{lon:.6f}" for _, lon in points),
+        "current": current_vars,
+        "timezone": tz,
+    }
+    r = await http_clients.request("open-meteo", "GET", OPEN_METEO_BASE, timeout=HTTP_TIMEOUT_S, params=params)
+    r.raise_for_status()
+    data = r.json()
+    # one location comes back as an object, several as a list in request order
+    items = data if isinstance(data, list) else [data]
+    if len(items) != len(points):
+        raise ValueError(f"open-meteo returned {len(items)} locations for {len(points)} requested")
+    return [_snapshot_from(item, lat, lon) for item, (lat, lon) in zip(items, points)]
+
+
+async def fetch_current_weather_many(
+    points: Sequence[Tuple[float, float]],
+    current_vars: str = DEFAULT_CURRENT_VARS,
+    tz: str = "UTC",
+) -> List[Optional[WeatherSnapshot]]:
+    """
+    Current weather for many (lat, lon) points using Open-Meteo's comma-separated
+    coordinate lists: duplicates are requested once and the rest packed by
+    pack_points, with up to WEATHER_BATCH_CONCURRENCY requests in flight.
+    Results are aligned with `points`; a failed request yields None for its points.
+    """
+    unique: Dict[Tuple[str, str], int] = {}
+    slots: List[int] = []
+    coords: List[Tuple[float, float]] = []
+    for lat, lon in points:
+        key = (f"{lat:.6f}", f"{lon:.6f}")
+        if key not in unique:
+            unique[key] = len(coords)
+            coords.append((float(lat), float(lon)))
+        slots.append(unique[key])
+
+    snapshots: List[Optional[WeatherSnapshot]] = [None] * len(coords)
+    semaphore = asyncio.Semaphore(max(1, WEATHER_BATCH_CONCURRENCY))
+
+    async def fetch(group: List[int]) -> None:
+        async with semaphore:
+            try:
+                found = await fetch_group([coords[i] for i in group], current_vars, tz)
+            except Exception as e:
+                print(f"[weather] batch of {len(group)} points failed: {e}")
+                return
+        for i, snap in zip(group, found):
+            snapshots[i] = snap
+
+    await asyncio.gather(*(fetch(group) for group in pack_points(coords, current_vars, tz)))
+    return [snapshots[i] for i in slots]
+
+
 def _get_float(d: Dict[str, Any], keys: list[str]) -> Optional[float]:
     for k in keys:
         v = d.get(k)
@@ -11,8 +11,8 @@ from sqlalchemy.orm import Session
 
 from app.db.session import SessionLocal
 from app.db.models.location import Location
-from app.db.models.event import Event
-from app.services.traffic_client import get_area_traffic, get_edge_factor
+from app.services.event_bulk import event_row, insert_events
+from app.services.traffic_client import edge_factor_payloads, get_area_traffic_batch, get_edge_factor_batch
 
 # Which locations to probe for area traffic (you can narrow to 'depot' or 'customer')
 DEFAULT_LOCATION_TYPES = os.getenv("TRAFFIC_LOCATION_TYPES", "depot,customer").split(",")
@@ -36,65 +36,62 @@ def _get_target_locations(db: Session, types: Iterable[str]) -> List[Location]:
     return list(db.execute(q).scalars())
 
 
-def _insert_event(db: Session, *, type_: str, source: str, payload: dict, severity: str = "low"):
-    ev = Event(
-        plan_id=None,
-        type=type_,
-        source=source,
-        severity=severity,
-        payload_json=payload,
-        ts=datetime.now(timezone.utc),
-    )
-    db.add(ev)
+def _insert_event(events: List[dict], *, type_: str, source: str, payload: dict, severity: str = "low"):
+    events.append(event_row(type_, payload, source=source, severity=severity))
 
 
 async def _ingest_once(db: Session) -> int:
     """Generate traffic events from stub client. Returns inserted count."""
     rows = _get_target_locations(db, DEFAULT_LOCATION_TYPES)
-    inserted = 0
+    events: List[dict] = []
 
-    # Area-level snapshots (good for UI badges & general awareness)
-    for loc in rows:
-        try:
-            snap = get_area_traffic(lat=float(loc.lat), lon=float(loc.lon))
-        except Exception as e:
-            print(f"[traffic] area snapshot failed for {loc.name} ({loc.id}): {e}")
-            continue
-
-        payload = {
-            "location_id": int(loc.id),
-            "location_name": loc.name,
-            "lat": float(loc.lat),
-            "lon": float(loc.lon),
-            "congestion_index": snap.congestion_index,
-            "avg_speed_kph": snap.avg_speed_kph,
-            "ts": snap.ts.isoformat(),
-        }
-        severity = _classify_congestion(snap.congestion_index)
-        _insert_event(db, type_="traffic", source=snap.source, payload=payload, severity=severity)
-        inserted += 1
+    # Area-level snapshots (good for UI badges & general awareness), all locations in one call
+    try:
+        area = get_area_traffic_batch([float(loc.lat) for loc in rows], [float(loc.lon) for loc in rows])
+    except Exception as e:
+        print(f"[traffic] area snapshots failed for {len(rows)} locations: {e}")
+        area = None
+
+    if area is not None:
+        ts = [t.isoformat() for t in area.ts]
+        for loc, congestion, speed, lat, lon, iso in zip(
+            rows, area.congestion_index.tolist(), area.avg_speed_kph.tolist(), area.lat.tolist(), area.lon.tolist(), ts
+        ):
+            payload = {
+                "location_id": int(loc.id),
+                "location_name": loc.name,
+                "lat": lat,
+                "lon": lon,
+                "congestion_index": congestion,
+                "avg_speed_kph": speed,
+                "ts": iso,
+            }
+            severity = _classify_congestion(congestion)
+            _insert_event(events, type_="traffic", source=area.source, payload=payload, severity=severity)
 
     # Optional: edge-level factors (handy when you later enrich plan legs)
-    if DEMO_EDGES and rows:
+    edge_ids = [e.strip() for e in DEMO_EDGES if e.strip()]
+    if edge_ids and rows:
         anchor = rows[0]  # reference location for demo edge factors
-        for edge_id in [e.strip() for e in DEMO_EDGES if e.strip()]:
-            try:
-                pen = get_edge_factor(
-                    edge_id=edge_id,
-                    base_travel_time_min=10.0,  # demo base time
-                    lat=float(anchor.lat),
-                    lon=float(anchor.lon),
-                )
-            except Exception as e:
-                print(f"[traffic] edge factor failed for {edge_id}: {e}")
-                continue
-            _insert_event(db, type_="traffic", source="stub-traffic", payload=pen, severity="moderate")
-            inserted += 1
-
-    if inserted:
+        try:
+            penalties = edge_factor_payloads(get_edge_factor_batch(
+                edge_ids,
+                base_travel_time_min=10.0,  # demo base time
+                lats=[float(anchor.lat)] * len(edge_ids),
+                lons=[float(anchor.lon)] * len(edge_ids),
+            ))
+        except Exception as e:
+            print(f"[traffic] edge factors failed for {edge_ids}: {e}")
+            penalties = []
+        for pen in penalties:
+            _insert_event(events, type_="traffic", source="stub-traffic", payload=pen, severity="moderate")
+
+    if events:
+        written = insert_events(db, events)
         db.commit()
+        print(f"[traffic] wrote {written['rows']} events in {written['batches']} {written['method']} batches ({written['rows_per_s']} rows/s)")
 
-    return inserted
+    return len(events)
 
 
 def _classify_congestion(ci: float) -> str:
@@ -3,21 +3,47 @@ from __future__ import annotations
 
 import asyncio
 import os
+import time
 from datetime import datetime, timezone
-from typing import Iterable, List
+from typing import Iterable, List, Optional, Tuple
 
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from app.db.session import SessionLocal
 from app.db.models.location import Location  # expects fields: id, name, type, lat, lon
-from app.db.models.event import Event
-from app.services.weather_client import fetch_current_weather
+from app.services.event_bulk import event_row, insert_events
+from app.services import weather_cache
+from app.services.http_clients import close_clients
+from app.services.weather_client import WeatherSnapshot, fetch_group, pack_points
 
 
 DEFAULT_LOCATION_TYPES = os.getenv("WEATHER_LOCATION_TYPES", "depot,port,airport").split(",")
 SLEEP_SECONDS = int(os.getenv("WEATHER_POLL_SECONDS", "300"))  # 5 minutes
 BATCH_LIMIT = int(os.getenv("WEATHER_BATCH_LIMIT", "50"))
+# At most this many (multi-location) Open-Meteo requests in flight per cycle.
+FETCH_CONCURRENCY = int(os.getenv("WEATHER_FETCH_CONCURRENCY", "8"))
+# Request starts per second across the cycle (0 disables the limit).
+FETCH_RATE_PER_S = float(os.getenv("WEATHER_FETCH_RATE_PER_S", "10"))
+
+
+class _RateLimiter:
+    """Spaces request starts at least 1/rate seconds apart."""
+
+    def __init__(self, rate_per_s: float):
+        self.interval = 1.0 / rate_per_s if rate_per_s > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
 
 
 def _get_db() -> Session:
@@ -33,25 +59,51 @@ def _get_target_locations(db: Session, types: Iterable[str]) -> List[Location]:
     return list(db.execute(q).scalars())
 
 
+async def _fetch_all(rows: List[Location]) -> List[Tuple[Location, Optional[WeatherSnapshot]]]:
+    """
+    Fetch every location, packing coordinates into multi-location Open-Meteo
+    requests (see weather_client.pack_points). Requests run concurrently with
+    FETCH_CONCURRENCY in flight and FETCH_RATE_PER_S starts per second; a failed
+    request yields None for its locations and does not affect the rest.
+    """
+    points = [(float(loc.lat), float(loc.lon)) for loc in rows]
+    snapshots: List[Optional[WeatherSnapshot]] = [None] * len(rows)
+    semaphore = asyncio.Semaphore(max(1, FETCH_CONCURRENCY))
+    limiter = _RateLimiter(FETCH_RATE_PER_S)
+
+    async def fetch(group: List[int]) -> None:
+        async with semaphore:
+            await limiter.acquire()
+            try:
+                # already packed: one request per group, no second packing pass
+                found = await fetch_group([points[i] for i in group])
+            except Exception as e:
+                print(f"[weather] request for {len(group)} locations failed: {e}")
+                return
+        for i, snap in zip(group, found):
+            snapshots[i] = snap
+
+    await asyncio.gather(*(fetch(group) for group in pack_points(points)))
+    weather_cache.put_many(snapshots)  # plan creation reads these instead of calling Open-Meteo
+    for loc, snap in zip(rows, snapshots):
+        if snap is None:
+            # log and continue
+            print(f"[weather] fetch failed for {loc.name} ({loc.id})")
+    return list(zip(rows, snapshots))
+
+
 async def _ingest_once(db: Session) -> int:
     """Fetch weather for target locations and insert Event rows. Returns count inserted."""
     rows = _get_target_locations(db, DEFAULT_LOCATION_TYPES)
-    inserted = 0
+    events: List[dict] = []
 
-    for loc in rows:
-        try:
-            snap = await fetch_current_weather(lat=float(loc.lat), lon=float(loc.lon))
-        except Exception as e:
-            # log and continue
-            print(f"[weather] fetch failed for {loc.name} ({loc.id}): {e}")
+    for loc, snap in await _fetch_all(rows):
+        if snap is None:
             continue
 
-        ev = Event(
-            plan_id=None,
-            type="weather",
-            source=snap.source,
-            severity=_classify_weather(snap.temperature_c, snap.precipitation_mm, snap.wind_speed_mps),
-            payload_json={
+        events.append(event_row(
+            "weather",
+            {
                 "location_id": int(loc.id),
                 "location_name": loc.name,
                 "lat": float(loc.lat),
@@ -62,15 +114,19 @@ async def _ingest_once(db: Session) -> int:
                 "relative_humidity_pct": snap.relative_humidity_pct,
                 "retrieved_at": snap.retrieved_at.isoformat(),
             },
+            source=snap.source,
+            severity=_classify_weather(snap.temperature_c, snap.precipitation_mm, snap.wind_speed_mps),
             ts=datetime.now(timezone.utc),
-        )
-        db.add(ev)
-        inserted += 1
+        ))
 
-    if inserted:
+    if events:
+        written = insert_events(db, events)
         db.commit()
+        print(f"[weather] wrote {written['rows']} events in {written['batches']} {written['method']} batches ({written['rows_per_s']} rows/s)")
 
-    return inserted
+    if len(rows) > len(events):
+        print(f"[weather] {len(rows) - len(events)} of {len(rows)} locations failed")
+    return len(events)
 
 
 def _classify_weather(temp_c: float | None, rain_mm: float | None, wind_mps: float | None) -> str:
@@ -85,15 +141,22 @@ def _classify_weather(temp_c: float | None, rain_mm: float | None, wind_mps: flo
 
 
 async def run_loop():
-    """Run forever with sleep between iterations."""
+    """Run forever, starting a cycle every SLEEP_SECONDS (immediately if one overruns)."""
     while True:
+        started = time.monotonic()
         db = _get_db()
         try:
             n = await _ingest_once(db)
-            print(f"[weather] inserted {n} events at {datetime.now(timezone.utc).isoformat()}")
         finally:
             db.close()
-        await asyncio.sleep(SLEEP_SECONDS)
+        elapsed = time.monotonic() - started
+        print(
+            f"[weather] inserted {n} events at {datetime.now(timezone.utc).isoformat()} "
+            f"in {elapsed:.2f}s ({elapsed / SLEEP_SECONDS:.0%} of the {SLEEP_SECONDS}s poll interval)"
+        )
+        if elapsed > SLEEP_SECONDS:
+            print(f"[weather] cycle overran the poll interval by {elapsed - SLEEP_SECONDS:.2f}s")
+        await asyncio.sleep(max(0.0, SLEEP_SECONDS - elapsed))
 
 
 async def run_once():
@@ -103,6 +166,7 @@ async def run_once():
         print(f"[weather] inserted {n} events (one-shot)")
     finally:
         db.close()
+        await close_clients()
 
 
 if __name__ == "__main__":
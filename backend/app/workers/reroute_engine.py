@@ -1,72 +1,204 @@
 import asyncio
+import os
+import time
+
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 
-from app.db.session import SessionLocal
+from app.db.session import SessionLocal, engine
 from app.db.models.event import Event
 from app.db.models.plan import Plan
-from app.services.optimiser import optimise_plan
+from app.db.models.worker_cursor import WorkerCursor
+from app.services import plan_index
+from app.services.event_notify import make_notifier
+from app.services.optimiser import optimise_plans
 
 
 CONGESTION_THRESHOLD = 0.75
 RAIN_THRESHOLD = 10.0
 DELAY_THRESHOLD = 0.6
 
+# Catch-up scan interval when no notification arrives (missed NOTIFY, listener down).
+REROUTE_POLL_SECONDS = float(os.getenv("REROUTE_POLL_SECONDS", "30"))
+REROUTE_BATCH_LIMIT = int(os.getenv("REROUTE_BATCH_LIMIT", "500"))
+REROUTE_CURSOR_NAME = os.getenv("REROUTE_CURSOR_NAME", "reroute_engine")
+# First run without a stored cursor: "latest" skips history, "beginning" replays it.
+REROUTE_START_FROM = os.getenv("REROUTE_START_FROM", "latest")
+# Triggers arriving within this window after the first one share one re-optimisation per plan.
+REROUTE_COALESCE_WINDOW_S = float(os.getenv("REROUTE_COALESCE_WINDOW_S", "2"))
+# No per-plan minimum interval: a rerouted plan leaves the "active" set that
+# flushes draw from, so each plan is re-optimised at most once anyway.
+
 
-async def process_event(event: Event, db: Session):
+def needs_reroute(event: Event) -> bool:
     """
     Decide whether an event requires re-routing.
     """
 
     payload = event.payload_json or {}
-    needs_reroute = False
 
     if event.type == "traffic":
-        if payload.get("congestion_index", 0) > CONGESTION_THRESHOLD:
-            needs_reroute = True
+        return payload.get("congestion_index", 0) > CONGESTION_THRESHOLD
 
     elif event.type == "weather":
-        if payload.get("precipitation_mm", 0) > RAIN_THRESHOLD:
-            needs_reroute = True
+        return payload.get("precipitation_mm", 0) > RAIN_THRESHOLD
 
     elif event.type == "delay":
-        if payload.get("delay_prob", 0) > DELAY_THRESHOLD:
-            needs_reroute = True
-
-    if not needs_reroute:
-        return
+        return payload.get("delay_prob", 0) > DELAY_THRESHOLD
 
-    # Fetch active plans
-    active_plans = (
-        db.query(Plan)
-        .filter(Plan.status == "active")
-        .all()
-    )
+    return False
 
-    for plan in active_plans:
-        await optimise_plan(plan, db)
 
+class RerouteCoalescer:
+    """
+    Collects qualifying events for REROUTE_COALESCE_WINDOW_S after the first
+    one, then re-optimises each affected plan once and commits once.
+    Events with a location, edge or coordinates only affect the plans the
+    spatial plan index maps them to; the rest still fan out to every active plan.
+    """
 
-async def reroute_loop(poll_seconds: int = 30):
+    def __init__(self, window_s: float = REROUTE_COALESCE_WINDOW_S):
+        self.window_s = window_s
+        self.first_trigger_at: float | None = None
+        self.plan_ids: set[str] = set()     # plans named by, or spatially near, a trigger
+        self.all_active = False            # at least one trigger applies to every active plan
+        self.trigger_ids: list[int] = []
+        self.stats = {
+            "events_scanned": 0,
+            "triggers_received": 0,
+            "spatial_triggers": 0,
+            "out_of_scope": 0,
+            "flushes": 0,
+            "optimisations": 0,
+        }
+
+    @property
+    def pending(self) -> bool:
+        return bool(self.trigger_ids)
+
+    def add(self, event: Event, db: Session) -> None:
+        self.stats["events_scanned"] += 1
+        if not needs_reroute(event):
+            return
+        self.stats["triggers_received"] += 1
+        if event.plan_id:
+            affected = {event.plan_id}
+        else:
+            affected = plan_index.plans_for_event(db, event.payload_json or {})
+            if affected is not None:
+                self.stats["spatial_triggers"] += 1
+                if not affected:
+                    self.stats["out_of_scope"] += 1
+                    return
+        self.trigger_ids.append(int(event.id))
+        if affected is None:
+            self.all_active = True
+        else:
+            self.plan_ids |= affected
+        if self.first_trigger_at is None:
+            self.first_trigger_at = time.monotonic()
+
+    def seconds_until_flush(self) -> float:
+        if self.first_trigger_at is None:
+            return float("inf")
+        return max(0.0, self.first_trigger_at + self.window_s - time.monotonic())
+
+    async def flush(self, db: Session) -> int:
+        """Re-optimise the affected plans; the caller commits (with its cursor)."""
+        query = db.query(Plan).filter(Plan.status == "active")
+        if not self.all_active:
+            query = query.filter(Plan.id.in_(self.plan_ids)) if self.plan_ids else None
+        plans = query.all() if query is not None else []
+
+        plan_ids = [p.id for p in plans]  # read before optimise_plans expires the objects
+        batch = optimise_plans(plans, db, commit=False)
+        for plan_id in plan_ids:
+            plan_index.discard_plan(plan_id)  # rerouted plans are no longer active
+        optimised = batch["plans"]
+
+        self.stats["flushes"] += 1
+        self.stats["optimisations"] += optimised
+        print(
+            f"[reroute] flush: {len(self.trigger_ids)} triggers -> {optimised} optimisations"
+            + (f" in {batch['elapsed_ms']} ms ({batch['plans_per_s']} plans/s)" if optimised else "")
+            + f" (total {self.stats['triggers_received']} triggers / {self.stats['optimisations']} optimisations)"
+        )
+
+        self.first_trigger_at = None
+        self.plan_ids = set()
+        self.all_active = False
+        self.trigger_ids = []
+        return optimised
+
+
+def load_cursor(db: Session) -> int:
+    """Last processed event id, creating the cursor row on first run."""
+    WorkerCursor.__table__.create(bind=engine, checkfirst=True)
+    cursor = db.get(WorkerCursor, REROUTE_CURSOR_NAME)
+    if cursor is None:
+        start = 0
+        if REROUTE_START_FROM == "latest":
+            start = int(db.execute(select(func.coalesce(func.max(Event.id), 0))).scalar_one())
+        cursor = WorkerCursor(name=REROUTE_CURSOR_NAME, last_event_id=start)
+        db.add(cursor)
+        db.commit()
+    return int(cursor.last_event_id)
+
+
+def save_cursor(db: Session, last_event_id: int) -> None:
+    cursor = db.get(WorkerCursor, REROUTE_CURSOR_NAME)
+    cursor.last_event_id = last_event_id
+    db.commit()
+
+
+def scan_events(db: Session, last_seen_event_id: int, coalescer: RerouteCoalescer) -> int:
+    """Feed every event after `last_seen_event_id` to the coalescer; returns the new high-water mark."""
+    while True:
+        events = (
+            db.query(Event)
+            .filter(Event.id > last_seen_event_id)
+            .order_by(Event.id.asc())
+            .limit(REROUTE_BATCH_LIMIT)
+            .all()
+        )
+        for event in events:
+            coalescer.add(event, db)
+            last_seen_event_id = max(last_seen_event_id, int(event.id))
+        if len(events) < REROUTE_BATCH_LIMIT:
+            return last_seen_event_id
+
+
+async def reroute_loop(poll_seconds: float = REROUTE_POLL_SECONDS):
     """
-    Periodically scan for new events and trigger re-routing.
+    Re-route on new events. Inserts wake the loop immediately (Postgres
+    LISTEN/NOTIFY, or the in-process bus); a scan every `poll_seconds` catches
+    anything a notification missed. Triggers are coalesced per window and the
+    cursor is saved in the same commit as the resulting reroutes, so a restart
+    neither replays handled events nor skips unhandled ones.
     """
+    notifier = make_notifier()
+    await notifier.start()
+    coalescer = RerouteCoalescer()
     db = SessionLocal()
-    last_seen_event_id = 0
     try:
+        saved_event_id = last_seen_event_id = load_cursor(db)
+        print(f"[reroute] starting after event {last_seen_event_id} ({notifier.name} notifications)")
         while True:
-            events = (
-                db.query(Event)
-                .filter(Event.id > last_seen_event_id)
-                .order_by(Event.id.asc())
-                .all()
-            )
-
-            for event in events:
-                await process_event(event, db)
-                last_seen_event_id = max(last_seen_event_id, int(event.id))
-
-            await asyncio.sleep(poll_seconds)
+            last_seen_event_id = scan_events(db, last_seen_event_id, coalescer)
+
+            if coalescer.pending and coalescer.seconds_until_flush() <= 0:
+                await coalescer.flush(db)
+                save_cursor(db, last_seen_event_id)  # commits the reroutes together with the cursor
+                saved_event_id = last_seen_event_id
+            elif not coalescer.pending and last_seen_event_id != saved_event_id:
+                save_cursor(db, last_seen_event_id)
+                saved_event_id = last_seen_event_id
+            else:
+                db.rollback()  # don't sit idle inside a transaction
+
+            await notifier.wait(timeout=min(poll_seconds, coalescer.seconds_until_flush()))
     finally:
+        await notifier.close()
         db.close()
 
 
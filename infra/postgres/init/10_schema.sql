@@ -108,6 +108,26 @@ CREATE TABLE IF NOT EXISTS events (
   payload_json JSONB
 );
 
+-- Wake LISTENing workers (reroute engine) as soon as an event row lands.
+-- The channel must match EVENT_NOTIFY_CHANNEL (default events_inserted).
+CREATE OR REPLACE FUNCTION notify_event_insert() RETURNS trigger AS $$
+BEGIN
+  PERFORM pg_notify('events_inserted', NEW.id::text);
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_events_notify ON events;
+CREATE TRIGGER trg_events_notify
+AFTER INSERT ON events
+FOR EACH ROW WHEN (NEW.type <> 'reroute') EXECUTE FUNCTION notify_event_insert();
+
+CREATE TABLE IF NOT EXISTS worker_cursors (
+  name          TEXT PRIMARY KEY,
+  last_event_id BIGINT NOT NULL DEFAULT 0,
+  updated_at    TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
 -- TELEMETRY
 CREATE TABLE IF NOT EXISTS telemetry (
   id         BIGSERIAL PRIMARY KEY,
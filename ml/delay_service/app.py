@@ -1,17 +1,102 @@
-from fastapi import FastAPI
+import time
+
+_IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Response
 from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
 import joblib
 import numpy as np
 import os
+import threading
+
+from compiled_forest import CompiledDelayModel, file_sha256, forest_proba1, tree_proba1
 
 app = FastAPI(title="Delay Prediction Service")
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 MODEL_PATH = os.path.join(BASE_DIR, "../../models/delay/model.pkl")
 
-MODEL = joblib.load(MODEL_PATH)
-clf = MODEL["classifier"]
-reg = MODEL["regressor"]
+COMPILED_DIR = os.path.join(BASE_DIR, "../../models/delay/compiled")
+# auto: compiled forests whenever an up-to-date export exists, the pickled sklearn
+# forests otherwise; "compiled"/"sklearn" force one.
+FOREST_ENGINE = os.getenv("ML_FOREST_ENGINE", "auto")
+
+LOAD_STATS = {"compiled_load_ms": None, "sklearn_load_ms": None, "startup_ms": None}
+
+_sklearn_lock = threading.Lock()
+_sklearn_models = None
+
+
+def _sklearn():
+    """
+    The pickled sklearn pair plus the classifier's normalised per-tree leaf
+    probabilities; only loaded when no compiled export can be used.
+    """
+    global _sklearn_models
+    if _sklearn_models is None:
+        with _sklearn_lock:
+            if _sklearn_models is None:
+                started = time.perf_counter()
+                model = joblib.load(MODEL_PATH)
+                _sklearn_models = (model["classifier"], model["regressor"], tree_proba1(model["classifier"]))
+                LOAD_STATS["sklearn_load_ms"] = round((time.perf_counter() - started) * 1000.0, 3)
+    return _sklearn_models
+
+
+compiled = None
+_model_sha256 = None  # model.pkl digest, computed (or read from meta.json) at most once
+if FOREST_ENGINE in ("auto", "compiled") and os.path.exists(os.path.join(COMPILED_DIR, "meta.json")):
+    _started = time.perf_counter()
+    compiled = CompiledDelayModel(COMPILED_DIR)
+    _model_sha256 = compiled.source_digest(MODEL_PATH)
+    if not compiled.matches(MODEL_PATH, _model_sha256):
+        print("[delay-service] compiled forests are stale; re-run pipeline_delay.py --export-only")
+        compiled = None
+    LOAD_STATS["compiled_load_ms"] = round((time.perf_counter() - _started) * 1000.0, 3)
+if FOREST_ENGINE == "compiled" and compiled is None:
+    raise RuntimeError(f"ML_FOREST_ENGINE=compiled but no up-to-date export in {COMPILED_DIR}")
+if compiled is None:
+    _sklearn()
+ENGINE = "compiled" if compiled is not None else "sklearn"
+
+MODEL_VERSION = "delay_v0.1.0"
+
+
+# Changes whenever model.pkl is replaced (MODEL_VERSION is only a label);
+# clients key their prediction caches on it.
+MODEL_ID = f"{MODEL_VERSION}+{(_model_sha256 or file_sha256(MODEL_PATH))[:12]}"
+BATCH_MAX_ROWS = int(os.getenv("ML_BATCH_MAX_ROWS", "100000"))
+
+# Column order the forests were trained on.
+FEATURES = [
+    "distance_km",
+    "baseline_time_min",
+    "weight_kg",
+    "priority",
+    "hour_of_day",
+    "day_of_week",
+    "temperature_c",
+    "precipitation_mm",
+    "wind_speed_mps",
+    "congestion_index",
+    "avg_speed_kph",
+]
+
+# Same constraints as DelayRequest, checked column-wise for batches:
+# feature -> (lower, lower_exclusive, upper, integer)
+_BATCH_BOUNDS = {
+    "distance_km": (0.0, True, None, False),
+    "baseline_time_min": (0.0, True, None, False),
+    "weight_kg": (0.0, True, None, False),
+    "priority": (1, False, 3, True),
+    "hour_of_day": (0, False, 23, True),
+    "day_of_week": (0, False, 6, True),
+    "precipitation_mm": (0.0, False, None, False),
+    "wind_speed_mps": (0.0, False, None, False),
+    "congestion_index": (0.0, False, 1.0, False),
+    "avg_speed_kph": (0.0, True, None, False),
+}
 
 class DelayRequest(BaseModel):
     distance_km: float = Field(..., gt=0)
@@ -29,11 +114,107 @@ class DelayRequest(BaseModel):
 class DelayResponse(BaseModel):
     delay_prob: float
     expected_delay_min: float
-    model_version: str = "delay_v0.1.0"
+    model_version: str = MODEL_VERSION
+    model_id: str = MODEL_ID
+
+class DelayBatchRequest(BaseModel):
+    """
+    Either `rows` (one list per sample, values in FEATURES order) or
+    `columns` (feature name -> list of values, all the same length).
+    """
+    rows: Optional[List[List[float]]] = None
+    columns: Optional[Dict[str, List[float]]] = None
+
+class DelayBatchResponse(BaseModel):
+    count: int
+    delay_prob: List[float]
+    expected_delay_min: List[float]
+    model_version: str = MODEL_VERSION
+    model_id: str = MODEL_ID
+
+
+def _predict_matrix(X: np.ndarray):
+    """
+    Both forests over the whole (n, 11) matrix. The sklearn fallback averages
+    normalised leaf probabilities rather than calling predict_proba, so it
+    gives the same delay_prob as the compiled export for any pickle.
+    """
+    if compiled is not None:
+        prob = compiled.predict_proba1(X)
+        delay_min = np.maximum(0.0, compiled.predict_delay(X))
+    else:
+        clf, reg, clf_values = _sklearn()
+        prob = forest_proba1(clf, X, clf_values)
+        delay_min = np.maximum(0.0, reg.predict(X))
+    return prob, delay_min
+
+
+def _batch_matrix(req: DelayBatchRequest) -> np.ndarray:
+    if (req.rows is None) == (req.columns is None):
+        raise HTTPException(status_code=422, detail="Provide exactly one of 'rows' or 'columns'")
+
+    if req.rows is not None:
+        if any(len(r) != len(FEATURES) for r in req.rows):
+            raise HTTPException(status_code=422, detail=f"Every row needs {len(FEATURES)} values in order: {FEATURES}")
+        X = np.asarray(req.rows, dtype=np.float64).reshape(-1, len(FEATURES))
+    else:
+        missing = [f for f in FEATURES if f not in req.columns]
+        if missing:
+            raise HTTPException(status_code=422, detail=f"Missing columns: {missing}")
+        lengths = {len(req.columns[f]) for f in FEATURES}
+        if len(lengths) > 1:
+            raise HTTPException(status_code=422, detail="All columns must have the same length")
+        X = np.column_stack([np.asarray(req.columns[f], dtype=np.float64) for f in FEATURES])
+
+    if X.shape[0] > BATCH_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {BATCH_MAX_ROWS} rows")
+
+    errors = []
+    if not np.isfinite(X).all():
+        errors.append({"feature": "*", "rows": np.flatnonzero(~np.isfinite(X).all(axis=1))[:20].tolist(), "msg": "non-finite value"})
+    for name, (lower, lower_exclusive, upper, integer) in _BATCH_BOUNDS.items():
+        col = X[:, FEATURES.index(name)]
+        bad = (col <= lower) if lower_exclusive else (col < lower)
+        if upper is not None:
+            bad |= col > upper
+        if integer:
+            bad |= col != np.round(col)
+        if bad.any():
+            errors.append({"feature": name, "rows": np.flatnonzero(bad)[:20].tolist()})
+    if errors:
+        raise HTTPException(status_code=422, detail={"msg": "Feature values out of range", "errors": errors})
+    return X
+
+
+def _memory_mb() -> Dict[str, Optional[float]]:
+    """RSS of this worker, split into pages shared with other processes and private ones (Linux)."""
+    fields = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                name, _, rest = line.partition(":")
+                if rest.strip().endswith("kB"):
+                    fields[name] = int(rest.split()[0]) / 1024.0
+    except OSError:
+        return {"rss_mb": None, "shared_mb": None, "private_mb": None}
+    shared = fields.get("Shared_Clean", 0.0) + fields.get("Shared_Dirty", 0.0)
+    private = fields.get("Private_Clean", 0.0) + fields.get("Private_Dirty", 0.0)
+    return {"rss_mb": round(fields.get("Rss", 0.0), 1), "shared_mb": round(shared, 1), "private_mb": round(private, 1)}
+
 
 @app.get("/health")
 def health():
-    return {"status": "ok", "model_loaded": True}
+    return {
+        "status": "ok",
+        "model_loaded": True,
+        "model_version": MODEL_VERSION,
+        "model_id": MODEL_ID,
+        "engine": ENGINE,
+        "pid": os.getpid(),
+        "sklearn_loaded": _sklearn_models is not None,
+        **LOAD_STATS,
+        **_memory_mb(),
+    }
 
 @app.post("/ml/predict_delay", response_model=DelayResponse)
 def predict(req: DelayRequest):
@@ -51,10 +232,34 @@ def predict(req: DelayRequest):
         req.avg_speed_kph,
     ]])
 
-    prob = clf.predict_proba(X)[0, 1]
-    delay_min = max(0.0, reg.predict(X)[0])
+    prob, delay_min = _predict_matrix(X)
 
     return DelayResponse(
-        delay_prob=round(float(prob), 3),
-        expected_delay_min=round(float(delay_min), 1),
+        delay_prob=round(float(prob[0]), 3),
+        expected_delay_min=round(float(delay_min[0]), 1),
+    )
+
+@app.post("/ml/predict_delay/batch", response_model=DelayBatchResponse)
+def predict_batch(req: DelayBatchRequest, response: Response):
+    started = time.perf_counter()
+    X = _batch_matrix(req)
+
+    predict_started = time.perf_counter()
+    prob, delay_min = _predict_matrix(X) if len(X) else (np.empty(0), np.empty(0))
+    predict_ms = (time.perf_counter() - predict_started) * 1000.0
+    total_ms = (time.perf_counter() - started) * 1000.0
+
+    response.headers["X-Batch-Size"] = str(len(X))
+    response.headers["X-Batch-Predict-Ms"] = f"{predict_ms:.3f}"
+    response.headers["X-Batch-Total-Ms"] = f"{total_ms:.3f}"
+    response.headers["Server-Timing"] = f"predict;dur={predict_ms:.3f}, total;dur={total_ms:.3f}"
+
+    return DelayBatchResponse(
+        count=len(X),
+        # built-in round() so values match the single-row endpoint exactly
+        delay_prob=[round(v, 3) for v in prob.tolist()],
+        expected_delay_min=[round(v, 1) for v in delay_min.tolist()],
     )
+
+
+LOAD_STATS["startup_ms"] = round((time.perf_counter() - _IMPORT_STARTED) * 1000.0, 3)
@@ -0,0 +1,97 @@
+"""
+Latency of sklearn vs the compiled forests at a few batch sizes, after
+checking that both give the same predictions (exits 1 if they do not).
+The classifier is checked against normalised per-tree leaf values, which
+is what the export holds whatever sklearn's predict_proba makes of the pickle.
+
+    cd ml/delay_service
+    python benchmark_forest.py
+"""
+import time
+
+import joblib
+import numpy as np
+
+from compiled_forest import CompiledDelayModel, forest_proba1, tree_proba1
+
+MODEL_PATH = "../../models/delay/model.pkl"
+COMPILED_DIR = "../../models/delay/compiled"
+BATCH_SIZES = (1, 64, 4096)
+REPEATS = {1: 200, 64: 100, 4096: 20}
+# Compiled and sklearn outputs must agree to within np.allclose(rtol, atol).
+RTOL = 1e-7
+ATOL = 1e-9
+
+
+def random_features(n: int, rng: np.random.Generator) -> np.ndarray:
+    return np.column_stack([
+        rng.uniform(1, 500, n),      # distance_km
+        rng.uniform(5, 600, n),      # baseline_time_min
+        rng.uniform(1, 2000, n),     # weight_kg
+        rng.integers(1, 4, n),       # priority
+        rng.integers(0, 24, n),      # hour_of_day
+        rng.integers(0, 7, n),       # day_of_week
+        rng.uniform(-10, 40, n),     # temperature_c
+        rng.uniform(0, 20, n),       # precipitation_mm
+        rng.uniform(0, 15, n),       # wind_speed_mps
+        rng.uniform(0, 1, n),        # congestion_index
+        rng.uniform(5, 90, n),       # avg_speed_kph
+    ]).astype(np.float64)
+
+
+def timed(fn, X: np.ndarray, repeats: int) -> tuple:
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn(X)
+        samples.append((time.perf_counter() - started) * 1000.0)
+    return np.percentile(samples, 50), np.percentile(samples, 99)
+
+
+def main():
+    model = joblib.load(MODEL_PATH)
+    clf, reg = model["classifier"], model["regressor"]
+    compiled = CompiledDelayModel(COMPILED_DIR)
+    if not compiled.matches(MODEL_PATH):
+        print("warning: compiled export does not match model.pkl")
+
+    clf_values = tree_proba1(clf)
+
+    def sklearn_predict(X):
+        # the service's sklearn fallback (predict_proba can't be trusted with this pickle)
+        return forest_proba1(clf, X, clf_values), reg.predict(X)
+
+    def compiled_predict(X):
+        return compiled.predict_proba1(X), compiled.predict_delay(X)
+
+    rng = np.random.default_rng(42)
+    X = random_features(4096, rng)
+    reg_ref = reg.predict(X)
+    prob_out, reg_out = compiled_predict(X)
+
+    failures = []
+    reg_ok = np.allclose(reg_out, reg_ref, rtol=RTOL, atol=ATOL)
+    print(f"regressor: max |diff| over {len(X)} rows {np.abs(reg_ref - reg_out).max():.3e} -> {'ok' if reg_ok else 'MISMATCH'}")
+    if not reg_ok:
+        failures.append("regressor")
+
+    prob_ref = forest_proba1(clf, X, clf_values)
+    clf_ok = np.allclose(prob_out, prob_ref, rtol=RTOL, atol=ATOL)
+    print(f"classifier: max |diff| over {len(X)} rows {np.abs(prob_ref - prob_out).max():.3e} -> {'ok' if clf_ok else 'MISMATCH'}")
+    if not clf_ok:
+        failures.append("classifier")
+
+    if failures:
+        raise SystemExit(f"compiled forests disagree with sklearn: {', '.join(failures)}")
+
+    print(f"{'batch':>6} {'engine':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for n in BATCH_SIZES:
+        Xb = X[:n]
+        for name, fn in (("sklearn", sklearn_predict), ("compiled", compiled_predict)):
+            fn(Xb)  # warm-up
+            p50, p99 = timed(fn, Xb, REPEATS[n])
+            print(f"{n:>6} {name:>9} {p50:>9.3f} {p99:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
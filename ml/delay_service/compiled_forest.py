@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class CompiledForest:
+    """
+    One forest exported by pipeline_delay.export_compiled, evaluated for a whole
+    batch at once: every (row, tree) pair descends one level per step, and
+    pairs drop out of the working set as soon as they reach a leaf.
+    """
+
+    def __init__(self, feature, threshold, value, roots, max_depth, children, leaf):
+        self.feature = feature
+        self.threshold = threshold
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        # children[2*i] is the left child of node i, children[2*i + 1] the right one
+        self.children = children
+        self.is_leaf = leaf
+
+    @classmethod
+    def load(cls, directory: str, prefix: str, max_depth: int, mmap: bool = True) -> "CompiledForest":
+        """
+        Memory-map the exported arrays (read-only): pages come from the OS page
+        cache, so every worker process on the host shares a single copy.
+        """
+        mode = "r" if mmap else None
+
+        def array(name):
+            # plain ndarray view over the mapping: np.memmap's subclass hooks slow every op
+            return np.asarray(np.load(os.path.join(directory, f"{prefix}_{name}.npy"), mmap_mode=mode))
+
+        if os.path.exists(os.path.join(directory, f"{prefix}_children.npy")):
+            children, leaf = array("children"), array("leaf")
+        else:  # format 1 exports: derive the traversal layout in memory
+            left, right = array("left"), array("right")
+            children = np.stack([left, right], axis=1).ravel()
+            leaf = left == np.arange(left.size)
+        return cls(
+            feature=array("feature"),
+            threshold=array("threshold"),
+            value=array("value"),
+            roots=np.asarray(array("roots")),
+            max_depth=max_depth,
+            children=children,
+            leaf=leaf,
+        )
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        # sklearn compares float32 features against float64 thresholds; do the same
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n, n_features = X.shape
+        n_trees = self.roots.size
+        flat_x = X.ravel()
+
+        # one slot per (row, tree); only slots not yet at a leaf are advanced
+        node = np.tile(self.roots, n)
+        row_base = np.repeat(np.arange(n) * n_features, n_trees)
+        active = np.flatnonzero(~self.is_leaf.take(node))
+        for _ in range(self.max_depth):
+            if active.size == 0:
+                break
+            current = node.take(active)
+            x = flat_x.take(row_base.take(active) + self.feature.take(current))
+            child = self.children.take(2 * current + (x > self.threshold.take(current)))
+            node[active] = child
+            active = active[~self.is_leaf.take(child)]
+        return self.value.take(node).reshape(n, n_trees).mean(axis=1)
+
+
+def tree_proba1(forest) -> list:
+    """
+    Per tree, P(class 1) at every node of a fitted sklearn classifier forest,
+    normalised the way pipeline_delay._flatten_forest does it: pickles from
+    older sklearn hold class counts in tree_.value, which newer versions'
+    predict_proba would average as if they were fractions.
+    """
+    values = []
+    for est in forest.estimators_:
+        value = est.tree_.value[:, 0, :]
+        values.append(value[:, 1] / value.sum(axis=1))
+    return values
+
+
+def forest_proba1(forest, X: np.ndarray, values: list = None) -> np.ndarray:
+    """Mean normalised leaf probability over the trees (values: cached tree_proba1)."""
+    values = tree_proba1(forest) if values is None else values
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    total = np.zeros(X.shape[0], dtype=np.float64)
+    for est, value in zip(forest.estimators_, values):
+        total += value.take(est.apply(X))
+    return total / len(values)
+
+
+class CompiledDelayModel:
+    """Drop-in replacement for the sklearn classifier/regressor pair."""
+
+    def __init__(self, directory: str, mmap: bool = True):
+        with open(os.path.join(directory, "meta.json")) as f:
+            self.meta = json.load(f)
+        forests = self.meta["forests"]
+        self.classifier = CompiledForest.load(directory, "clf", forests["clf"]["max_depth"], mmap)
+        self.regressor = CompiledForest.load(directory, "reg", forests["reg"]["max_depth"], mmap)
+
+    def source_digest(self, model_path: str) -> str:
+        """
+        sha256 of model.pkl. Taken from meta.json without reading the file when
+        its size and mtime still match what the export recorded.
+        """
+        st = os.stat(model_path)
+        if (
+            self.meta.get("source_sha256")
+            and self.meta.get("source_size") == st.st_size
+            and self.meta.get("source_mtime_ns") == st.st_mtime_ns
+        ):
+            return self.meta["source_sha256"]
+        return file_sha256(model_path)
+
+    def matches(self, model_path: str, digest: str = None) -> bool:
+        """True if this export was produced from the given model.pkl (digest: its sha256, if known)."""
+        digest = digest or self.source_digest(model_path)
+        return digest == self.meta.get("source_sha256")
+
+    def predict_proba1(self, X: np.ndarray) -> np.ndarray:
+        return self.classifier.predict(X)
+
+    def predict_delay(self, X: np.ndarray) -> np.ndarray:
+        return self.regressor.predict(X)
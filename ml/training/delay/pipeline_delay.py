@@ -1,6 +1,11 @@
+import argparse
+import hashlib
+import json
 import os
+import time
 
 import joblib
+import numpy as np
 from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
 from sklearn.metrics import roc_auc_score, mean_absolute_error
 from sklearn.model_selection import train_test_split
@@ -9,6 +14,21 @@ from features.build_features import build_features
 
 DATASET = "datasets/sample_trips.csv"
 MODEL_OUT = "../../../models/delay/model.pkl"
+COMPILED_OUT = "../../../models/delay/compiled"
+MODEL_VERSION = "delay_v0.1.0"
+FEATURES = [
+    "distance_km",
+    "baseline_time_min",
+    "weight_kg",
+    "priority",
+    "hour_of_day",
+    "day_of_week",
+    "temperature_c",
+    "precipitation_mm",
+    "wind_speed_mps",
+    "congestion_index",
+    "avg_speed_kph",
+]
 
 os.makedirs(os.path.dirname(MODEL_OUT), exist_ok=True)
 
@@ -47,5 +67,98 @@ def train():
 
     print("Model saved to", MODEL_OUT)
 
+
+def _flatten_forest(forest, proba: bool) -> dict:
+    """
+    Concatenate every tree of a fitted forest into flat node arrays.
+    Child indices are global. Leaves point to themselves (feature 0,
+    threshold +inf), so a fixed number of descent steps is always safe.
+    value holds P(class 1) for classifiers and the mean target for regressors.
+    """
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for est in forest.estimators_:
+        tree = est.tree_
+        n = tree.node_count
+        leaf = tree.children_left == -1
+        own = np.arange(offset, offset + n)
+
+        value = tree.value[:, 0, :]
+        if proba:
+            # older sklearn stored class counts, newer stores fractions; normalise both
+            value = value[:, 1] / value.sum(axis=1)
+        else:
+            value = value[:, 0]
+
+        features.append(np.where(leaf, 0, tree.feature))
+        thresholds.append(np.where(leaf, np.inf, tree.threshold))
+        lefts.append(np.where(leaf, own, tree.children_left + offset))
+        rights.append(np.where(leaf, own, tree.children_right + offset))
+        values.append(value)
+        roots.append(offset)
+        offset += n
+        max_depth = max(max_depth, tree.max_depth)
+
+    left = np.concatenate(lefts).astype(np.int32)
+    right = np.concatenate(rights).astype(np.int32)
+    return {
+        "feature": np.concatenate(features).astype(np.int32),
+        "threshold": np.concatenate(thresholds).astype(np.float64),
+        "left": left,
+        "right": right,
+        # traversal layout: children[2*i] / children[2*i + 1] are node i's left / right child
+        "children": np.stack([left, right], axis=1).ravel(),
+        "leaf": left == np.arange(left.size),
+        "value": np.concatenate(values).astype(np.float64),
+        "roots": np.asarray(roots, dtype=np.int32),
+        "max_depth": max_depth,
+    }
+
+
+def export_compiled(model_path: str = MODEL_OUT, out_dir: str = COMPILED_OUT) -> None:
+    """
+    Write both forests as contiguous .npy node arrays plus meta.json, for the
+    sklearn-free predictor in ml/delay_service/compiled_forest.py. Plain .npy
+    files can be memory-mapped, so service workers share one copy of the pages.
+    meta.json records the sha256 of model.pkl so a stale export is detectable,
+    plus its size and mtime so the service can skip re-hashing an unchanged file.
+    """
+    started = time.perf_counter()
+    model = joblib.load(model_path)
+    with open(model_path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+
+    os.makedirs(out_dir, exist_ok=True)
+    meta = {
+        "format": 2,
+        "model_version": MODEL_VERSION,
+        "features": FEATURES,
+        "source_sha256": digest,
+        "source_size": os.stat(model_path).st_size,
+        "source_mtime_ns": os.stat(model_path).st_mtime_ns,
+        "forests": {},
+    }
+    for prefix, forest, proba in (("clf", model["classifier"], True), ("reg", model["regressor"], False)):
+        arrays = _flatten_forest(forest, proba)
+        meta["forests"][prefix] = {
+            "trees": int(arrays["roots"].size),
+            "nodes": int(arrays["value"].size),
+            "max_depth": int(arrays.pop("max_depth")),
+        }
+        for name, arr in arrays.items():
+            np.save(os.path.join(out_dir, f"{prefix}_{name}.npy"), np.ascontiguousarray(arr))
+
+    with open(os.path.join(out_dir, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+
+    print(f"Compiled forests saved to {out_dir} in {time.perf_counter() - started:.2f}s:", meta["forests"])
+
+
 if __name__ == "__main__":
-    train()
+    parser = argparse.ArgumentParser(description="Train the delay model and export compiled forests")
+    parser.add_argument("--export-only", action="store_true", help="re-export the existing model.pkl without retraining")
+    args = parser.parse_args()
+    if not args.export_only:
+        train()
+    export_compiled()